@@ -11,6 +11,8 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from database import SessionLocal
 from models import Patient, User, StrokeScan
+from onset_time import onset_from_time_since
+from passwords import hash_password
 
 def add_sample_data():
     db = SessionLocal()
@@ -19,9 +21,9 @@ def add_sample_data():
         
         # Add sample users
         users = [
-            User(username="tech1", password="password123", role="Technician"),
-            User(username="physician1", password="password123", role="Physician"),
-            User(username="admin", password="admin123", role="Admin")
+            User(username="tech1", password=hash_password("password123"), role="Technician"),
+            User(username="physician1", password=hash_password("password123"), role="Physician"),
+            User(username="admin", password=hash_password("admin123"), role="Admin")
         ]
         
         for user in users:
@@ -97,6 +99,7 @@ def add_sample_data():
         ]
         
         for patient in patients:
+            patient.onset_at = onset_from_time_since(patient.time_since_onset, datetime.now())
             existing_patient = db.query(Patient).filter(Patient.code == patient.code).first()
             if not existing_patient:
                 db.add(patient)
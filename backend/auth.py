@@ -1,31 +1,16 @@
 from fastapi import APIRouter, Form, Depends, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy.orm import Session
-from database import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import User, Patient
-from typing import Optional
-import uuid
+from session_store import session_store, SESSION_TTL_SECONDS
+from current_user import CurrentUser, require_user, resolve_identity, identity_cache, invalidate_user
+from passwords import hash_password_async, check_password_async
 
 router = APIRouter()
 
-# Simple in-memory session store (in production, use Redis or database)
-active_sessions = {}
-
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# Helper function to get current user from session
-def get_current_user(request: Request) -> Optional[dict]:
-    session_id = request.cookies.get("session_id")
-    if session_id and session_id in active_sessions:
-        return active_sessions[session_id]
-    return None
-
 # Helper: shared HTML message page
 def message_page(title: str, message: str, link_url: str, link_text: str, color: str = "white", title_color: str = "red") -> HTMLResponse:
     return HTMLResponse(content=f"""
@@ -38,28 +23,29 @@ def message_page(title: str, message: str, link_url: str, link_text: str, color:
 
 # 🔐 Patient Registration
 @router.post("/register")
-def register_patient(
+async def register_patient(
     username: str = Form(...),
     password: str = Form(...),
     code: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Username already exists?
-    if db.query(User).filter_by(username=username).first():
-        return message_page("Username already exists", "Please choose a different username.", "/register-page")
+    if (await db.execute(select(User).filter_by(username=username))).scalars().first():
+        return message_page("Username already exists", "Please choose a different username.", "/register-page", "Back to Registration")
 
     # Check if a patient with the code exists
-    patient = db.query(Patient).filter_by(code=code).first()
+    patient = (await db.execute(select(Patient).filter_by(code=code))).scalars().first()
 
-    # Create the user
-    user = User(username=username, password=password, role="Patient")
+    # Create the user; the hash is computed on hash_executor, like logins (see passwords.py)
+    user = User(username=username, password=await hash_password_async(password), role="Patient")
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
     if patient:
         patient.linked_user_id = user.id
-        db.commit()
+        await db.commit()
+        invalidate_user(user.id)
         success_msg = "Your account is now linked to a patient record."
     else:
         success_msg = f"No matching patient code was found now, but your account was created. A technician can link it later using code {code}."
@@ -68,41 +54,46 @@ def register_patient(
 
 # 🔓 Login for all roles
 @router.post("/login")
-def login(
+async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
     role: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter_by(username=username, role=role).first()
+    user = (await db.execute(select(User).filter_by(username=username, role=role))).scalars().first()
 
     if not user:
         return HTMLResponse(content=f"""
             <script>alert("User not found. Please check the username and role."); window.location.href = "/login-page";</script>
         """, status_code=401)
 
-    if user.password != password:
+    # Hashing is slow on purpose; it runs on a thread pool, not the event loop (see passwords.py)
+    valid, new_hash = await check_password_async(password, user.password)
+    if not valid:
         return HTMLResponse(content=f"""
             <script>alert("Invalid password. Please try again."); window.location.href = "/login-page";</script>
         """, status_code=401)
 
-    # Create session
-    session_id = str(uuid.uuid4())
-    active_sessions[session_id] = {
+    if new_hash:
+        # Plaintext row, or hashed with an old cost
+        user.password = new_hash
+        await db.commit()
+
+    # Resolve the user's identity (and linked patient) once; requests reuse it, see current_user.py
+    session_data = {
         "user_id": user.id,
         "username": user.username,
         "role": user.role
     }
+    identity = await db.run_sync(resolve_identity, session_data)
 
-    # Create response with session cookie
     if role == "Patient":
-        patient = db.query(Patient).filter_by(linked_user_id=user.id).first()
-        if not patient:
+        if not identity.patient_code:
             return HTMLResponse(content="""
                 <script>alert("Patient record not found. Please wait for technician upload."); window.location.href = "/login-page";</script>
             """, status_code=404)
-        response = RedirectResponse(url=f"/patient-view?code={patient.code}", status_code=302)
+        response = RedirectResponse(url=f"/patient-view?code={identity.patient_code}", status_code=302)
     elif role == "Technician":
         response = RedirectResponse(url="/technician-dashboard", status_code=302)
     elif role == "Physician":
@@ -110,24 +101,26 @@ def login(
     else:
         return HTMLResponse(content="Unknown role", status_code=400)
 
+    # Create session (see session_store.py for where it is kept)
+    session_id = await run_in_threadpool(session_store.create, session_data)
+    identity_cache.put(identity)
+
     # Set session cookie
-    response.set_cookie(key="session_id", value=session_id, httponly=True, max_age=3600)  # 1 hour
+    response.set_cookie(key="session_id", value=session_id, httponly=True, max_age=SESSION_TTL_SECONDS)
     return response
 
 # 🔍 Get current user information
 @router.get("/current-user")
-def get_current_user_info(request: Request):
-    user_info = get_current_user(request)
-    if not user_info:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    return user_info
+def get_current_user_info(user: CurrentUser = Depends(require_user)):
+    return {"user_id": user.user_id, "username": user.username, "role": user.role,
+            "patient_code": user.patient_code}
 
 # 🚪 Logout
 @router.post("/logout")
 def logout(request: Request):
     session_id = request.cookies.get("session_id")
-    if session_id and session_id in active_sessions:
-        del active_sessions[session_id]
+    if session_id:
+        session_store.delete(session_id)
     
     response = RedirectResponse(url="/login-page", status_code=302)
     response.delete_cookie(key="session_id")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark: dashboard read throughput while scans are being uploaded.
+
+Seeds a throwaway SQLite database, then runs reader threads (dashboard stats and
+detail queries) alongside writer threads (scan inserts and status updates, as the
+upload and send-to-doctor endpoints do) for a fixed duration, once with the
+rollback journal and once with the WAL configuration from database.py.
+
+Usage:
+    python benchmark_concurrency.py [--seconds 10] [--readers 8] [--writers 2] [--patients 2000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from database import Base, create_db_engine
+from models import Patient, StrokeScan
+from stats_service import technician_dashboard_stats, physician_dashboard_stats
+from dashboard_counters import ensure_counters
+
+CONFIGURATIONS = {
+    "rollback journal": {"journal_mode": "DELETE", "synchronous": "FULL", "busy_timeout": 5000,
+                         "mmap_size": 0, "cache_size": -2000},
+    "WAL (default config)": {},
+}
+
+def seed(session_factory, patient_count: int):
+    db = session_factory()
+    now = datetime.now()
+    for i in range(patient_count):
+        patient = Patient(name=f"Bench {i}", age=random.randint(20, 90), gender="Female", code=f"B{i:06d}")
+        db.add(patient)
+        db.flush()
+        for _ in range(3):
+            db.add(StrokeScan(
+                patient_id=patient.id,
+                eligible=random.choice([True, False, None]),
+                status=random.choice(["pending", "saved", "ready_for_review", "reviewed"]),
+                timestamp=now - timedelta(hours=random.randint(0, 24 * 30))
+            ))
+    db.commit()
+    ensure_counters(db)
+    db.close()
+
+def run(name: str, pragmas: dict, args) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="stroke_bench_"), "bench.db")
+    engine = create_db_engine(f"sqlite:///{path}", sqlite_pragmas=pragmas)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    seed(session_factory, args.patients)
+
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        while not stop.is_set():
+            db = session_factory()
+            try:
+                technician_dashboard_stats(db)
+                physician_dashboard_stats(db)
+                db.query(StrokeScan).filter(StrokeScan.status == "ready_for_review").order_by(StrokeScan.id).limit(100).all()
+                bump("reads")
+            except OperationalError:
+                bump("errors")
+            finally:
+                db.close()
+
+    def writer():
+        while not stop.is_set():
+            db = session_factory()
+            try:
+                patient_id = random.randint(1, args.patients)
+                scan = StrokeScan(patient_id=patient_id, eligible=random.choice([True, False]), timestamp=datetime.now())
+                db.add(scan)
+                db.commit()
+                scan.status = "ready_for_review"
+                db.commit()
+                bump("writes")
+            except OperationalError:
+                db.rollback()
+                bump("errors")
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {
+        "name": name,
+        "reads_per_sec": counts["reads"] / args.seconds,
+        "writes_per_sec": counts["writes"] / args.seconds,
+        "errors": counts["errors"],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--patients", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.patients} patients, {args.seconds}s per run")
+    print("=" * 70)
+    print(f"{'configuration':<24}{'reads/s':>12}{'writes/s':>12}{'lock errors':>14}")
+    for name, pragmas in CONFIGURATIONS.items():
+        result = run(name, pragmas, args)
+        print(f"{result['name']:<24}{result['reads_per_sec']:>12.1f}{result['writes_per_sec']:>12.1f}{result['errors']:>14}")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Password hashing benchmark: logins per second per worker process at each cost.
+
+For each PBKDF2 iteration count, verifies a password in a loop for a fixed
+duration, once on a single thread and once on a pool the size of
+PASSWORD_HASH_WORKERS (the login thread pool, see passwords.py). The pool figure
+is what one worker process sustains during a burst of logins; the latency
+column is the time a single login spends hashing.
+
+Usage:
+    python benchmark_passwords.py [--seconds 3] [--workers N] [--iterations 100000 300000 600000 1000000]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from passwords import PASSWORD_HASH_ITERATIONS, PASSWORD_HASH_WORKERS, hash_password, verify_password
+
+PASSWORD = "correct horse battery staple"
+
+def logins_per_second(stored: str, threads: int, seconds: float) -> float:
+    stop = threading.Event()
+    counts = [0] * threads
+
+    def verifier(index):
+        while not stop.is_set():
+            verify_password(PASSWORD, stored)
+            counts[index] += 1
+
+    workers = [threading.Thread(target=verifier, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS)
+    parser.add_argument("--iterations", type=int, nargs="+", default=[100000, 300000, 600000, 1000000])
+    args = parser.parse_args()
+
+    print(f"PBKDF2-HMAC-SHA256, {args.workers} hashing threads, {args.seconds}s per run "
+          f"(configured cost: {PASSWORD_HASH_ITERATIONS} iterations)")
+    print("=" * 70)
+    print(f"{'iterations':>12}{'ms/login':>12}{'logins/s (1 thread)':>22}{f'logins/s ({args.workers} threads)':>24}")
+    for iterations in args.iterations:
+        stored = hash_password(PASSWORD, iterations)
+        single = logins_per_second(stored, 1, args.seconds)
+        pooled = logins_per_second(stored, args.workers, args.seconds)
+        print(f"{iterations:>12}{1000 / single:>12.1f}{single:>22.1f}{pooled:>24.1f}")
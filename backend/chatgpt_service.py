@@ -1,25 +1,26 @@
 import os
-import openai
 from typing import Dict, Any, Optional
 from datetime import datetime
 import json
+from llm_client import LLMClient, llm_client
+from llm_cache import LLMResponseCache, cached_chat
 
 class ChatGPTTreatmentPlanService:
-    def __init__(self):
-        # Initialize OpenAI client
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        if not self.api_key or self.api_key == "your_openai_api_key_here":
-            self.api_key = None
+    def __init__(self, client: Optional[LLMClient] = None, cache: Optional[LLMResponseCache] = None):
+        # Requests go through the shared, pooled client (see llm_client.py);
+        # generated plans are cached by prompt (see llm_cache.py)
+        self.client = client or llm_client
+        self.cache = cache
+        if not self.client.is_configured:
             print("Warning: OPENAI_API_KEY not configured. AI features will be disabled.")
-        else:
-            openai.api_key = self.api_key
     
-    def generate_treatment_plan(self, patient_data: Dict[str, Any], scan_data: Dict[str, Any], 
-                              eligibility_result: str, is_eligible: bool) -> str:
+    async def generate_treatment_plan(self, patient_data: Dict[str, Any], scan_data: Dict[str, Any], 
+                              eligibility_result: str, is_eligible: bool, bypass_cache: bool = False) -> str:
         """
         Generate a comprehensive treatment plan using ChatGPT based on patient data and scan results.
+        The same inputs give the cached plan unless bypass_cache is set.
         """
-        if not self.api_key:
+        if not self.client.is_configured:
             return "AI service is not configured. Please set OPENAI_API_KEY environment variable."
         
         try:
@@ -29,8 +30,8 @@ class ChatGPTTreatmentPlanService:
             else:
                 prompt = self._create_not_eligible_prompt(patient_data, scan_data, eligibility_result)
             
-            # Call OpenAI API
-            response = openai.ChatCompletion.create(
+            # Call OpenAI API (or reuse the answer to the same prompt)
+            response, _ = await cached_chat(
                 model="gpt-3.5-turbo",
                 messages=[
                     {
@@ -43,10 +44,13 @@ class ChatGPTTreatmentPlanService:
                     }
                 ],
                 max_tokens=1500,
-                temperature=0.3  # Lower temperature for more consistent, medical-focused responses
+                temperature=0.3,  # Lower temperature for more consistent, medical-focused responses
+                bypass_cache=bypass_cache,
+                client=self.client,
+                cache=self.cache
             )
             
-            return response.choices[0].message.content.strip()
+            return response.strip()
             
         except Exception as e:
             return f"Error generating treatment plan: {str(e)}"
@@ -125,11 +129,11 @@ class ChatGPTTreatmentPlanService:
         """
         return prompt
     
-    def refine_treatment_plan(self, existing_plan: str, physician_notes: str) -> str:
+    async def refine_treatment_plan(self, existing_plan: str, physician_notes: str) -> str:
         """
         Refine an existing treatment plan based on physician input using ChatGPT.
         """
-        if not self.api_key:
+        if not self.client.is_configured:
             return "AI service is not configured. Please set OPENAI_API_KEY environment variable."
         
         try:
@@ -146,7 +150,7 @@ class ChatGPTTreatmentPlanService:
             Highlight any changes made and provide the updated comprehensive treatment plan.
             """
             
-            response = openai.ChatCompletion.create(
+            response = await self.client.chat(
                 model="gpt-3.5-turbo",
                 messages=[
                     {
@@ -162,7 +166,7 @@ class ChatGPTTreatmentPlanService:
                 temperature=0.3
             )
             
-            return response.choices[0].message.content.strip()
+            return response.strip()
             
         except Exception as e:
             return f"Error refining treatment plan: {str(e)}"
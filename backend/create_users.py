@@ -6,6 +6,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database import SessionLocal
 from models import User, Patient
+from passwords import hash_password
 
 # Create database session
 db = SessionLocal()
@@ -15,7 +16,7 @@ def get_or_create_user(username, password, role):
     if user:
         print(f"User '{username}' already exists.")
         return user
-    user = User(username=username, password=password, role=role)
+    user = User(username=username, password=hash_password(password), role=role)
     db.add(user)
     db.commit()
     db.refresh(user)
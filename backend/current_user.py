@@ -0,0 +1,136 @@
+"""
+The signed-in user, as one FastAPI dependency for every route.
+
+The session (see session_store.py) gives the user id and role. The user's
+linked patient record needs the database, so the resolved identity is cached
+per user for AUTH_CACHE_TTL_SECONDS: a patient opening their dashboard resolves
+it once, not on every request. register_patient (which links a user to a
+patient) invalidates the user's entry; on other workers the change shows once
+the entry expires.
+
+Routes declare who may call them:
+
+    @app.get("/api/...", dependencies=[Depends(require_staff)])
+    @app.get("/api/patients/{patient_code}", dependencies=[Depends(require_patient_access)])
+    def handler(user: CurrentUser = Depends(require_user)): ...
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import select
+
+from database import SessionLocal
+from models import Patient
+from session_store import session_store
+
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+STAFF_ROLES = ("Technician", "Physician")
+
+class CurrentUser(NamedTuple):
+    user_id: int
+    username: str
+    role: str
+    patient_id: Optional[int]  # the linked patient record, for the Patient role
+    patient_code: Optional[str]
+
+class IdentityCache:
+    """Resolved identities per user id, with a TTL and an LRU bound."""
+
+    def __init__(self, ttl_seconds: float = AUTH_CACHE_TTL_SECONDS, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # user id -> (expires, CurrentUser)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[CurrentUser]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, identity: CurrentUser):
+        with self._lock:
+            self._entries[identity.user_id] = (time.monotonic() + self.ttl_seconds, identity)
+            self._entries.move_to_end(identity.user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+identity_cache = IdentityCache()
+
+def invalidate_user(user_id: int):
+    """Call after a user's role or patient link changed."""
+    identity_cache.invalidate(user_id)
+
+def resolve_identity(db, session: dict) -> CurrentUser:
+    """The identity for session data ({user_id, username, role}), with the linked patient."""
+    patient = None
+    if session["role"] == "Patient":
+        patient = db.execute(
+            select(Patient.id, Patient.code).where(Patient.linked_user_id == session["user_id"])
+        ).first()
+    return CurrentUser(
+        user_id=session["user_id"],
+        username=session["username"],
+        role=session["role"],
+        patient_id=patient.id if patient else None,
+        patient_code=patient.code if patient else None
+    )
+
+def get_optional_user(request: Request) -> Optional[CurrentUser]:
+    """The signed-in user, or None. Resolved once per request and cached across requests."""
+    if hasattr(request.state, "current_user"):
+        return request.state.current_user
+
+    identity = None
+    session_id = request.cookies.get("session_id")
+    session = session_store.get(session_id) if session_id else None
+    if session:
+        identity = identity_cache.get(session["user_id"])
+        # The session is authoritative for the role
+        if identity is None or identity.role != session["role"]:
+            with SessionLocal() as db:
+                identity = resolve_identity(db, session)
+            identity_cache.put(identity)
+    request.state.current_user = identity
+    return identity
+
+def require_user(user: Optional[CurrentUser] = Depends(get_optional_user)) -> CurrentUser:
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return user
+
+def require_staff(user: CurrentUser = Depends(require_user)) -> CurrentUser:
+    if user.role not in STAFF_ROLES:
+        raise HTTPException(status_code=403, detail="Not allowed for this role")
+    return user
+
+def can_access_patient(user: CurrentUser, patient_id: Optional[int]) -> bool:
+    """Staff, or the patient whose record id is `patient_id` (for routes keyed by something else, e.g. a scan)."""
+    return user.role in STAFF_ROLES or (user.patient_id is not None and user.patient_id == patient_id)
+
+def require_patient_access(patient_code: str, user: CurrentUser = Depends(require_user)) -> CurrentUser:
+    """Staff, or the patient whose record `patient_code` is."""
+    if user.role in STAFF_ROLES or (user.patient_code is not None and user.patient_code == patient_code):
+        return user
+    raise HTTPException(status_code=403, detail="Not allowed to access this patient")
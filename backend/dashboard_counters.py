@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Incrementally maintained dashboard counters.
+
+Every flush that inserts, updates or deletes a StrokeScan or Patient adjusts the
+rows of the dashboard_counters table inside the same transaction, so the
+dashboards can read their totals without scanning strokescans.
+
+Usage:
+    python dashboard_counters.py rebuild   # recompute all counters from scratch
+    python dashboard_counters.py check     # report counters that disagree with the tables
+"""
+
+import sys
+import os
+from datetime import datetime, date
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import event, func, insert, delete, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, attributes
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import Patient, StrokeScan, DashboardCounter
+
+INITIALIZED = "initialized"
+TOTAL_PATIENTS = "total_patients"
+TOTAL_SCANS = "total_scans"
+ELIGIBLE_SCANS = "eligible_scans"
+NOT_ELIGIBLE_SCANS = "not_eligible_scans"
+
+TRACKED_SCAN_FIELDS = ("status", "eligible", "timestamp")
+
+def status_key(status: Optional[str]) -> str:
+    return f"status:{status or 'pending'}"
+
+def scans_day_key(day: date) -> str:
+    return f"scans_day:{day.isoformat()}"
+
+def reviewed_day_key(day: date) -> str:
+    return f"reviewed_day:{day.isoformat()}"
+
+def scan_counter_keys(status: Optional[str], eligible: Optional[bool], timestamp: Optional[datetime]) -> List[str]:
+    """Counters a single scan contributes to, given its status, eligibility and timestamp."""
+    keys = [TOTAL_SCANS, status_key(status)]
+    if eligible is True:
+        keys.append(ELIGIBLE_SCANS)
+    elif eligible is False:
+        keys.append(NOT_ELIGIBLE_SCANS)
+    if timestamp is not None:
+        keys.append(scans_day_key(timestamp.date()))
+        if status == "reviewed":
+            keys.append(reviewed_day_key(timestamp.date()))
+    return keys
+
+def _previous_value(obj, field: str):
+    history = attributes.get_history(obj, field)
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    # Attribute was never loaded and not modified; the current value is the stored one
+    return getattr(obj, field)
+
+def _current_keys(obj) -> List[str]:
+    return scan_counter_keys(obj.status, obj.eligible, obj.timestamp)
+
+def _previous_keys(obj) -> List[str]:
+    return scan_counter_keys(*(_previous_value(obj, field) for field in TRACKED_SCAN_FIELDS))
+
+def _add(deltas: Dict[str, int], keys: Iterable[str], amount: int):
+    for key in keys:
+        deltas[key] = deltas.get(key, 0) + amount
+
+def _collect_deltas(session: Session) -> Dict[str, int]:
+    deltas: Dict[str, int] = {}
+
+    for obj in session.new:
+        if isinstance(obj, StrokeScan):
+            # The column default ("pending") is applied at insert time
+            _add(deltas, _current_keys(obj), 1)
+        elif isinstance(obj, Patient):
+            _add(deltas, [TOTAL_PATIENTS], 1)
+
+    for obj in session.dirty:
+        if not isinstance(obj, StrokeScan):
+            continue
+        if not any(attributes.get_history(obj, field).has_changes() for field in TRACKED_SCAN_FIELDS):
+            continue
+        _add(deltas, _previous_keys(obj), -1)
+        _add(deltas, _current_keys(obj), 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, StrokeScan):
+            _add(deltas, _previous_keys(obj), -1)
+        elif isinstance(obj, Patient):
+            _add(deltas, [TOTAL_PATIENTS], -1)
+
+    return {key: amount for key, amount in deltas.items() if amount}
+
+# INSERT ... ON CONFLICT DO UPDATE for each supported backend
+_UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+def apply_deltas(connection, deltas: Dict[str, int]):
+    """Add each delta to its counter in one statement, creating counters that have no row yet."""
+    now = datetime.now()
+    table = DashboardCounter.__table__
+    statement = _UPSERTS[connection.dialect.name](table).values([
+        {"name": name, "value": amount, "updated_at": now} for name, amount in sorted(deltas.items())
+    ])
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={"value": table.c.value + statement.excluded.value, "updated_at": statement.excluded.updated_at}
+    ))
+
+@event.listens_for(Session, "after_flush")
+def _update_counters_after_flush(session: Session, flush_context):
+    # Pre-flush new/dirty/deleted collections and attribute history are still
+    # available here, and the statements join the flush's transaction.
+    deltas = _collect_deltas(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+# Load the old value whenever a tracked field is assigned, so the previous
+# counters can be decremented even if the attribute had been expired.
+for _field in TRACKED_SCAN_FIELDS:
+    event.listen(getattr(StrokeScan, _field), "set", lambda target, value, oldvalue, initiator: value,
+                 active_history=True, retval=True)
+
+def read_counters(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    names = list(names)
+    rows = db.query(DashboardCounter.name, DashboardCounter.value).filter(DashboardCounter.name.in_(names)).all()
+    values = {name: 0 for name in names}
+    values.update({name: value for name, value in rows})
+    return values
+
+def counters_initialized(db: Session) -> bool:
+    return db.query(DashboardCounter.name).filter(DashboardCounter.name == INITIALIZED).first() is not None
+
+def compute_counters(db: Session) -> Dict[str, int]:
+    """Recompute every counter from the patients and strokescans tables."""
+    counters: Dict[str, int] = {TOTAL_PATIENTS: db.query(func.count(Patient.id)).scalar() or 0}
+
+    rows = db.query(
+        StrokeScan.status,
+        StrokeScan.eligible,
+        func.date(StrokeScan.timestamp),
+        func.count(StrokeScan.id)
+    ).group_by(StrokeScan.status, StrokeScan.eligible, func.date(StrokeScan.timestamp)).all()
+
+    for status, eligible, day, count in rows:
+        timestamp = datetime.fromisoformat(str(day)) if day is not None else None
+        _add(counters, scan_counter_keys(status, eligible, timestamp), count)
+
+    return counters
+
+def rebuild_counters(db: Session) -> Dict[str, int]:
+    """
+    Replace every counter with a full recount. The counters are locked before the
+    recount, so no concurrent flush can apply deltas in between and be lost.
+    """
+    table = DashboardCounter.__table__
+    if db.get_bind().dialect.name == "postgresql":
+        # Writers (the flush listener) wait for the commit; readers do not
+        db.execute(text(f"LOCK TABLE {table.name} IN EXCLUSIVE MODE"))
+    # On SQLite this first write takes the database write lock until the commit
+    db.execute(delete(table))
+    counters = compute_counters(db)
+    counters[INITIALIZED] = 1
+    now = datetime.now()
+    db.execute(insert(table), [
+        {"name": name, "value": value, "updated_at": now}
+        for name, value in sorted(counters.items())
+    ])
+    db.commit()
+    return counters
+
+def check_counters(db: Session) -> List[str]:
+    """Return a description of every counter that disagrees with a full recount."""
+    expected = compute_counters(db)
+    stored = {name: value for name, value in db.query(DashboardCounter.name, DashboardCounter.value)}
+    stored.pop(INITIALIZED, None)
+
+    mismatches = []
+    for name in sorted(set(expected) | set(stored)):
+        if expected.get(name, 0) != stored.get(name, 0):
+            mismatches.append(f"{name}: stored={stored.get(name, 0)} expected={expected.get(name, 0)}")
+    return mismatches
+
+def ensure_counters(db: Session):
+    """Build the counters on first start-up (or after the table was cleared)."""
+    if not counters_initialized(db):
+        rebuild_counters(db)
+
+if __name__ == "__main__":
+    from database import SessionLocal, Base, engine
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if command == "rebuild":
+            counters = rebuild_counters(db)
+            print(f"Rebuilt {len(counters)} dashboard counters")
+        elif command == "check":
+            mismatches = check_counters(db)
+            if mismatches:
+                print("Dashboard counters are inconsistent:")
+                for mismatch in mismatches:
+                    print(f"  - {mismatch}")
+                sys.exit(1)
+            print("Dashboard counters are consistent")
+        else:
+            print(f"Unknown command: {command}. Use 'rebuild' or 'check'.")
+            sys.exit(2)
+    finally:
+        db.close()
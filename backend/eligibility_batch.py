@@ -0,0 +1,68 @@
+"""
+Vectorized tPA eligibility for many patients at once.
+
+check_tpa_eligibility_batch takes the same criteria as check_tpa_eligibility,
+one NumPy array (or list) per field, and evaluates every rule over all rows in
+a single pass. It returns the eligibility flags and, per row, the index into
+the rule table (eligibility_rules.py) of the first rule that failed (-1 when
+eligible) -- the rule whose reason check_tpa_eligibility would have returned.
+The vectorized conditions are built from the same rule table as the scalar
+evaluator, so the two cannot drift apart.
+"""
+
+from typing import List, Mapping, Optional, Sequence, Set, Tuple
+import numpy as np
+from eligibility_rules import Condition, RuleSet, get_rule_set
+
+COMPARISON_UFUNCS = {
+    ">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal,
+    "==": np.equal, "!=": np.not_equal,
+}
+
+def _condition_mask(condition: Condition, values: np.ndarray) -> np.ndarray:
+    # Same semantics as the compiled scalar rules, NaN included: a comparison
+    # with NaN is False, so NaN fails "outside" but passes ">" and "<"
+    if condition.op == "outside":
+        low, high = condition.value
+        return ~((values >= low) & (values <= high))
+    return COMPARISON_UFUNCS[condition.op](values, condition.value)
+
+def _numeric_fields(rule_set: RuleSet) -> Set[str]:
+    return {
+        condition.field
+        for rule in rule_set.rules for condition in rule.fail_when
+        if condition.op == "outside" or not isinstance(condition.value, str)
+    }
+
+def check_tpa_eligibility_batch(columns: Mapping[str, Sequence], rule_set: Optional[RuleSet] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluate eligibility for every row of `columns` (field name -> equal-length
+    array). Returns (eligible: bool array, first_failing_rule: int array).
+    """
+    rule_set = rule_set or get_rule_set()
+    numeric = _numeric_fields(rule_set)
+    arrays = {}
+    for field in rule_set.fields:
+        values = np.asarray(columns[field])
+        arrays[field] = values.astype(np.float64, copy=False) if field in numeric else values
+    rows = len(arrays[rule_set.fields[0]])
+
+    # One row per rule, True where the rule fails
+    failures = np.zeros((len(rule_set.rules), rows), dtype=bool)
+    for index, rule in enumerate(rule_set.rules):
+        for condition in rule.fail_when:
+            failures[index] |= _condition_mask(condition, arrays[condition.field])
+
+    eligible = ~failures.any(axis=0)
+    first_failing_rule = failures.argmax(axis=0)
+    first_failing_rule[eligible] = -1
+    return eligible, first_failing_rule
+
+def batch_reasons(first_failing_rule: np.ndarray, rule_set: Optional[RuleSet] = None) -> List[str]:
+    """The reason check_tpa_eligibility gives for each row."""
+    rule_set = rule_set or get_rule_set()
+    return [rule_set.eligible_reason if index < 0 else rule_set.rules[index].reason for index in first_failing_rule.tolist()]
+
+def columns_from_records(records: Sequence[Mapping], rule_set: Optional[RuleSet] = None) -> dict:
+    """Turn a list of eligibility dicts (as passed to check_tpa_eligibility) into columns."""
+    return {field: [record[field] for record in records] for field in (rule_set or get_rule_set()).fields}
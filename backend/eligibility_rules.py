@@ -0,0 +1,195 @@
+"""
+Data-driven tPA eligibility rules.
+
+The criteria live in a versioned rule table (eligibility_rules.json, or the file
+named by ELIGIBILITY_RULES_FILE), so protocol changes are an edit to the table
+rather than to code. Each rule fails when any of its conditions holds:
+
+    {"field": "inr", "op": ">", "value": 1.7}              ops: > >= < <= == !=
+    {"field": "heart_rate", "op": "outside", "range": [60, 100]}
+
+At start-up the table is validated and compiled into plain Python functions
+(stopping at the first failing rule, or collecting every failing rule), so
+evaluating a patient costs no more than the hand-written if-chain it replaces.
+Per-rule counters record how often each rule was evaluated and how often it failed.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eligibility_rules.json")
+ELIGIBILITY_RULES_FILE = os.getenv("ELIGIBILITY_RULES_FILE", DEFAULT_RULES_FILE)
+
+COMPARISONS = (">", ">=", "<", "<=", "==", "!=")
+
+class Condition(NamedTuple):
+    field: str
+    op: str  # one of COMPARISONS, or "outside"
+    value: Any  # threshold for comparisons, (low, high) for "outside"
+
+class Rule(NamedTuple):
+    name: str
+    reason: str
+    fail_when: Tuple[Condition, ...]
+
+class EligibilityResult(NamedTuple):
+    eligible: bool
+    reasons: List[str]  # every failing rule's reason, in table order; the eligible reason if none
+    failed_rules: List[str]
+    rules_version: str
+
+def _check_literal(value, rule_name: str):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Rule '{rule_name}': thresholds must be numbers or strings, got {value!r}")
+    return value
+
+def _parse_condition(spec: dict, rule_name: str) -> Condition:
+    field, op = spec.get("field"), spec.get("op")
+    if not isinstance(field, str) or not field:
+        raise ValueError(f"Rule '{rule_name}': every condition needs a field")
+    if op in COMPARISONS:
+        return Condition(field, op, _check_literal(spec.get("value"), rule_name))
+    if op == "outside":
+        low, high = spec.get("range") or (None, None)
+        if not all(isinstance(bound, (int, float)) and not isinstance(bound, bool) for bound in (low, high)) or low > high:
+            raise ValueError(f"Rule '{rule_name}': 'outside' needs a numeric range [low, high]")
+        return Condition(field, op, (low, high))
+    raise ValueError(f"Rule '{rule_name}': unknown operator {op!r}")
+
+def _condition_source(condition: Condition) -> str:
+    # Literals are emitted with repr(), so the generated code only ever holds numbers and strings
+    value = f"d[{condition.field!r}]"
+    if condition.op == "outside":
+        low, high = condition.value
+        return f"not ({low!r} <= {value} <= {high!r})"
+    return f"{value} {condition.op} {condition.value!r}"
+
+def _rule_source(rule: Rule) -> str:
+    return " or ".join(f"({_condition_source(condition)})" for condition in rule.fail_when)
+
+class RuleSet:
+    """A validated rule table compiled into evaluator functions."""
+
+    def __init__(self, table: Dict[str, Any]):
+        self.version = str(table.get("version") or "")
+        if not self.version:
+            raise ValueError("Rule table needs a version")
+        self.eligible_reason = table.get("eligible_reason", "Meets all eligibility criteria")
+
+        rules = []
+        for spec in table.get("rules") or []:
+            name = spec.get("name")
+            if not name or any(rule.name == name for rule in rules):
+                raise ValueError(f"Rule names must be present and unique: {name!r}")
+            conditions = tuple(_parse_condition(condition, name) for condition in spec.get("fail_when") or [])
+            if not conditions:
+                raise ValueError(f"Rule '{name}' has no conditions")
+            rules.append(Rule(name, spec.get("reason") or name, conditions))
+        if not rules:
+            raise ValueError("Rule table has no rules")
+        self.rules: Tuple[Rule, ...] = tuple(rules)
+        self.fields: Tuple[str, ...] = tuple(dict.fromkeys(
+            condition.field for rule in self.rules for condition in rule.fail_when
+        ))
+
+        # stopped_at[i]: first-failure evaluations that stopped at rule i (index len(rules): passed all)
+        self._stopped_at = [0] * (len(self.rules) + 1)
+        self._all_failures = [0] * len(self.rules)
+        self._all_evaluations = [0]
+        # What check() returns for each rule, plus the eligible outcome last
+        self._outcomes = tuple((False, rule.reason) for rule in self.rules) + ((True, self.eligible_reason),)
+        self._first_failure, self._check, self._all_failing = self._compile()
+
+    def _compile(self):
+        passed = len(self.rules)
+        first = ["def first_failure(d):"]
+        check = ["def check(d):"]
+        collect = ["def all_failing(d):", "    failed = []"]
+        for index, rule in enumerate(self.rules):
+            condition = _rule_source(rule)
+            first += [f"    if {condition}:", f"        stopped_at[{index}] += 1", f"        return {index}"]
+            check += [f"    if {condition}:", f"        stopped_at[{index}] += 1", f"        return outcomes[{index}]"]
+            collect += [f"    if {condition}:", f"        failed.append({index})", f"        all_failures[{index}] += 1"]
+        first += [f"    stopped_at[{passed}] += 1", "    return -1"]
+        check += [f"    stopped_at[{passed}] += 1", f"    return outcomes[{passed}]"]
+        collect += ["    all_evaluations[0] += 1", "    return failed"]
+
+        namespace = {
+            "outcomes": self._outcomes,
+            "stopped_at": self._stopped_at,
+            "all_failures": self._all_failures,
+            "all_evaluations": self._all_evaluations,
+        }
+        source = "\n".join(first + check + collect)
+        exec(compile(source, f"<eligibility rules {self.version}>", "exec"), namespace)
+        self.source = source
+        return namespace["first_failure"], namespace["check"], namespace["all_failing"]
+
+    def first_failure(self, data: dict) -> int:
+        """Index of the first failing rule, or -1 if every rule passes."""
+        return self._first_failure(data)
+
+    def check(self, data: dict) -> Tuple[bool, str]:
+        """(eligible, reason of the first failing rule or the eligible reason)."""
+        return self._check(data)
+
+    def all_failures(self, data: dict) -> List[int]:
+        """Indexes of every failing rule."""
+        return self._all_failing(data)
+
+    def evaluate(self, data: dict) -> EligibilityResult:
+        failed = self._all_failing(data)
+        if not failed:
+            return EligibilityResult(True, [self.eligible_reason], [], self.version)
+        return EligibilityResult(
+            False,
+            [self.rules[index].reason for index in failed],
+            [self.rules[index].name for index in failed],
+            self.version
+        )
+
+    def counters(self) -> List[Dict[str, Any]]:
+        """
+        Per-rule evaluation and failure counts since start-up. The compiled code
+        bumps them without locking, so they are approximate under heavy concurrency.
+        """
+        stopped_at = list(self._stopped_at)
+        all_failures = list(self._all_failures)
+        all_evaluations = self._all_evaluations[0]
+        stats = []
+        reached = sum(stopped_at)
+        for index, rule in enumerate(self.rules):
+            failed = stopped_at[index] + all_failures[index]
+            stats.append({"rule": rule.name, "evaluated": reached + all_evaluations, "failed": failed})
+            reached -= stopped_at[index]
+        return stats
+
+    def reset_counters(self):
+        # In place: the compiled functions hold references to these lists
+        for counts in (self._stopped_at, self._all_failures, self._all_evaluations):
+            counts[:] = [0] * len(counts)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "rules": [
+                {
+                    "name": rule.name,
+                    "reason": rule.reason,
+                    "fail_when": [condition._asdict() for condition in rule.fail_when]
+                }
+                for rule in self.rules
+            ],
+            "counters": self.counters()
+        }
+
+def load_rule_set(path: str = ELIGIBILITY_RULES_FILE) -> RuleSet:
+    with open(path, encoding="utf-8") as f:
+        return RuleSet(json.load(f))
+
+# Compiled once, when the app imports this module
+rule_set: RuleSet = load_rule_set()
+
+def get_rule_set() -> RuleSet:
+    return rule_set
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Index advisor for the SQLite schema.
+
+Calls every GET API route of the app against the configured database, records the
+SELECT statements they issue, runs EXPLAIN QUERY PLAN on each and flags full table
+scans. Run it against a database with representative data (path parameters are
+filled in from the first patient, scan and treatment plan found). Routes are called
+as a staff user, and the run fails if any of them still answers 401 or 403.
+
+Usage:
+    python explain_queries.py
+"""
+
+import re
+import sys
+import os
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from database import engine, SessionLocal
+import models
+from current_user import CurrentUser, STAFF_ROLES, get_optional_user, require_user, require_staff
+from auth import router as auth_router
+from upload_router import router as upload_router
+
+TEMP_SORT = "USE TEMP B-TREE"
+SKIPPED_PREFIXES = ("/static", "/uploads", "/docs", "/redoc", "/openapi")
+
+def sample_path_params() -> Dict[str, str]:
+    db = SessionLocal()
+    try:
+        params = {}
+        patient = db.query(models.Patient).order_by(models.Patient.id).first()
+        scan = db.query(models.StrokeScan).order_by(models.StrokeScan.id).first()
+        plan = db.query(models.TreatmentPlan).order_by(models.TreatmentPlan.id).first()
+        if patient:
+            params["patient_code"] = patient.code
+        if scan:
+            params["scan_id"] = str(scan.id)
+        if plan:
+            params["treatment_plan_id"] = str(plan.id)
+        return params
+    finally:
+        db.close()
+
+def staff_identity() -> CurrentUser:
+    """The first staff user in the database, or a stand-in physician when there is none."""
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.role.in_(STAFF_ROLES)).order_by(models.User.id).first()
+        if user:
+            return CurrentUser(user.id, user.username, user.role, None, None)
+        return CurrentUser(0, "explain_queries", "Physician", None, None)
+    finally:
+        db.close()
+
+def api_get_paths(app, path_params: Dict[str, str]) -> List[str]:
+    paths = []
+    seen = set()
+    for route in list(app.routes) + list(auth_router.routes) + list(upload_router.routes):
+        if getattr(route, "path", None) in seen:
+            continue
+        seen.add(getattr(route, "path", None))
+        methods = getattr(route, "methods", None) or set()
+        if "GET" not in methods or route.path.startswith(SKIPPED_PREFIXES):
+            continue
+        names = re.findall(r"{(\w+)}", route.path)
+        if any(name not in path_params for name in names):
+            print(f"  (skipping {route.path}: no sample value for its path parameters)")
+            continue
+        paths.append(route.path.format(**{name: path_params[name] for name in names}))
+    return paths
+
+def capture_statements(app, paths: List[str], user: CurrentUser) -> Tuple[Dict[str, dict], List[str]]:
+    """
+    Map each distinct SELECT statement to its parameters and the first route that
+    issued it, calling the routes as `user`. Also returns the paths that were
+    refused (401/403): their queries were never run, so they were not checked.
+    """
+    statements: Dict[str, dict] = {}
+    denied: List[str] = []
+    current_path: Optional[str] = None
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and statement not in statements:
+            statements[statement] = {"parameters": parameters, "path": current_path}
+
+    overrides = {dependency: (lambda: user) for dependency in (get_optional_user, require_user, require_staff)}
+    app.dependency_overrides.update(overrides)
+    client = TestClient(app)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for path in paths:
+            current_path = path
+            if client.get(path).status_code in (401, 403):
+                denied.append(path)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        for dependency in overrides:
+            app.dependency_overrides.pop(dependency, None)
+    return statements, denied
+
+def is_table_scan(detail: str) -> bool:
+    # "SCAN patients" reads the whole table; "SCAN patients USING INDEX ..." walks an index instead
+    return detail.startswith("SCAN ") and "USING" not in detail and "CONSTANT ROW" not in detail
+
+def explain(statements: Dict[str, dict]) -> int:
+    flagged = 0
+    with engine.connect() as connection:
+        for statement, info in statements.items():
+            plan = [row[3] for row in connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", info["parameters"]
+            )]
+            scans = [detail for detail in plan if is_table_scan(detail)]
+            sorts = [detail for detail in plan if detail.startswith(TEMP_SORT)]
+            if not scans and not sorts:
+                continue
+
+            # A primary-key ordered walk with a LIMIT (first page of a keyset listing) stops early
+            bounded = " LIMIT " in statement.upper()
+            if scans and not bounded:
+                flagged += 1
+            print(f"\n{info['path']}")
+            print("  " + " ".join(statement.split())[:200])
+            for detail in scans:
+                if bounded:
+                    print(f"  ℹ️  table scan bounded by LIMIT: {detail}")
+                else:
+                    print(f"  ⚠️  full table scan: {detail}")
+            for detail in sorts:
+                print(f"  ℹ️  sort not served by an index: {detail}")
+    return flagged
+
+if __name__ == "__main__":
+    # Imported here rather than at the top: importing the app creates the tables of the
+    # configured database, which importers of is_table_scan (test_indexes.py) must not do
+    from main import app
+
+    print("Collecting queries issued by GET routes...")
+    print("=" * 50)
+    statements, denied = capture_statements(app, api_get_paths(app, sample_path_params()), staff_identity())
+    print(f"Captured {len(statements)} distinct SELECT statements")
+    if denied:
+        print(f"{len(denied)} routes refused the staff user, their queries were not checked:")
+        for path in denied:
+            print(f"  {path}")
+        sys.exit(1)
+
+    flagged = explain(statements)
+    print("\n" + "=" * 50)
+    if flagged:
+        print(f"{flagged} statements perform full table scans")
+        sys.exit(1)
+    print("No full table scans found")
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Durable background jobs, processed by an in-process worker pool.
+
+Request handlers enqueue a job row in the same transaction as the data it refers
+to and return; worker threads claim queued jobs from the jobs table, run the
+registered handler and record the result. Failed jobs are retried with
+exponential back-off up to max_attempts. While a handler runs, its worker renews
+the job's lease (locked_at) every JOB_LEASE_RENEW_SECONDS; a job left "running"
+by a process that died is picked up again once its lease expires, or marked
+failed if it has used up its attempts. Clients poll GET /api/jobs/{id} for the
+outcome.
+
+Usage:
+    python job_queue.py stats                # jobs per status and kind
+    python job_queue.py purge [--days 7]     # delete finished jobs older than N days
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from sqlalchemy import update, or_, and_, delete, func
+from sqlalchemy.orm import Session, sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal
+from models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_LEASE_RENEW_SECONDS = float(os.getenv("JOB_LEASE_RENEW_SECONDS", str(JOB_LEASE_SECONDS / 3)))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_handlers: Dict[str, Callable[[dict], Optional[dict]]] = {}
+
+def job_handler(kind: str):
+    """Register a function taking the job payload (a dict) and returning a JSON-serializable result."""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+def enqueue(db, kind: str, payload: Optional[dict] = None, max_attempts: int = 3) -> Job:
+    """
+    Add a job to the session (sync or async). It is committed with the caller's
+    transaction, so a job exists exactly when the data it works on does; call
+    worker_pool.notify() after the commit to start it without waiting for a poll.
+    """
+    now = datetime.now()
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        status=QUEUED,
+        attempts=0,
+        max_attempts=max_attempts,
+        run_after=now,
+        created_at=now,
+        updated_at=now
+    )
+    db.add(job)
+    return job
+
+def job_status(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "result": json.loads(job.result) if job.result else None,
+        "last_error": job.last_error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    }
+
+def fail_expired_jobs(db: Session) -> int:
+    """Mark running jobs whose lease expired after their last attempt as failed; returns how many."""
+    now = datetime.now()
+    failed = db.execute(
+        update(Job)
+        .where(Job.status == RUNNING, Job.locked_at < now - timedelta(seconds=JOB_LEASE_SECONDS),
+               Job.attempts >= Job.max_attempts)
+        .values(status=FAILED, last_error="Lease expired: the worker running the job stopped",
+                locked_by=None, locked_at=None, updated_at=now)
+    ).rowcount
+    db.commit()
+    return failed
+
+def claim_next_job(db: Session, worker_id: str) -> Optional[Job]:
+    """
+    Atomically mark the oldest runnable job as running by this worker. The
+    conditional UPDATE only succeeds for one worker if several pick the same row.
+    A running job whose lease expired is reclaimed only if it has attempts left.
+    """
+    fail_expired_jobs(db)
+    now = datetime.now()
+    runnable = or_(
+        and_(Job.status == QUEUED, Job.run_after <= now),
+        and_(Job.status == RUNNING, Job.locked_at < now - timedelta(seconds=JOB_LEASE_SECONDS),
+             Job.attempts < Job.max_attempts),
+    )
+    while True:
+        candidate = db.query(Job.id, Job.status).filter(runnable).order_by(Job.id).first()
+        if candidate is None:
+            return None
+        claimed = db.execute(
+            update(Job)
+            .where(Job.id == candidate.id, Job.status == candidate.status, runnable)
+            .values(status=RUNNING, attempts=Job.attempts + 1, locked_by=worker_id, locked_at=now, updated_at=now)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(Job, candidate.id)
+
+def renew_lease(db: Session, job_id: int, worker_id: str) -> bool:
+    """Extend the lease of a job this worker is running; False if it no longer holds it."""
+    renewed = db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == RUNNING, Job.locked_by == worker_id)
+        .values(locked_at=datetime.now())
+    ).rowcount
+    db.commit()
+    return bool(renewed)
+
+def run_job(db: Session, job: Job):
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise RuntimeError(f"No handler registered for job kind '{job.kind}'")
+        result = handler(json.loads(job.payload or "{}"))
+    except Exception as e:
+        logger.warning("Job %s (%s) failed on attempt %s: %s", job.id, job.kind, job.attempts, e)
+        now = datetime.now()
+        job.last_error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        job.locked_by = None
+        job.locked_at = None
+        job.updated_at = now
+        if handler is not None and job.attempts < job.max_attempts:
+            job.status = QUEUED
+            job.run_after = now + timedelta(seconds=JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = FAILED
+        db.commit()
+        return
+
+    job.status = SUCCEEDED
+    job.result = json.dumps(result) if result is not None else None
+    job.last_error = None
+    job.locked_by = None
+    job.locked_at = None
+    job.updated_at = datetime.now()
+    db.commit()
+
+class WorkerPool:
+    """Threads that process jobs until stopped; started and stopped with the app."""
+
+    def __init__(self, session_factory: sessionmaker = SessionLocal, workers: int = JOB_WORKERS,
+                 poll_seconds: float = JOB_POLL_SECONDS, lease_renew_seconds: float = JOB_LEASE_RENEW_SECONDS):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease_renew_seconds = lease_renew_seconds
+        self._wakeup = threading.Condition()
+        self._pending = 0
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping.clear()
+        name = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(f"{name}:{i}",), name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10):
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake a worker now that a new job is committed."""
+        with self._wakeup:
+            self._pending += 1
+            self._wakeup.notify()
+
+    def _wait(self):
+        with self._wakeup:
+            if self._pending == 0:
+                self._wakeup.wait(self.poll_seconds)
+            self._pending = max(self._pending - 1, 0)
+
+    def _renew_lease(self, job_id: int, worker_id: str, done: threading.Event):
+        # On its own session: the worker's session is busy with the handler
+        while not done.wait(self.lease_renew_seconds):
+            try:
+                with self.session_factory() as db:
+                    if not renew_lease(db, job_id, worker_id):
+                        return
+            except Exception:
+                logger.exception("Renewing the lease of job %s failed", job_id)
+
+    def _work(self, worker_id: str):
+        while not self._stopping.is_set():
+            try:
+                with self.session_factory() as db:
+                    job = claim_next_job(db, worker_id)
+                    if job is not None:
+                        done = threading.Event()
+                        renewer = threading.Thread(target=self._renew_lease, args=(job.id, worker_id, done),
+                                                   name=f"job-lease-{job.id}", daemon=True)
+                        renewer.start()
+                        try:
+                            run_job(db, job)
+                        finally:
+                            done.set()
+                            renewer.join()
+                        continue
+            except Exception:
+                logger.exception("Job worker %s error", worker_id)
+            self._wait()
+
+worker_pool = WorkerPool()
+
+def job_stats(db: Session) -> Dict[str, Dict[str, int]]:
+    stats: Dict[str, Dict[str, int]] = {}
+    for kind, status, count in db.query(Job.kind, Job.status, func.count(Job.id)).group_by(Job.kind, Job.status):
+        stats.setdefault(kind, {})[status] = count
+    return stats
+
+def purge_finished_jobs(db: Session, older_than: timedelta) -> int:
+    result = db.execute(
+        delete(Job).where(Job.status.in_([SUCCEEDED, FAILED]), Job.updated_at < datetime.now() - older_than)
+    )
+    db.commit()
+    return result.rowcount
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Background job maintenance")
+    parser.add_argument("command", choices=["stats", "purge"])
+    parser.add_argument("--days", type=float, default=7)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.command == "stats":
+            for kind, counts in sorted(job_stats(db).items()):
+                print(f"{kind}: " + ", ".join(f"{status} {count}" for status, count in sorted(counts.items())))
+        else:
+            print(f"Deleted {purge_finished_jobs(db, timedelta(days=args.days))} finished jobs")
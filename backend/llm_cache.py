@@ -0,0 +1,176 @@
+"""
+Cached LLM completions for treatment plan generation.
+
+Generating a plan for the same patient and scan data again (a physician clicking
+generate twice, or another physician opening the case) sends the same prompt,
+so the answer is served from the cache instead of paying seconds of latency and
+API cost. The key is a SHA-256 of the canonical request: model, every message
+(system and rendered patient/scan data, with whitespace collapsed), temperature
+and max_tokens. Any change to the patient's data or the prompt templates gives
+a new key.
+
+Entries live in an in-process LRU (LLM_CACHE_MAX_ENTRIES) and in the llm_cache
+table (SQLite by default), so they survive restarts and are shared by workers.
+Both expire after LLM_CACHE_TTL_SECONDS; the table is trimmed to the
+LLM_CACHE_MAX_STORED most recently used entries, and llm_cache_sweeper, started
+with the app, deletes expired rows every LLM_CACHE_SWEEP_SECONDS. Only
+successful completions are stored. bypass_cache=True asks the model again and
+replaces the entry.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, delete, func
+from sqlalchemy.orm import sessionmaker
+
+from database import SessionLocal
+from llm_client import LLMClient, llm_client
+from models import LLMCacheEntry
+from session_store import SessionSweeper
+
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_MAX_STORED = int(os.getenv("LLM_CACHE_MAX_STORED", "10000"))
+LLM_CACHE_SWEEP_SECONDS = float(os.getenv("LLM_CACHE_SWEEP_SECONDS", "3600"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+def prompt_key(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int] = None) -> str:
+    canonical = {
+        "model": model,
+        "messages": [[message["role"], _WHITESPACE.sub(" ", message["content"]).strip()] for message in messages],
+        "temperature": float(temperature),
+        "max_tokens": max_tokens,
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    def __init__(self, session_factory: sessionmaker = SessionLocal, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, max_stored: int = LLM_CACHE_MAX_STORED):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_stored = max_stored
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # key -> (expires, response)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stored_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, response: str, expires: float):
+        with self._lock:
+            self._entries[key] = (expires, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """The cached response, from memory or the table; None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+
+        now = datetime.now()
+        with self.session_factory() as db:
+            row = db.get(LLMCacheEntry, key)
+            if row is None or row.expires_at <= now:
+                with self._lock:
+                    self.misses += 1
+                return None
+            row.last_used_at = now
+            db.commit()
+            response, remaining = row.response, (row.expires_at - now).total_seconds()
+        self._remember(key, response, time.monotonic() + remaining)
+        with self._lock:
+            self.stored_hits += 1
+        return response
+
+    def put(self, key: str, model: str, response: str):
+        now = datetime.now()
+        self._remember(key, response, time.monotonic() + self.ttl_seconds)
+        with self.session_factory() as db:
+            db.merge(LLMCacheEntry(key=key, model=model, response=response, created_at=now, last_used_at=now,
+                                   expires_at=now + timedelta(seconds=self.ttl_seconds)))
+            db.flush()
+            excess = db.execute(select(func.count()).select_from(LLMCacheEntry)).scalar() - self.max_stored
+            if excess > 0:
+                # Least recently used first
+                oldest = select(LLMCacheEntry.key).order_by(LLMCacheEntry.last_used_at).limit(excess)
+                db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.key.in_(oldest)))
+                with self._lock:
+                    self.evictions += excess
+            db.commit()
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def sweep(self) -> int:
+        """Delete expired entries from the table; returns how many were deleted."""
+        with self.session_factory() as db:
+            deleted = db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.expires_at <= datetime.now())).rowcount
+            db.commit()
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        with self.session_factory() as db:
+            db.execute(delete(LLMCacheEntry))
+            db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stored_hits + self.misses
+        with self.session_factory() as db:
+            stored = db.execute(select(func.count()).select_from(LLMCacheEntry)).scalar()
+        return {
+            "entries": len(self._entries),
+            "stored_entries": stored,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stored_hits": self.stored_hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "hit_rate": round((self.hits + self.stored_hits) / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+llm_response_cache = LLMResponseCache()
+llm_cache_sweeper = SessionSweeper(llm_response_cache, LLM_CACHE_SWEEP_SECONDS, what="cached completions")
+
+async def cached_chat(messages: List[Dict[str, str]], model: str, max_tokens: int = 1500, temperature: float = 0.3,
+                      bypass_cache: bool = False, client: Optional[LLMClient] = None,
+                      cache: Optional[LLMResponseCache] = None) -> Tuple[str, bool]:
+    """
+    LLMClient.chat through the cache. Returns (response, served_from_cache).
+    Lookups touch the database, so they run on a thread, off the event loop.
+    """
+    client = client or llm_client
+    cache = cache or llm_response_cache
+    key = prompt_key(model, messages, temperature, max_tokens)
+    if bypass_cache:
+        cache.record_bypass()
+    else:
+        response = await asyncio.to_thread(cache.get, key)
+        if response is not None:
+            return response, True
+
+    response = await client.chat(messages, model=model, max_tokens=max_tokens, temperature=temperature)
+    await asyncio.to_thread(cache.put, key, model, response)
+    return response, False
@@ -0,0 +1,110 @@
+"""
+One HTTP client for the chat completions API, shared by the treatment plan
+service (chatgpt_service.py) and /api/generate-treatment.
+
+Requests are awaited, so a slow completion doesn't block the event loop, and go
+through one httpx.AsyncClient whose keep-alive pool reuses TLS connections
+between calls. At most LLM_MAX_CONCURRENCY requests are in flight per worker
+process; further callers wait for a slot. LLM_TIMEOUT_SECONDS bounds each
+request (LLM_CONNECT_TIMEOUT_SECONDS the connection set-up).
+
+OPENAI_BASE_URL points the client at another OpenAI-compatible server, e.g. the
+local mock in mock_llm_server.py:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=test uvicorn main:app
+"""
+
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+import httpx
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+class LLMError(Exception):
+    """A failed completion; status_code is the HTTP status to answer the caller with."""
+
+    def __init__(self, detail: str, status_code: int = 502):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+class LLMClient:
+    def __init__(self, base_url: str = OPENAI_BASE_URL, api_key: Optional[str] = None,
+                 timeout_seconds: float = LLM_TIMEOUT_SECONDS, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+        if self.api_key == "your_openai_api_key_here":
+            self.api_key = None
+        self.timeout = httpx.Timeout(timeout_seconds, connect=min(LLM_CONNECT_TIMEOUT_SECONDS, timeout_seconds))
+        self.max_concurrency = max_concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self.in_flight = 0
+
+    @property
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _session(self):
+        # The pool belongs to the event loop it was opened on (the server has one);
+        # aclose() it before using the client on another loop, e.g. in another asyncio.run
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._loop is not loop:
+            raise RuntimeError("LLMClient is open on another event loop; aclose() it there first")
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client, self._semaphore
+
+    async def chat(self, messages: List[Dict[str, str]], model: str, max_tokens: int = 1500,
+                   temperature: float = 0.3) -> str:
+        """The content of the first choice of a chat completion."""
+        if not self.is_configured:
+            raise LLMError("OpenAI API key not configured. Please set OPENAI_API_KEY environment variable.", 500)
+
+        client, semaphore = self._session()
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        async with semaphore:
+            self.in_flight += 1
+            try:
+                response = await client.post("/chat/completions", json=payload)
+            except httpx.TimeoutException:
+                raise LLMError("Request to OpenAI API timed out", 504)
+            except httpx.HTTPError as e:
+                raise LLMError(f"Network error communicating with OpenAI API: {str(e)}")
+            finally:
+                self.in_flight -= 1
+
+        if response.status_code != 200:
+            error_detail = "OpenAI API request failed"
+            try:
+                error_detail = response.json().get("error", {}).get("message", error_detail)
+            except ValueError:
+                pass
+            raise LLMError(f"OpenAI API error: {error_detail}")
+
+        try:
+            return response.json()["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise LLMError("Invalid response from OpenAI API")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+llm_client = LLMClient()
@@ -3,11 +3,19 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Optional
 import os
-import shutil
 from dotenv import load_dotenv
-from tpa_eligibility import check_tpa_eligibility
+from tpa_eligibility import evaluate_tpa_eligibility, eligibility_inputs
+from onset_time import onset_from_time_since
+from eligibility_rules import get_rule_set
+from scan_storage import store_scan, serve_scan_object, enqueue_scan_processing, patient_owns_object
+from job_queue import worker_pool, job_status
+from reevaluate_eligibility import enqueue_reevaluation, DEFAULT_BATCH_SIZE
 
 # Load environment variables
 try:
@@ -17,24 +25,40 @@ except Exception as e:
     print("Continuing without .env file...")
 
 # Import database and models
-from database import Base, engine, get_db
+from database import Base, engine, get_db, get_async_db, SessionLocal
 import models  # this line ensures all models are registered
+from dashboard_counters import ensure_counters
+from migrate_schema import migrate_schema
 from auth import router as auth_router
+from session_store import session_sweeper
+from current_user import CurrentUser, STAFF_ROLES, require_user, require_staff, require_patient_access
 from upload_router import router as upload_router
-
-app = FastAPI()
+from llm_client import llm_client
+from llm_cache import llm_cache_sweeper
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Post-upload processing (renditions, ...) runs on these worker threads
+    worker_pool.start()
+    session_sweeper.start()
+    llm_cache_sweeper.start()
+    yield
+    await llm_client.aclose()
+    llm_cache_sweeper.stop()
+    session_sweeper.stop()
+    worker_pool.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # ✅ Create tables after models are imported
 Base.metadata.create_all(bind=engine)
 
-# Helper function to get current user from session (imported from auth module)
-def get_current_user_from_session(request: Request):
-    """Get current user from session cookie"""
-    from auth import active_sessions
-    session_id = request.cookies.get("session_id")
-    if session_id and session_id in active_sessions:
-        return active_sessions[session_id]
-    return None
+# ✅ Add the columns, indexes and backfills existing tables are missing
+migrate_schema(engine)
+
+# ✅ Build the dashboard counters on first start-up
+with SessionLocal() as counters_db:
+    ensure_counters(counters_db)
 
 # Pydantic models for API
 class PatientCreate(BaseModel):
@@ -42,6 +66,7 @@ class PatientCreate(BaseModel):
     age: int
     gender: str
     time_since_onset: str
+    onset_at: Optional[datetime] = None  # exact onset, if known; otherwise parsed from time_since_onset
     consent_confirmed: bool
     code: str
 
@@ -77,9 +102,16 @@ class NIHSSAssessment(BaseModel):
     extinction: int
     total_score: int
 
-# ✅ Mount static and upload folders
+# ✅ Mount static folder
 app.mount("/static", StaticFiles(directory="../frontend"), name="static")
-app.mount("/uploads", StaticFiles(directory="../uploads"), name="uploads")
+
+# Scan images are read from the object storage rather than a local mount, so any node can serve them
+@app.get("/uploads/{key:path}")
+def serve_upload(key: str, user: CurrentUser = Depends(require_user), db: Session = Depends(get_db)):
+    # Staff may open any scan; a patient only the images (and renditions) of their own scans
+    if user.role not in STAFF_ROLES and not patient_owns_object(db, user.patient_id, key):
+        raise HTTPException(status_code=403, detail="Not allowed to access this file")
+    return serve_scan_object(key)
 
 # ✅ Include route handlers
 app.include_router(auth_router)
@@ -139,7 +171,7 @@ def serve_patient_dashboard():
     return FileResponse(os.path.join("../frontend", "patient_dashboard.html"))
 
 # API endpoint to create a new patient
-@app.post("/api/patients", response_model=PatientResponse)
+@app.post("/api/patients", response_model=PatientResponse, dependencies=[Depends(require_staff)])
 def create_patient(patient_data: PatientCreate, db: Session = Depends(get_db)):
     try:
         # Validate consent
@@ -151,12 +183,23 @@ def create_patient(patient_data: PatientCreate, db: Session = Depends(get_db)):
         if existing_patient:
             raise HTTPException(status_code=400, detail="Patient code already exists")
         
+        # Onset is stored as a timestamp so eligibility can use the real elapsed time
+        onset_at = patient_data.onset_at or onset_from_time_since(patient_data.time_since_onset, datetime.now())
+        if onset_at is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Could not read time since onset; use e.g. '2 hours', '45 minutes' or '1h 30m'"
+            )
+        if onset_at.tzinfo is not None:
+            onset_at = onset_at.astimezone().replace(tzinfo=None)  # timestamps are stored in local time
+        
         # Create new patient
         new_patient = models.Patient(
             name=patient_data.name,
             age=patient_data.age,
             gender=patient_data.gender,
             time_since_onset=patient_data.time_since_onset,
+            onset_at=onset_at,
             code=patient_data.code,
             chief_complaint="",  # Will be filled in vitals page
             systolic_bp=None,
@@ -181,13 +224,15 @@ def create_patient(patient_data: PatientCreate, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to create patient: {str(e)}")
 
-# API endpoint to get patient by code
-@app.get("/api/patients/{patient_code}")
-def get_patient_by_code(patient_code: str, db: Session = Depends(get_db)):
+# API endpoint to get patient data by logged-in user
+# (declared before /api/patients/{patient_code}, which would otherwise match it)
+@app.get("/api/patients/by-user")
+def get_patient_by_user(user: CurrentUser = Depends(require_user), db: Session = Depends(get_db)):
     try:
-        patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
+        # The linked patient comes with the resolved user
+        patient = db.get(models.Patient, user.patient_id) if user.patient_id is not None else None
         if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
+            raise HTTPException(status_code=404, detail="No patient record linked to this user")
         
         return {
             "id": patient.id,
@@ -196,6 +241,7 @@ def get_patient_by_code(patient_code: str, db: Session = Depends(get_db)):
             "age": patient.age,
             "gender": patient.gender,
             "time_since_onset": patient.time_since_onset,
+            "onset_at": patient.onset_at.isoformat() if patient.onset_at else None,
             "chief_complaint": patient.chief_complaint,
             "systolic_bp": patient.systolic_bp,
             "diastolic_bp": patient.diastolic_bp,
@@ -211,19 +257,13 @@ def get_patient_by_code(patient_code: str, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get patient: {str(e)}")
 
-# API endpoint to get patient data by logged-in user
-@app.get("/api/patients/by-user")
-def get_patient_by_user(request: Request, db: Session = Depends(get_db)):
+# API endpoint to get patient by code
+@app.get("/api/patients/{patient_code}", dependencies=[Depends(require_patient_access)])
+def get_patient_by_code(patient_code: str, db: Session = Depends(get_db)):
     try:
-        # Get current user from session
-        user_info = get_current_user_from_session(request)
-        if not user_info:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        
-        # Get patient by linked user ID
-        patient = db.query(models.Patient).filter(models.Patient.linked_user_id == user_info['user_id']).first()
+        patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
         if not patient:
-            raise HTTPException(status_code=404, detail="No patient record linked to this user")
+            raise HTTPException(status_code=404, detail="Patient not found")
         
         return {
             "id": patient.id,
@@ -232,6 +272,7 @@ def get_patient_by_user(request: Request, db: Session = Depends(get_db)):
             "age": patient.age,
             "gender": patient.gender,
             "time_since_onset": patient.time_since_onset,
+            "onset_at": patient.onset_at.isoformat() if patient.onset_at else None,
             "chief_complaint": patient.chief_complaint,
             "systolic_bp": patient.systolic_bp,
             "diastolic_bp": patient.diastolic_bp,
@@ -248,7 +289,7 @@ def get_patient_by_user(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to get patient: {str(e)}")
 
 # API endpoint to update patient vitals
-@app.put("/api/patients/{patient_code}/vitals")
+@app.put("/api/patients/{patient_code}/vitals", dependencies=[Depends(require_staff)])
 def update_patient_vitals(patient_code: str, vitals_data: PatientVitalsUpdate, db: Session = Depends(get_db)):
     try:
         patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
@@ -281,7 +322,7 @@ def update_patient_vitals(patient_code: str, vitals_data: PatientVitalsUpdate, d
         raise HTTPException(status_code=500, detail=f"Failed to update patient vitals: {str(e)}")
 
 # API endpoint to save NIHSS assessment
-@app.post("/api/patients/{patient_code}/nihss")
+@app.post("/api/patients/{patient_code}/nihss", dependencies=[Depends(require_staff)])
 def save_nihss_assessment(patient_code: str, nihss_data: NIHSSAssessment, db: Session = Depends(get_db)):
     try:
         patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
@@ -326,7 +367,7 @@ def save_nihss_assessment(patient_code: str, nihss_data: NIHSSAssessment, db: Se
         raise HTTPException(status_code=500, detail=f"Failed to save NIHSS assessment: {str(e)}")
 
 # API endpoint to get NIHSS assessment for a patient
-@app.get("/api/patients/{patient_code}/nihss")
+@app.get("/api/patients/{patient_code}/nihss", dependencies=[Depends(require_patient_access)])
 def get_nihss_assessment(patient_code: str, db: Session = Depends(get_db)):
     try:
         patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
@@ -365,104 +406,112 @@ def get_nihss_assessment(patient_code: str, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get NIHSS assessment: {str(e)}")
 
+# Current eligibility rule table and how often each rule has been evaluated and failed
+@app.get("/api/eligibility/rules", dependencies=[Depends(require_staff)])
+def get_eligibility_rules():
+    return get_rule_set().describe()
+
+# Re-run eligibility for every existing scan under the current rules (e.g. after a protocol change).
+# Runs as a background job; poll /api/jobs/{id} for progress and the diff statistics.
+@app.post("/api/eligibility/reevaluate", dependencies=[Depends(require_staff)])
+def start_eligibility_reevaluation(dry_run: bool = False, batch_size: int = DEFAULT_BATCH_SIZE, db: Session = Depends(get_db)):
+    if not 1 <= batch_size <= 50000:
+        raise HTTPException(status_code=400, detail="batch_size must be between 1 and 50000")
+    job = enqueue_reevaluation(db, batch_size=batch_size, dry_run=dry_run)
+    db.commit()
+    worker_pool.notify()
+    return {"job_id": job.id, "status": job.status}
+
+# Status of a background job, e.g. the processing_job_id returned by /api/upload-scan
+@app.get("/api/jobs/{job_id}", dependencies=[Depends(require_staff)])
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
 # API endpoint to upload scan and run tPA eligibility check
-@app.post("/api/upload-scan")
+@app.post("/api/upload-scan", dependencies=[Depends(require_staff)])
 async def upload_scan_and_check_eligibility(
     patient_code: str = Form(...),
     scan_type: str = Form(...),
     imaging_confirmed: str = Form(...),
     scan_file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         # Get patient data
-        patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
+        patient = (await db.execute(
+            select(models.Patient).where(models.Patient.code == patient_code)
+        )).scalars().first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
         # Get NIHSS assessment
-        nihss_assessment = db.query(models.NIHSSAssessment).filter(
-            models.NIHSSAssessment.patient_id == patient.id
-        ).order_by(models.NIHSSAssessment.timestamp.desc()).first()
+        nihss_assessment = (await db.execute(
+            select(models.NIHSSAssessment)
+            .where(models.NIHSSAssessment.patient_id == patient.id)
+            .order_by(models.NIHSSAssessment.timestamp.desc())
+            .limit(1)
+        )).scalars().first()
         
         if not nihss_assessment:
             raise HTTPException(status_code=400, detail="NIHSS assessment not found for patient")
         
-        # Save uploaded file
-        upload_dir = "../uploads"
-        os.makedirs(upload_dir, exist_ok=True)
+        # Save uploaded file (identical images are stored once)
+        stored_scan = await store_scan(scan_file)
         
-        timestamp = datetime.now().timestamp()
-        filename = f"{timestamp}_{patient_code}_{scan_file.filename}"
-        file_path = os.path.join(upload_dir, filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(scan_file.file, buffer)
-        
-        # Prepare data for tPA eligibility check
-        # Convert time since onset to hours (simplified - you might want to parse this better)
-        time_since_onset_hours = 2.0  # Default value, you might want to parse from patient.time_since_onset
-        
-        eligibility_data = {
-            "age": patient.age,
-            "hours_since_onset": time_since_onset_hours,
-            "imaging_confirmed": imaging_confirmed,
-            "consent": "yes",  # Assuming consent was given in the workflow
-            "nhiss_score": nihss_assessment.total_score,
-            "inr": patient.inr or 1.0,
-            "heart_rate": patient.heart_rate or 80,
-            "respiratory_rate": 16,  # Default value
-            "temperature": patient.temperature or 98.6,
-            "oxygen_saturation": patient.oxygen_saturation or 98,
-            "recent_trauma": "no",  # Default values - you might want to add these fields
-            "recent_stroke_or_injury": "no",
-            "intracranial_issue": "no",
-            "recent_mi": "no",
-            "systolic_bp": patient.systolic_bp or 120,
-            "diastolic_bp": patient.diastolic_bp or 80,
-            "glucose": patient.glucose or 100,
-            "anticoagulant_risk": "no",
-            "platelet_count": patient.platelet_count or 250,
-            "recent_surgery": "no"
-        }
+        # Prepare data for tPA eligibility check, with the time elapsed since onset
+        scanned_at = datetime.now()
+        eligibility_data = eligibility_inputs(patient, nihss_assessment.total_score, imaging_confirmed, at=scanned_at)
         
         # Run tPA eligibility check
-        is_eligible, reason = check_tpa_eligibility(eligibility_data)
+        eligibility = evaluate_tpa_eligibility(eligibility_data)
+        is_eligible, reason = eligibility.eligible, eligibility.reasons[0]
         
         # Create stroke scan record
         stroke_scan = models.StrokeScan(
             patient_id=patient.id,
-            image_path=file_path,
+            image_path=stored_scan.image_path,
             prediction="Ischemic Stroke" if imaging_confirmed == "yes" else "Not Confirmed",
-            timestamp=datetime.now(),
+            timestamp=scanned_at,
             doctor_comment=f"Scan type: {scan_type}, Imaging confirmed: {imaging_confirmed}",
             eligibility_result=reason,
             eligible=is_eligible
         )
         
         db.add(stroke_scan)
-        db.commit()
-        db.refresh(stroke_scan)
+        # Slower processing is queued in the same transaction and runs after the response
+        processing_job = enqueue_scan_processing(db, stroke_scan.image_path)
+        await db.commit()
+        await db.refresh(stroke_scan)
+        worker_pool.notify()
         
         return {
             "eligible": is_eligible,
             "reason": reason,
+            "failed_criteria": eligibility.reasons if not is_eligible else [],
+            "rules_version": eligibility.rules_version,
+            "hours_since_onset": round(eligibility_data["hours_since_onset"], 2) if patient.onset_at else None,
             "scan_id": stroke_scan.id,
             "patient_code": patient.code,
+            "sha256": stored_scan.sha256,
+            "deduplicated": stored_scan.deduplicated,
+            "processing_job_id": processing_job.id,
             "message": "Scan uploaded and tPA eligibility assessed successfully"
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to process scan: {str(e)}")
 
 # API endpoint to save patient record with technician notes
-@app.post("/api/patients/save-record")
+@app.post("/api/patients/save-record", dependencies=[Depends(require_staff)])
 async def save_patient_record(
     request: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         patient_code = request.get("patient_code")
@@ -473,20 +522,25 @@ async def save_patient_record(
             raise HTTPException(status_code=400, detail="Patient code is required")
         
         # Get patient
-        patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
+        patient = (await db.execute(
+            select(models.Patient).where(models.Patient.code == patient_code)
+        )).scalars().first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
         # Get the most recent scan for this patient
-        latest_scan = db.query(models.StrokeScan).filter(
-            models.StrokeScan.patient_id == patient.id
-        ).order_by(models.StrokeScan.timestamp.desc()).first()
+        latest_scan = (await db.execute(
+            select(models.StrokeScan)
+            .where(models.StrokeScan.patient_id == patient.id)
+            .order_by(models.StrokeScan.timestamp.desc())
+            .limit(1)
+        )).scalars().first()
         
         if latest_scan:
             # Update the scan with technician notes and status
             latest_scan.technician_notes = technician_notes
             latest_scan.status = status
-            db.commit()
+            await db.commit()
             
             return {
                 "message": "Record saved successfully",
@@ -500,14 +554,14 @@ async def save_patient_record(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to save record: {str(e)}")
 
 # API endpoint to send case to doctor for review
-@app.post("/api/patients/send-to-doctor")
+@app.post("/api/patients/send-to-doctor", dependencies=[Depends(require_staff)])
 async def send_to_doctor(
     request: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         patient_code = request.get("patient_code")
@@ -517,20 +571,25 @@ async def send_to_doctor(
             raise HTTPException(status_code=400, detail="Patient code is required")
         
         # Get patient
-        patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
+        patient = (await db.execute(
+            select(models.Patient).where(models.Patient.code == patient_code)
+        )).scalars().first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
         # Get the most recent scan for this patient
-        latest_scan = db.query(models.StrokeScan).filter(
-            models.StrokeScan.patient_id == patient.id
-        ).order_by(models.StrokeScan.timestamp.desc()).first()
+        latest_scan = (await db.execute(
+            select(models.StrokeScan)
+            .where(models.StrokeScan.patient_id == patient.id)
+            .order_by(models.StrokeScan.timestamp.desc())
+            .limit(1)
+        )).scalars().first()
         
         if latest_scan:
             # Update the scan with technician notes and mark as ready for review
             latest_scan.technician_notes = technician_notes
             latest_scan.status = "ready_for_review"
-            db.commit()
+            await db.commit()
             
             return {
                 "message": "Case sent to doctor successfully",
@@ -544,11 +603,11 @@ async def send_to_doctor(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to send to doctor: {str(e)}")
 
 # API endpoint to get patient vitals
-@app.get("/api/patients/{patient_code}/vitals")
+@app.get("/api/patients/{patient_code}/vitals", dependencies=[Depends(require_patient_access)])
 def get_patient_vitals(patient_code: str, db: Session = Depends(get_db)):
     try:
         patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
@@ -573,7 +632,7 @@ def get_patient_vitals(patient_code: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to get patient vitals: {str(e)}")
 
 # API endpoint to get patient scans
-@app.get("/api/patients/{patient_code}/scans")
+@app.get("/api/patients/{patient_code}/scans", dependencies=[Depends(require_patient_access)])
 def get_patient_scans(patient_code: str, db: Session = Depends(get_db)):
     try:
         patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
@@ -606,7 +665,7 @@ def get_patient_scans(patient_code: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to get patient scans: {str(e)}")
 
 # API endpoint to get patient treatment plans
-@app.get("/api/patients/{patient_code}/treatment-plans")
+@app.get("/api/patients/{patient_code}/treatment-plans", dependencies=[Depends(require_patient_access)])
 def get_patient_treatment_plans(patient_code: str, db: Session = Depends(get_db)):
     try:
         patient = db.query(models.Patient).filter(models.Patient.code == patient_code).first()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Brings an existing database up to the models. create_all creates missing tables
+but never changes existing ones; this adds what it leaves out:
+
+1. nullable model columns the database doesn't have yet (e.g. patients.onset_at),
+2. the secondary indexes declared on the models,
+3. Patient.onset_at backfilled from the free-text time_since_onset.
+
+Every step only does what is still missing, so it runs on each start-up (see
+main.py, after create_all and before the dashboard counters are built) and can
+be run by hand at any time.
+
+The intake time of the free text isn't recorded, so the onset is counted back
+from the patient's first NIHSS assessment or scan, whichever came first.
+Patients whose text can't be parsed, or who have neither, are left without an
+onset (and are outside the treatment window) and listed for manual review.
+
+Usage:
+    python migrate_schema.py [--dry-run]   # --dry-run only reports what the backfill would do
+"""
+
+import argparse
+import logging
+import os
+import sys
+from typing import List
+from sqlalchemy import inspect, func, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models import Patient, StrokeScan, NIHSSAssessment
+from onset_time import onset_from_time_since
+
+logger = logging.getLogger(__name__)
+
+def add_missing_columns(bind: Engine) -> List[str]:
+    """Add every nullable model column missing from an existing table; returns "table.column" names."""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue  # created, with all its columns, by create_all
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            if not column.nullable or column.primary_key:
+                logger.warning("%s.%s is not nullable and must be added by hand", table.name, column.name)
+                continue
+            column_type = column.type.compile(dialect=bind.dialect)
+            with bind.begin() as connection:
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+def create_missing_indexes(bind: Engine) -> List[str]:
+    """Create every index declared on the models that an existing table doesn't have; returns their names."""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing_indexes:
+                index.create(bind=bind)
+                created.append(index.name)
+    if created:
+        # Refresh the planner statistics so the new indexes are used
+        with bind.begin() as connection:
+            connection.exec_driver_sql("ANALYZE")
+    return created
+
+def backfill_onset(db: Session, dry_run: bool = False) -> dict:
+    """Set onset_at for patients that have a time_since_onset but no onset yet"""
+    first_assessment = (
+        select(NIHSSAssessment.patient_id, func.min(NIHSSAssessment.timestamp).label("first_at"))
+        .group_by(NIHSSAssessment.patient_id).subquery()
+    )
+    first_scan = (
+        select(StrokeScan.patient_id, func.min(StrokeScan.timestamp).label("first_at"))
+        .group_by(StrokeScan.patient_id).subquery()
+    )
+    rows = db.execute(
+        select(Patient.id, Patient.code, Patient.time_since_onset,
+               first_assessment.c.first_at.label("first_assessment_at"),
+               first_scan.c.first_at.label("first_scan_at"))
+        .outerjoin(first_assessment, first_assessment.c.patient_id == Patient.id)
+        .outerjoin(first_scan, first_scan.c.patient_id == Patient.id)
+        .where(Patient.time_since_onset.is_not(None), Patient.onset_at.is_(None))
+    ).all()
+
+    updates = []
+    unparsed = []
+    no_reference = []
+    for row in rows:
+        reported_at = min((at for at in (row.first_assessment_at, row.first_scan_at) if at is not None), default=None)
+        if reported_at is None:
+            no_reference.append(row.code)
+            continue
+        onset_at = onset_from_time_since(row.time_since_onset, reported_at)
+        if onset_at is None:
+            unparsed.append((row.code, row.time_since_onset))
+            continue
+        updates.append({"id": row.id, "onset_at": onset_at})
+
+    if updates and not dry_run:
+        db.execute(update(Patient), updates)
+        db.commit()
+    return {"backfilled": len(updates), "unparsed": unparsed, "no_reference": no_reference}
+
+def migrate_schema(bind: Engine) -> dict:
+    """Run every step against `bind`; returns what each one changed."""
+    result = {"columns": add_missing_columns(bind), "indexes": create_missing_indexes(bind)}
+    with Session(bind=bind) as db:
+        result["onset"] = backfill_onset(db)
+    for name in result["columns"]:
+        logger.info("Added column %s", name)
+    for name in result["indexes"]:
+        logger.info("Created index %s", name)
+    if result["onset"]["backfilled"]:
+        logger.info("Backfilled the onset of %d patients; run reevaluate_eligibility.py to re-score "
+                    "their scans", result["onset"]["backfilled"])
+    return result
+
+if __name__ == "__main__":
+    from database import engine, SessionLocal
+
+    parser = argparse.ArgumentParser(description="Bring an existing database up to the models")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be backfilled without writing")
+    args = parser.parse_args()
+
+    print("Starting schema migration...")
+    print("=" * 50)
+
+    if args.dry_run:
+        print("Dry run: only the onset backfill is reported, nothing is written")
+        if "onset_at" not in {column["name"] for column in inspect(engine).get_columns("patients")}:
+            print("Column patients.onset_at does not exist yet; run without --dry-run to add it")
+            sys.exit(1)
+        with SessionLocal() as db:
+            stats = backfill_onset(db, dry_run=True)
+    else:
+        Base.metadata.create_all(bind=engine)
+        result = migrate_schema(engine)
+        for name in result["columns"]:
+            print(f"  - added column {name}")
+        for name in result["indexes"]:
+            print(f"  - created index {name}")
+        stats = result["onset"]
+
+    print(f"{stats['backfilled']} patients backfilled")
+    if stats["unparsed"]:
+        print(f"{len(stats['unparsed'])} patients with a time since onset that could not be read:")
+        for code, text in stats["unparsed"]:
+            print(f"  - {code}: {text!r}")
+    if stats["no_reference"]:
+        print(f"{len(stats['no_reference'])} patients without an assessment or scan to count back from:")
+        print(f"  {', '.join(stats['no_reference'])}")
+    print("\nSchema migration completed successfully!")
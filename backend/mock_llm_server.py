@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the OpenAI chat completions API, for development without an
+API key and for the tests in test_llm_client.py.
+
+POST /v1/chat/completions answers with a canned treatment plan that echoes the
+model and the start of the last message. The server counts requests, the
+connections they arrived on and the most requests it handled at once.
+
+Usage:
+    python mock_llm_server.py [--port 8001] [--delay 0.5]
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=test uvicorn main:app
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, delay_seconds: float = 0.0, status: int = 200):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.delay_seconds = delay_seconds
+        self.status = status  # answer every request with this status
+        self.requests = []  # request bodies
+        self.connections = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "MockLLMServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        pass  # a client that timed out closed the connection before the answer
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server._lock:
+            server.requests.append(body)
+            server._in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server._in_flight)
+        try:
+            if server.delay_seconds:
+                time.sleep(server.delay_seconds)
+            if self.path != "/v1/chat/completions":
+                self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+            elif server.status != 200:
+                self._reply(server.status, {"error": {"message": "Mock LLM error"}})
+            else:
+                prompt = body["messages"][-1]["content"].strip()
+                content = f"Mock treatment plan ({body['model']}): {prompt[:60]}"
+                self._reply(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]})
+        finally:
+            with server._lock:
+                server._in_flight -= 1
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before each answer")
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.port, args.delay)
+    print(f"Mock LLM server on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -15,7 +15,8 @@ class Patient(Base):
     name = Column(String)
     age = Column(Integer)
     gender = Column(String)
-    time_since_onset = Column(String)
+    time_since_onset = Column(String)  # as reported at intake, e.g. "2 hours"
+    onset_at = Column(DateTime, nullable=True)  # parsed from time_since_onset when the patient is created
     chief_complaint = Column(String)
     systolic_bp = Column(Integer)
     diastolic_bp = Column(Integer)
@@ -26,7 +27,7 @@ class Patient(Base):
     platelet_count = Column(Integer)
     inr = Column(Float)
     code = Column(String, unique=True)
-    linked_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    linked_user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
 
     scans = relationship("StrokeScan", back_populates="patient")
 
@@ -45,6 +46,13 @@ class StrokeScan(Base):
 
     patient = relationship("Patient", back_populates="scans")
 
+    __table_args__ = (
+        Index("ix_strokescans_patient_id_timestamp", "patient_id", "timestamp"),
+        Index("ix_strokescans_status", "status"),
+        Index("ix_strokescans_eligible", "eligible"),
+        Index("ix_strokescans_timestamp", "timestamp"),
+    )
+
 class NIHSSAssessment(Base):
     __tablename__ = "nihssassessments"
     id = Column(Integer, primary_key=True, index=True)
@@ -67,6 +75,10 @@ class NIHSSAssessment(Base):
 
     patient = relationship("Patient")
 
+    __table_args__ = (
+        Index("ix_nihssassessments_patient_id_timestamp", "patient_id", "timestamp"),
+    )
+
 class TreatmentPlan(Base):
     __tablename__ = "treatmentplans"
     id = Column(Integer, primary_key=True, index=True)
@@ -83,3 +95,63 @@ class TreatmentPlan(Base):
     patient = relationship("Patient")
     scan = relationship("StrokeScan")
 
+    __table_args__ = (
+        Index("ix_treatmentplans_patient_id_created_at", "patient_id", "created_at"),
+    )
+
+class DashboardCounter(Base):
+    __tablename__ = "dashboard_counters"
+    name = Column(String, primary_key=True)  # e.g. "total_scans", "status:ready_for_review"
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
+
+class ScanBlob(Base):
+    __tablename__ = "scan_blobs"
+    path = Column(String, primary_key=True)  # StrokeScan.image_path, e.g. "uploads/blobs/ab/cd/<sha256>.jpg"
+    sha256 = Column(String, nullable=False, index=True)
+    size = Column(Integer)
+    ref_count = Column(Integer, nullable=False, default=0)  # scans whose image_path is this blob
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # handler name, e.g. "scan_renditions"
+    payload = Column(String)  # JSON arguments for the handler
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime)  # not picked up before this time (retry back-off)
+    locked_by = Column(String)  # worker that is running it
+    locked_at = Column(DateTime)
+    result = Column(String)  # JSON returned by the handler
+    last_error = Column(String)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+class UserSession(Base):
+    __tablename__ = "sessions"
+    id = Column(String, primary_key=True)  # the session cookie value
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    data = Column(String)  # JSON: user_id, username, role
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime)
+
+class RevokedSession(Base):
+    __tablename__ = "revoked_sessions"
+    token_id = Column(String, primary_key=True)  # "jti" of a signed session cookie, see session_store.py
+    expires_at = Column(DateTime, nullable=False, index=True)  # when the cookie would have expired anyway
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+    key = Column(String(64), primary_key=True)  # SHA-256 of the canonical prompt, see llm_cache.py
+    model = Column(String)
+    response = Column(String)
+    created_at = Column(DateTime)
+    last_used_at = Column(DateTime, index=True)  # for LRU trimming
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,238 @@
+"""
+Object storage for scan images.
+
+Scans are stored through an ObjectStorage backend instead of directly on the
+local disk, so that any app node can serve any scan:
+
+    STORAGE_BACKEND=local   files under UPLOAD_DIR (default <repo>/uploads)
+    STORAGE_BACKEND=s3      an S3-compatible bucket (AWS S3, MinIO, ...):
+                            S3_BUCKET, S3_ENDPOINT_URL, S3_REGION and the usual
+                            AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY
+
+Objects are addressed by keys like "blobs/ab/cd/<sha256>.jpg"; reads are either
+streamed through the app or, for S3, redirected to a short-lived presigned URL.
+"""
+
+import abc
+import mimetypes
+import os
+import shutil
+import tempfile
+from typing import Iterator, NamedTuple, Optional
+from fastapi import HTTPException
+from fastapi.responses import RedirectResponse, StreamingResponse
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+UPLOAD_DIR = os.path.abspath(os.getenv(
+    "UPLOAD_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
+))
+S3_PRESIGNED_READS = os.getenv("S3_PRESIGNED_READS", "true").lower() == "true"
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "300"))
+
+class StoredObject(NamedTuple):
+    key: str
+    size: int
+    modified: float  # POSIX timestamp
+
+class ObjectStorage(abc.ABC):
+    """Interface implemented by every storage backend."""
+
+    @abc.abstractmethod
+    def put_file(self, key: str, local_path: str):
+        """Store the file at `local_path` under `key`; the local file is consumed."""
+
+    def exists(self, key: str) -> bool:
+        return self.size(key) is not None
+
+    @abc.abstractmethod
+    def size(self, key: str) -> Optional[int]:
+        """Size in bytes, or None if there is no such object."""
+
+    @abc.abstractmethod
+    def touch(self, key: str):
+        """Mark an object as recently written (garbage collection spares recent objects)."""
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        """Remove the object; deleting a missing object is not an error."""
+
+    @abc.abstractmethod
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """The object's content, `chunk_size` bytes at a time."""
+
+    @abc.abstractmethod
+    def list_objects(self, prefix: str = "") -> Iterator[StoredObject]:
+        """Every object whose key starts with `prefix`."""
+
+    def presigned_url(self, key: str, expires_in: int = S3_PRESIGN_EXPIRES) -> Optional[str]:
+        """A URL clients can fetch the object from directly, if the backend supports it."""
+        return None
+
+def validate_key(key: str) -> str:
+    parts = key.split("/")
+    if not key or key.startswith("/") or "\\" in key or any(part in ("", ".", "..") or part.startswith(".") for part in parts):
+        raise ValueError(f"Invalid object key: {key!r}")
+    return key
+
+class LocalStorage(ObjectStorage):
+    """Files in a directory; only suitable for a single node (or a shared volume)."""
+
+    def __init__(self, root: str = UPLOAD_DIR):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *validate_key(key).split("/"))
+
+    def put_file(self, key: str, local_path: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(local_path, path)
+        except OSError:
+            # Different filesystem: copy next to the target, then rename into place
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".put-")
+            os.close(fd)
+            shutil.copyfile(local_path, temp_path)
+            os.replace(temp_path, path)
+            os.remove(local_path)
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(key))
+        except OSError:
+            return None
+
+    def touch(self, key: str):
+        os.utime(self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            return
+        # Drop shard directories left empty
+        directory = os.path.dirname(self._path(key))
+        while directory != self.root and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self._path(key), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def list_objects(self, prefix: str = "") -> Iterator[StoredObject]:
+        for directory, subdirectories, filenames in os.walk(self.root):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith(".")]
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                path = os.path.join(directory, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    stat = os.stat(path)
+                    yield StoredObject(key, stat.st_size, stat.st_mtime)
+
+class S3Storage(ObjectStorage):
+    """An S3-compatible bucket; requires boto3."""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 presigned_reads: bool = S3_PRESIGNED_READS, **client_options):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.presigned_reads = presigned_reads
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region, **client_options)
+
+    def put_file(self, key: str, local_path: str):
+        content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        self.client.upload_file(local_path, self.bucket, validate_key(key), ExtraArgs={"ContentType": content_type})
+        os.remove(local_path)
+
+    def size(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=validate_key(key))["ContentLength"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def touch(self, key: str):
+        # Copying an object onto itself with replaced metadata updates LastModified
+        head = self.client.head_object(Bucket=self.bucket, Key=validate_key(key))
+        self.client.copy_object(
+            Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+            MetadataDirective="REPLACE", ContentType=head.get("ContentType", "application/octet-stream"),
+        )
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=validate_key(key))
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        body = self.client.get_object(Bucket=self.bucket, Key=validate_key(key))["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def list_objects(self, prefix: str = "") -> Iterator[StoredObject]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                yield StoredObject(item["Key"], item["Size"], item["LastModified"].timestamp())
+
+    def presigned_url(self, key: str, expires_in: int = S3_PRESIGN_EXPIRES) -> Optional[str]:
+        if not self.presigned_reads:
+            return None
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": validate_key(key)}, ExpiresIn=expires_in
+        )
+
+def create_storage(backend: str = STORAGE_BACKEND) -> ObjectStorage:
+    if backend == "local":
+        return LocalStorage(UPLOAD_DIR)
+    if backend == "s3":
+        bucket = os.getenv("S3_BUCKET")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        return S3Storage(bucket, endpoint_url=os.getenv("S3_ENDPOINT_URL"), region=os.getenv("S3_REGION"))
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {backend}")
+
+storage = None
+
+def get_storage() -> ObjectStorage:
+    global storage
+    if storage is None:
+        storage = create_storage()
+    return storage
+
+def object_response(key: str, cache_control: Optional[str] = None):
+    """
+    Response serving a stored object: a redirect to a presigned URL when the
+    backend offers one, otherwise the object streamed in chunks.
+    """
+    backend = get_storage()
+    try:
+        url = backend.presigned_url(key)
+        size = None if url else backend.size(key)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found")
+    if url:
+        return RedirectResponse(url, status_code=307)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    headers = {"Content-Length": str(size)}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    return StreamingResponse(backend.iter_chunks(key), media_type=media_type, headers=headers)
@@ -0,0 +1,61 @@
+"""
+Symptom onset time. Intake records how long ago symptoms started as free text
+("2 hours", "1.5 hours", "45 minutes", "1h 30m", "2:15"); it is parsed once, when
+the patient is created (or by migrate_schema.py for existing rows), into
+Patient.onset_at, and eligibility uses the real time elapsed since then.
+"""
+
+import math
+import re
+from datetime import datetime, timedelta
+from typing import Optional
+
+_UNITS = {
+    "d": timedelta(days=1), "day": timedelta(days=1), "days": timedelta(days=1),
+    "h": timedelta(hours=1), "hr": timedelta(hours=1), "hrs": timedelta(hours=1),
+    "hour": timedelta(hours=1), "hours": timedelta(hours=1),
+    "m": timedelta(minutes=1), "min": timedelta(minutes=1), "mins": timedelta(minutes=1),
+    "minute": timedelta(minutes=1), "minutes": timedelta(minutes=1),
+}
+
+_AMOUNT = re.compile(r"(?:(?<![\d.])(\d+(?:\.\d+)?)\s*|\b(an?)\s+)(days?|d|hours?|hrs?|h|minutes?|mins?|m)(?![a-z])")
+_CLOCK = re.compile(r"(\d+):([0-5]\d)")
+# Words that may surround the amounts, e.g. "about 2 hours and 15 minutes ago"
+_FILLER = re.compile(r"\b(?:and|ago|about|approx|approximately|around|roughly)\b|[~,.+]")
+
+def parse_time_since_onset(text: Optional[str]) -> Optional[timedelta]:
+    """
+    The duration in a free-text "time since onset", or None if it can't be read
+    unambiguously (e.g. "this morning", or a bare number without a unit).
+    """
+    if not text:
+        return None
+    text = text.strip().lower()
+
+    clock = _CLOCK.fullmatch(text)
+    if clock:
+        return timedelta(hours=int(clock.group(1)), minutes=int(clock.group(2)))
+
+    total = timedelta()
+    found = False
+    for number, article, unit in _AMOUNT.findall(text):
+        total += (float(number) if number else 1) * _UNITS[unit]
+        found = True
+    leftover = _FILLER.sub(" ", _AMOUNT.sub(" ", text))
+    if not found or leftover.strip():
+        return None
+    return total
+
+def onset_from_time_since(text: Optional[str], reported_at: datetime) -> Optional[datetime]:
+    """Onset timestamp for a "time since onset" reported at `reported_at`."""
+    elapsed = parse_time_since_onset(text)
+    return reported_at - elapsed if elapsed is not None else None
+
+def hours_since_onset(onset_at: Optional[datetime], at: Optional[datetime]) -> float:
+    """
+    Hours from onset to `at`. An unknown onset (or time) is infinitely long ago,
+    so it can never fall inside a treatment window.
+    """
+    if onset_at is None or at is None:
+        return math.inf
+    return max((at - onset_at).total_seconds(), 0.0) / 3600
@@ -0,0 +1,59 @@
+from datetime import datetime
+from typing import Optional, Callable, Any, List
+from fastapi import Response
+from models import StrokeScan
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class PageParams:
+    """
+    Keyset pagination parameters: `limit` rows with a key greater than `after`.
+    The key of the last row is returned in the X-Next-Cursor header when more
+    rows are available, and is passed back as `after` to get the next page.
+    """
+    def __init__(self, limit: int = DEFAULT_PAGE_SIZE, after: Optional[int] = None):
+        self.limit = min(max(limit, 1), MAX_PAGE_SIZE)
+        self.after = after
+
+class ScanFilters:
+    """Server-side filters on scan status, eligibility and timestamp range."""
+    def __init__(
+        self,
+        status: Optional[str] = None,
+        eligible: Optional[bool] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ):
+        self.status = status
+        self.eligible = eligible
+        self.date_from = date_from
+        self.date_to = date_to
+
+    def criteria(self) -> List[Any]:
+        criteria = []
+        if self.status is not None:
+            criteria.append(StrokeScan.status == self.status)
+        if self.eligible is not None:
+            criteria.append(StrokeScan.eligible == self.eligible)
+        if self.date_from is not None:
+            criteria.append(StrokeScan.timestamp >= self.date_from)
+        if self.date_to is not None:
+            criteria.append(StrokeScan.timestamp <= self.date_to)
+        return criteria
+
+def keyset_page(query, key_column, page: PageParams, response: Response,
+                row_key: Callable[[Any], int] = lambda row: row.id) -> list:
+    """
+    Fetch one page of `query` ordered by `key_column`, seeking past `page.after`
+    with an indexed range condition instead of an OFFSET.
+    """
+    if page.after is not None:
+        query = query.filter(key_column > page.after)
+    rows = query.order_by(key_column).limit(page.limit + 1).all()
+
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = str(row_key(rows[-1]))
+    return rows
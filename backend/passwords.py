@@ -0,0 +1,86 @@
+"""
+Password hashing with the standard library's PBKDF2-HMAC-SHA256.
+
+Stored passwords look like "pbkdf2_sha256$<iterations>$<salt>$<hash>" (salt and
+hash base64-encoded). The cost is PASSWORD_HASH_ITERATIONS: each login takes
+time proportional to it, see benchmark_passwords.py for logins/s per setting.
+A password stored with another cost, or a row from before hashing that still
+holds the plaintext, is rehashed with the current cost on the user's next
+successful login (check_password returns the new hash to store).
+
+Hashing is slow on purpose, so async endpoints run it on hash_executor, a pool
+of PASSWORD_HASH_WORKERS threads, and the event loop keeps serving requests
+during a burst of logins. hashlib releases the GIL while hashing, so the
+threads use separate cores.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+PASSWORD_HASH_ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", "600000"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+
+ALGORITHM = "pbkdf2_sha256"
+SALT_BYTES = 16
+
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+def hash_password(password: str, iterations: Optional[int] = None) -> str:
+    iterations = iterations or PASSWORD_HASH_ITERATIONS
+    salt = os.urandom(SALT_BYTES)
+    return f"{ALGORITHM}${iterations}${_b64(salt)}${_b64(_pbkdf2(password, salt, iterations))}"
+
+def _parse(stored: str) -> Optional[Tuple[int, bytes, bytes]]:
+    """(iterations, salt, hash) of a stored hash; None for anything else (a plaintext row)."""
+    parts = stored.split("$")
+    if len(parts) != 4 or parts[0] != ALGORITHM:
+        return None
+    try:
+        return int(parts[1]), base64.b64decode(parts[2], validate=True), base64.b64decode(parts[3], validate=True)
+    except ValueError:
+        return None
+
+def is_hashed(stored: Optional[str]) -> bool:
+    return stored is not None and _parse(stored) is not None
+
+def verify_password(password: str, stored: Optional[str]) -> bool:
+    if not stored:
+        return False
+    parsed = _parse(stored)
+    if parsed is None:
+        # Plaintext row from before hashing
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    iterations, salt, expected = parsed
+    return hmac.compare_digest(_pbkdf2(password, salt, iterations), expected)
+
+def needs_rehash(stored: Optional[str], iterations: Optional[int] = None) -> bool:
+    parsed = _parse(stored) if stored else None
+    return parsed is None or parsed[0] != (iterations or PASSWORD_HASH_ITERATIONS)
+
+def check_password(password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    (valid, new_hash): new_hash is set when the password was right but is stored
+    in plaintext or with another cost; the caller saves it in place of `stored`.
+    """
+    if not verify_password(password, stored):
+        return False, None
+    return True, hash_password(password) if needs_rehash(stored) else None
+
+async def check_password_async(password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """check_password on hash_executor, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(hash_executor, check_password, password, stored)
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on hash_executor, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(hash_executor, hash_password, password)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Re-evaluate tPA eligibility for every existing scan, e.g. after the rule table
+(eligibility_rules.json) changed.
+
+Scans (with their patient's vitals and onset time) and NIHSS assessments are
+streamed from the database in chunks, merged per patient in Python so every
+scan gets the latest assessment recorded before it, evaluated (with the time
+from onset to the scan) a batch at a time with the vectorized evaluator, and
+only the scans whose outcome changed are written back, with one bulk UPDATE and
+commit per batch. Bulk updates bypass the dashboard counter listener, so the
+counters are rebuilt afterwards.
+
+Reads and writes use separate sessions; with SQLite this relies on WAL mode
+(the default, see database.py) so the writes can commit while the read is open.
+
+Usage:
+    python reevaluate_eligibility.py [--batch-size 1000] [--dry-run]
+
+Also available as a background job: POST /api/eligibility/reevaluate.
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from collections import Counter
+from typing import Callable, Iterator, List, Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal
+from models import Patient, StrokeScan, NIHSSAssessment
+from tpa_eligibility import eligibility_inputs
+from eligibility_batch import check_tpa_eligibility_batch, batch_reasons
+from eligibility_rules import get_rule_set
+from dashboard_counters import rebuild_counters
+from job_queue import job_handler, enqueue
+
+DEFAULT_BATCH_SIZE = 1000
+REEVALUATION_JOB = "eligibility_reevaluation"
+
+_IMAGING_CONFIRMED = re.compile(r"Imaging confirmed: (\w+)")
+
+def scan_rows_query():
+    """Scans with the patient vitals and onset time eligibility needs, in patient and time order."""
+    return (
+        select(
+            StrokeScan.id, StrokeScan.patient_id, StrokeScan.timestamp, StrokeScan.prediction,
+            StrokeScan.doctor_comment, StrokeScan.eligible, StrokeScan.eligibility_result,
+            Patient.age, Patient.onset_at, Patient.inr, Patient.heart_rate, Patient.temperature,
+            Patient.oxygen_saturation, Patient.systolic_bp, Patient.diastolic_bp, Patient.glucose,
+            Patient.platelet_count,
+        )
+        .join(Patient, StrokeScan.patient_id == Patient.id)
+        .order_by(StrokeScan.patient_id, StrokeScan.timestamp.asc().nulls_first(), StrokeScan.id)
+    )
+
+def nihss_rows_query():
+    return (
+        select(NIHSSAssessment.patient_id, NIHSSAssessment.timestamp, NIHSSAssessment.total_score)
+        .order_by(NIHSSAssessment.patient_id, NIHSSAssessment.timestamp.asc().nulls_first(), NIHSSAssessment.id)
+    )
+
+def scans_with_assessment(scan_rows, nihss_rows) -> Iterator[Tuple[object, Optional[object]]]:
+    """
+    Merge the two patient-ordered streams: pair each scan with the patient's
+    latest NIHSS assessment taken at or before the scan (None if there is none).
+    """
+    assessments = iter(nihss_rows)
+    pending = next(assessments, None)
+    patient_id = None
+    latest = None
+
+    for scan in scan_rows:
+        if scan.patient_id != patient_id:
+            patient_id = scan.patient_id
+            latest = None
+        while pending is not None and (
+            pending.patient_id < patient_id
+            or (pending.patient_id == patient_id
+                and (pending.timestamp is None or scan.timestamp is None or pending.timestamp <= scan.timestamp))
+        ):
+            if pending.patient_id == patient_id:
+                latest = pending
+            pending = next(assessments, None)
+        yield scan, latest
+
+def imaging_confirmed_for(scan) -> Optional[str]:
+    """Imaging confirmation recorded with the scan at upload, or None if it wasn't recorded."""
+    match = _IMAGING_CONFIRMED.search(scan.doctor_comment or "")
+    if match:
+        return match.group(1)
+    if scan.prediction == "Ischemic Stroke":
+        return "yes"
+    if scan.prediction == "Not Confirmed":
+        return "no"
+    return None
+
+def _evaluate_batch(batch: List[Tuple[object, dict]], stats: dict) -> List[dict]:
+    """Evaluate a batch and return the bulk-update parameters for scans whose outcome changed."""
+    fields = get_rule_set().fields
+    columns = {field: [inputs[field] for _, inputs in batch] for field in fields}
+    eligible, first_failing = check_tpa_eligibility_batch(columns)
+    reasons = batch_reasons(first_failing)
+
+    changes = []
+    for (scan, _), new_eligible, new_reason in zip(batch, eligible.tolist(), reasons):
+        if scan.eligible == new_eligible and scan.eligibility_result == new_reason:
+            stats["unchanged"] += 1
+            continue
+        if scan.eligible is None:
+            stats["previously_unevaluated"] += 1
+        elif scan.eligible != new_eligible:
+            stats["became_eligible" if new_eligible else "became_ineligible"] += 1
+        else:
+            stats["reason_changed"] += 1
+        stats["new_reasons"][new_reason] += 1
+        changes.append({"id": scan.id, "eligible": new_eligible, "eligibility_result": new_reason})
+    stats["evaluated"] += len(batch)
+    return changes
+
+def reevaluate_eligibility(read_db: Session, write_db: Session, batch_size: int = DEFAULT_BATCH_SIZE,
+                           dry_run: bool = False, progress: Optional[Callable[[dict], None]] = None) -> dict:
+    started = time.perf_counter()
+    stats = {
+        "rules_version": get_rule_set().version,
+        "dry_run": dry_run,
+        "scans": 0,
+        "evaluated": 0,
+        "skipped_no_nihss": 0,
+        "skipped_unknown_imaging": 0,
+        "unchanged": 0,
+        "changed": 0,
+        "became_eligible": 0,
+        "became_ineligible": 0,
+        "reason_changed": 0,
+        "previously_unevaluated": 0,
+        "new_reasons": Counter(),
+        "batches": 0,
+    }
+
+    def flush(batch):
+        changes = _evaluate_batch(batch, stats)
+        stats["batches"] += 1
+        stats["changed"] += len(changes)
+        if changes and not dry_run:
+            # ORM bulk UPDATE by primary key: one executemany per batch, one transaction per batch
+            write_db.execute(update(StrokeScan), changes)
+            write_db.commit()
+        if progress:
+            progress(stats)
+
+    scan_rows = read_db.execute(scan_rows_query().execution_options(yield_per=batch_size))
+    nihss_rows = read_db.execute(nihss_rows_query().execution_options(yield_per=batch_size))
+    batch: List[Tuple[object, dict]] = []
+    for scan, assessment in scans_with_assessment(scan_rows, nihss_rows):
+        stats["scans"] += 1
+        imaging_confirmed = imaging_confirmed_for(scan)
+        if assessment is None or assessment.total_score is None:
+            stats["skipped_no_nihss"] += 1
+            continue
+        if imaging_confirmed is None:
+            stats["skipped_unknown_imaging"] += 1
+            continue
+        batch.append((scan, eligibility_inputs(scan, assessment.total_score, imaging_confirmed, at=scan.timestamp)))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    read_db.rollback()  # end the read transaction
+
+    if stats["changed"] and not dry_run:
+        rebuild_counters(write_db)
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    stats["scans_per_second"] = round(stats["scans"] / stats["seconds"], 1) if stats["seconds"] else None
+    stats["new_reasons"] = dict(stats["new_reasons"].most_common())
+    return stats
+
+@job_handler(REEVALUATION_JOB)
+def run_reevaluation_job(payload: dict) -> dict:
+    with SessionLocal() as read_db, SessionLocal() as write_db:
+        return reevaluate_eligibility(
+            read_db, write_db,
+            batch_size=payload.get("batch_size", DEFAULT_BATCH_SIZE),
+            dry_run=payload.get("dry_run", False)
+        )
+
+def enqueue_reevaluation(db: Session, batch_size: int = DEFAULT_BATCH_SIZE, dry_run: bool = False):
+    # A re-run processes everything again, so a failure is better surfaced than retried
+    return enqueue(db, REEVALUATION_JOB, {"batch_size": batch_size, "dry_run": dry_run}, max_attempts=1)
+
+def print_report(stats: dict):
+    print(f"Rules version: {stats['rules_version']}{' (dry run, nothing written)' if stats['dry_run'] else ''}")
+    print(f"Scans read: {stats['scans']} in {stats['seconds']}s ({stats['scans_per_second']} scans/s, {stats['batches']} batches)")
+    print(f"Evaluated: {stats['evaluated']}  (skipped: {stats['skipped_no_nihss']} without NIHSS, "
+          f"{stats['skipped_unknown_imaging']} without recorded imaging confirmation)")
+    print(f"Unchanged: {stats['unchanged']}")
+    print(f"Changed: {stats['changed']}")
+    print(f"  - became eligible: {stats['became_eligible']}")
+    print(f"  - became not eligible: {stats['became_ineligible']}")
+    print(f"  - same outcome, different reason: {stats['reason_changed']}")
+    print(f"  - not evaluated before: {stats['previously_unevaluated']}")
+    for reason, count in stats["new_reasons"].items():
+        print(f"    {count:>6}  {reason}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-evaluate tPA eligibility for all scans")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args()
+
+    def show_progress(stats):
+        print(f"  ... {stats['scans']} scans read, {stats['changed']} changed", end="\r", flush=True)
+
+    with SessionLocal() as read_db, SessionLocal() as write_db:
+        stats = reevaluate_eligibility(read_db, write_db, args.batch_size, args.dry_run, show_progress)
+    print()
+    print_report(stats)
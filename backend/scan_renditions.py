@@ -0,0 +1,90 @@
+"""
+Downscaled renditions of scan images.
+
+Each stored scan gets a thumbnail and a preview JPEG next to the original
+("full") in the object storage, under renditions/<size>/<source key>.jpg. They
+are generated only by the background job queued after an upload (or by
+`python scan_storage.py renditions` for scans uploaded before renditions
+existed), never while serving a request: until a rendition exists the original
+is served in its place.
+"""
+
+import logging
+import os
+import tempfile
+from typing import Dict, Optional
+from object_storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+FULL = "full"
+# Longest edge in pixels
+RENDITION_SIZES: Dict[str, int] = {
+    "thumbnail": int(os.getenv("THUMBNAIL_SIZE", "256")),
+    "preview": int(os.getenv("PREVIEW_SIZE", "1024")),
+}
+JPEG_QUALITY = int(os.getenv("RENDITION_JPEG_QUALITY", "82"))
+
+def rendition_key(source_key: str, size: str) -> str:
+    return f"renditions/{size}/{os.path.splitext(source_key)[0]}.jpg"
+
+def _encode(image, path: str):
+    image.save(path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+def generate_renditions(source_key: str) -> Dict[str, str]:
+    """
+    Create any missing renditions of the object at `source_key` and return
+    their keys. The original is decoded once, largest rendition first, and each
+    smaller one is scaled down from the previous. Images Pillow can't decode
+    are skipped (their full image is served instead).
+    """
+    from PIL import Image, ImageOps
+
+    storage = get_storage()
+    keys = {size: rendition_key(source_key, size) for size in RENDITION_SIZES}
+    missing = [size for size, key in keys.items() if not storage.exists(key)]
+    if not missing:
+        return keys
+
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as original:
+        for chunk in storage.iter_chunks(source_key):
+            original.write(chunk)
+        original.seek(0)
+
+        try:
+            image = Image.open(original)
+            largest = max(RENDITION_SIZES[size] for size in missing)
+            # For JPEGs, let the decoder downscale by a power of two while decoding (much cheaper than a full decode)
+            image.draft(image.mode if image.mode in ("L", "RGB") else "RGB", (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("L", "RGB"):
+                image = image.convert("RGB")
+        except Exception as e:
+            logger.warning("Cannot create renditions of %s: %s", source_key, e)
+            return {}
+
+        for size in sorted(missing, key=lambda size: -RENDITION_SIZES[size]):
+            edge = RENDITION_SIZES[size]
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            fd, path = tempfile.mkstemp(suffix=".jpg")
+            os.close(fd)
+            try:
+                _encode(image, path)
+                storage.put_file(keys[size], path)
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    return keys
+
+def rendition_for(source_key: str, size: str) -> Optional[str]:
+    """Key of the requested rendition if it has been generated; None means serve the original."""
+    if size == FULL:
+        return None
+    key = rendition_key(source_key, size)
+    return key if get_storage().exists(key) else None
+
+def delete_renditions(source_key: str):
+    storage = get_storage()
+    for size in RENDITION_SIZES:
+        storage.delete(rendition_key(source_key, size))
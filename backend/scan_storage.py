@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Content-addressed storage for uploaded scans.
+
+Every upload is hashed while it streams to disk and stored once under its SHA-256
+digest, under sharded keys (blobs/ab/cd/<sha256>.<ext>) in the configured object
+storage (see object_storage.py), so the same image uploaded twice takes the space
+of one. StrokeScan.image_path points at the blob; the scan_blobs table counts
+how many scans reference each blob and is kept up to date by a flush listener,
+the same way as the dashboard counters. The listener only touches the database;
+blob sizes are filled in by garbage collection, which lists the stored objects.
+
+Usage:
+    python scan_storage.py gc [--grace-hours 24]   # delete blobs no scan references
+    python scan_storage.py renditions              # queue renditions for scans that have none
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+from fastapi import UploadFile
+from sqlalchemy import event, func, update, insert, delete, bindparam
+from sqlalchemy.orm import Session, attributes
+from starlette.concurrency import run_in_threadpool
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import StrokeScan, ScanBlob, Job
+from streaming_upload import stream_to_temp_file, MAX_UPLOAD_BYTES
+from object_storage import get_storage, object_response, UPLOAD_DIR
+from scan_renditions import FULL, RENDITION_SIZES, rendition_key, rendition_for, generate_renditions, delete_renditions
+from job_queue import job_handler, enqueue
+
+# Uploads are staged on local disk while they are hashed, then handed to the object storage
+INCOMING_DIR = os.path.abspath(os.getenv("UPLOAD_TMP_DIR", os.path.join(UPLOAD_DIR, ".incoming")))
+# image_path of a stored scan is "uploads/<key>"; with a leading "/" it is the URL serving it
+IMAGE_PATH_PREFIX = "uploads/"
+BLOB_KEY_PREFIX = "blobs/"
+BLOB_PATH_PREFIX = IMAGE_PATH_PREFIX + BLOB_KEY_PREFIX
+
+_EXTENSION = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+class StoredScan(NamedTuple):
+    image_path: str
+    sha256: str
+    size: int
+    deduplicated: bool
+
+def blob_key(sha256: str, extension: str = "") -> str:
+    return f"{BLOB_KEY_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+def image_path_for_key(key: str) -> str:
+    return IMAGE_PATH_PREFIX + key
+
+def storage_key(image_path: str) -> str:
+    """Object storage key of the file an image_path refers to."""
+    path = image_path.replace("\\", "/")
+    # Scans saved before content addressing may be stored as "../uploads/..." or "/uploads/..."
+    for prefix in ("../", "/"):
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+    return path[len(IMAGE_PATH_PREFIX):] if path.startswith(IMAGE_PATH_PREFIX) else path
+
+def object_keys(image_path: str) -> List[str]:
+    """Storage keys of a scan's image: the original and each of its renditions."""
+    source_key = storage_key(image_path)
+    return [source_key] + [rendition_key(source_key, size) for size in RENDITION_SIZES]
+
+def patient_owns_object(db: Session, patient_id: Optional[int], key: str) -> bool:
+    """Whether `key` is the image, or a rendition of it, of one of the patient's scans."""
+    if patient_id is None:
+        return False
+    image_paths = db.query(StrokeScan.image_path).filter(
+        StrokeScan.patient_id == patient_id, StrokeScan.image_path.isnot(None)
+    )
+    return any(key in object_keys(image_path) for (image_path,) in image_paths)
+
+def is_blob_path(image_path: Optional[str]) -> bool:
+    return bool(image_path) and image_path.startswith(BLOB_PATH_PREFIX)
+
+def _extension(filename: Optional[str]) -> str:
+    # Kept so the static file server sends the right content type
+    extension = os.path.splitext(filename or "")[1].lower()
+    return extension if _EXTENSION.match(extension) else ""
+
+def _commit_blob(temp_path: str, key: str) -> bool:
+    """Move a finished upload into storage; returns False if the blob was already stored."""
+    storage = get_storage()
+    if storage.exists(key):
+        os.remove(temp_path)
+        # Freshen the modification time so garbage collection treats the blob as in use again
+        storage.touch(key)
+        return False
+    storage.put_file(key, temp_path)
+    return True
+
+async def store_scan(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredScan:
+    """
+    Stream an upload into the blob store and return the image_path to save on
+    the StrokeScan. Identical content resolves to the existing blob.
+    """
+    saved = await stream_to_temp_file(upload, INCOMING_DIR, max_bytes)
+    key = blob_key(saved.sha256, _extension(upload.filename))
+    try:
+        created = await run_in_threadpool(_commit_blob, saved.path, key)
+    finally:
+        if os.path.exists(saved.path):
+            os.remove(saved.path)
+    return StoredScan(image_path=image_path_for_key(key), sha256=saved.sha256, size=saved.size, deduplicated=not created)
+
+def serve_scan_object(key: str):
+    """Response for GET /uploads/<key>; blobs never change, so clients may cache them indefinitely."""
+    immutable = key.startswith(BLOB_KEY_PREFIX) or (key.startswith("renditions/") and f"/{BLOB_KEY_PREFIX}" in key)
+    return object_response(key, "public, max-age=31536000, immutable" if immutable else None)
+
+def serve_scan_image(image_path: str, size: str = FULL):
+    """Response with the requested rendition of a scan image, falling back to the original."""
+    source_key = storage_key(image_path)
+    return serve_scan_object(rendition_for(source_key, size) or source_key)
+
+RENDITIONS_JOB = "scan_renditions"
+
+@job_handler(RENDITIONS_JOB)
+def generate_scan_renditions(payload: dict) -> dict:
+    """Job enqueued after an upload; payload {"image_path": ...}."""
+    return {"renditions": generate_renditions(storage_key(payload["image_path"]))}
+
+def enqueue_scan_processing(db, image_path: str) -> Job:
+    """Queue the post-upload work for a scan (committed with the caller's transaction)."""
+    return enqueue(db, RENDITIONS_JOB, {"image_path": image_path})
+
+def enqueue_missing_renditions(db: Session) -> int:
+    """Queue the renditions job for every stored scan image missing one; returns how many were queued."""
+    storage = get_storage()
+    queued = 0
+    image_paths = db.query(StrokeScan.image_path).filter(StrokeScan.image_path.isnot(None)).distinct()
+    for (image_path,) in image_paths.all():
+        source_key = storage_key(image_path)
+        if not storage.exists(source_key):
+            continue
+        if all(storage.exists(rendition_key(source_key, size)) for size in RENDITION_SIZES):
+            continue
+        enqueue_scan_processing(db, image_path)
+        queued += 1
+    db.commit()
+    return queued
+
+# --- reference counting ---------------------------------------------------
+
+def _previous_image_path(obj) -> Optional[str]:
+    history = attributes.get_history(obj, "image_path")
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return obj.image_path
+
+def _collect_reference_deltas(session: Session) -> Dict[str, int]:
+    deltas: Dict[str, int] = {}
+
+    def add(image_path, amount):
+        if is_blob_path(image_path):
+            deltas[image_path] = deltas.get(image_path, 0) + amount
+
+    for obj in session.new:
+        if isinstance(obj, StrokeScan):
+            add(obj.image_path, 1)
+    for obj in session.dirty:
+        if isinstance(obj, StrokeScan) and attributes.get_history(obj, "image_path").has_changes():
+            add(_previous_image_path(obj), -1)
+            add(obj.image_path, 1)
+    for obj in session.deleted:
+        if isinstance(obj, StrokeScan):
+            add(_previous_image_path(obj), -1)
+
+    return {path: amount for path, amount in deltas.items() if amount}
+
+def apply_reference_deltas(connection, deltas: Dict[str, int]):
+    now = datetime.now()
+    table = ScanBlob.__table__
+    for image_path, amount in sorted(deltas.items()):
+        result = connection.execute(
+            update(table)
+            .where(table.c.path == image_path)
+            .values(ref_count=table.c.ref_count + amount, updated_at=now)
+        )
+        if result.rowcount == 0:
+            sha256 = os.path.splitext(image_path.rsplit("/", 1)[-1])[0]
+            # size stays NULL until collect_garbage: no storage calls inside the flush
+            connection.execute(insert(table).values(
+                path=image_path, sha256=sha256, ref_count=max(amount, 0), created_at=now, updated_at=now
+            ))
+
+@event.listens_for(Session, "after_flush")
+def _update_blob_references_after_flush(session: Session, flush_context):
+    deltas = _collect_reference_deltas(session)
+    if deltas:
+        apply_reference_deltas(session.connection(), deltas)
+
+# Load the old path whenever image_path is assigned, so the blob it pointed at
+# can be released even if the attribute had been expired.
+event.listen(StrokeScan.image_path, "set", lambda target, value, oldvalue, initiator: value,
+             active_history=True, retval=True)
+
+# --- garbage collection ---------------------------------------------------
+
+def recount_references(db: Session) -> int:
+    """Reset every blob's ref_count from strokescans; returns how many were wrong."""
+    actual = dict(
+        db.query(StrokeScan.image_path, func.count(StrokeScan.id))
+        .filter(StrokeScan.image_path.like(f"{BLOB_PATH_PREFIX}%"))
+        .group_by(StrokeScan.image_path)
+        .all()
+    )
+    stored = {blob.path: blob for blob in db.query(ScanBlob).all()}
+    now = datetime.now()
+    fixed = 0
+
+    for image_path, blob in stored.items():
+        count = actual.get(image_path, 0)
+        if blob.ref_count != count:
+            blob.ref_count = count
+            blob.updated_at = now
+            fixed += 1
+    for image_path, count in actual.items():
+        if image_path not in stored:
+            sha256 = os.path.splitext(image_path.rsplit("/", 1)[-1])[0]
+            db.add(ScanBlob(path=image_path, sha256=sha256, ref_count=count, created_at=now, updated_at=now))
+            fixed += 1
+
+    db.commit()
+    return fixed
+
+def collect_garbage(db: Session, grace: timedelta = timedelta(hours=24)) -> dict:
+    """
+    Delete blobs that no scan references. Objects younger than `grace` are left
+    alone: an upload is stored before the scan that references it is committed.
+    Also records the size of blobs stored since the last run.
+    """
+    storage = get_storage()
+    fixed = recount_references(db)
+    cutoff = datetime.now() - grace
+    cutoff_ts = time.time() - grace.total_seconds()
+    removed_objects = 0
+    freed_bytes = 0
+
+    candidates = {blob.path for blob in db.query(ScanBlob).filter(ScanBlob.ref_count <= 0, ScanBlob.updated_at < cutoff)}
+    known = {path for (path,) in db.query(ScanBlob.path).all()}
+    unsized = {path for (path,) in db.query(ScanBlob.path).filter(ScanBlob.size.is_(None))}
+    listed = set()
+    sizes = []
+    unreferenced = []
+    for stored in storage.list_objects(BLOB_KEY_PREFIX):
+        image_path = image_path_for_key(stored.key)
+        listed.add(image_path)
+        if image_path in unsized:
+            sizes.append({"blob_path": image_path, "blob_size": stored.size})
+        if stored.modified > cutoff_ts:
+            continue  # just uploaded (again); its scan may not be committed yet
+        if image_path in candidates or image_path not in known:
+            # Not referenced, or stored for a scan that was never saved
+            storage.delete(stored.key)
+            delete_renditions(stored.key)
+            removed_objects += 1
+            freed_bytes += stored.size
+            if image_path in candidates:
+                unreferenced.append(image_path)
+    # Rows whose object is already gone
+    unreferenced += [path for path in candidates if path not in listed]
+
+    if sizes:
+        table = ScanBlob.__table__
+        db.execute(update(table).where(table.c.path == bindparam("blob_path")).values(size=bindparam("blob_size")),
+                   sizes)
+    if unreferenced:
+        db.execute(delete(ScanBlob).where(ScanBlob.path.in_(unreferenced)))
+    db.commit()
+
+    # Abandoned staging files from interrupted uploads
+    if os.path.isdir(INCOMING_DIR):
+        for filename in os.listdir(INCOMING_DIR):
+            file_path = os.path.join(INCOMING_DIR, filename)
+            if os.path.getmtime(file_path) < cutoff_ts:
+                os.remove(file_path)
+
+    return {"recounted": fixed, "removed_rows": len(unreferenced), "removed_objects": removed_objects, "freed_bytes": freed_bytes}
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Scan blob storage maintenance")
+    parser.add_argument("command", choices=["gc", "renditions"])
+    parser.add_argument("--grace-hours", type=float, default=24)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "renditions":
+            print(f"Rendition jobs queued: {enqueue_missing_renditions(db)}")
+        else:
+            result = collect_garbage(db, timedelta(hours=args.grace_hours))
+            print(f"Reference counts corrected: {result['recounted']}")
+            print(f"Unreferenced blobs removed: {result['removed_rows']} rows, {result['removed_objects']} objects")
+            print(f"Space freed: {result['freed_bytes'] / (1024 * 1024):.1f} MB")
+    finally:
+        db.close()
@@ -0,0 +1,345 @@
+"""
+Login sessions, behind a SessionStore interface so that sessions can outlive a
+restart and be shared by several uvicorn workers:
+
+    SESSION_STORE=memory    in-process, bounded (LRU) -- one worker only
+    SESSION_STORE=database  the sessions table of DATABASE_URL (SQLite, PostgreSQL)
+    SESSION_STORE=redis     a Redis server at REDIS_URL
+    SESSION_STORE=signed    no server-side sessions: the cookie itself carries the
+                            user id, role and expiry, HMAC-signed with SESSION_SECRET
+
+Every session expires SESSION_TTL_SECONDS after login (the lifetime of the
+session cookie). Expired sessions are never returned; a SessionSweeper thread,
+started with the app, deletes them every SESSION_SWEEP_SECONDS so the store
+stays flat. Redis expires keys by itself.
+
+Signed cookies are verified without any lookup, so they work on any number of
+workers and nodes that share the secret. Logging out adds the cookie's id to a
+revocation list (the revoked_sessions table, until the cookie would have
+expired anyway); each worker checks an in-memory copy that the sweeper
+refreshes every SESSION_REVOCATION_SYNC_SECONDS, so a logout reaches the other
+workers within that delay. SESSION_SECRET may list several comma-separated
+secrets: the first signs, all verify, which allows rotating it.
+"""
+
+import abc
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import sessionmaker
+
+from database import SessionLocal
+from models import UserSession, RevokedSession
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_SWEEP_SECONDS = float(os.getenv("SESSION_SWEEP_SECONDS", "300"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+SESSION_REVOCATION_SYNC_SECONDS = float(os.getenv("SESSION_REVOCATION_SYNC_SECONDS", "5"))
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(32)
+
+class SessionStore(abc.ABC):
+    """Interface implemented by every session store."""
+
+    ttl_seconds: int
+    sweep_seconds: float = SESSION_SWEEP_SECONDS  # how often the SessionSweeper calls sweep()
+
+    @abc.abstractmethod
+    def create(self, data: dict) -> str:
+        """Store a new session holding `data`; returns its id."""
+
+    @abc.abstractmethod
+    def get(self, session_id: str) -> Optional[dict]:
+        """The session's data, or None if it doesn't exist or has expired."""
+
+    @abc.abstractmethod
+    def delete(self, session_id: str):
+        """Remove the session, if it exists (logging out)."""
+
+    @abc.abstractmethod
+    def sweep(self) -> int:
+        """Delete expired sessions; returns how many were deleted."""
+
+    @abc.abstractmethod
+    def count(self) -> int:
+        """Number of stored sessions, including expired ones not yet swept."""
+
+class MemorySessionStore(SessionStore):
+    """
+    Sessions in a dict ordered by last use. When full, the least recently used
+    session is dropped (its user has to log in again).
+    """
+
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (expires, data)
+        self._lock = threading.Lock()
+
+    def create(self, data: dict) -> str:
+        session_id = new_session_id()
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic() + self.ttl_seconds, dict(data))
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+        return session_id
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires <= time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return dict(data)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [session_id for session_id, (expires, _) in self._sessions.items() if expires <= now]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+class DatabaseSessionStore(SessionStore):
+    """Sessions in the sessions table, shared by every worker using the same database."""
+
+    def __init__(self, session_factory: sessionmaker = SessionLocal, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+
+    def create(self, data: dict) -> str:
+        session_id = new_session_id()
+        now = datetime.now()
+        with self.session_factory() as db:
+            db.add(UserSession(
+                id=session_id,
+                user_id=data.get("user_id"),
+                data=json.dumps(data),
+                expires_at=now + timedelta(seconds=self.ttl_seconds),
+                created_at=now
+            ))
+            db.commit()
+        return session_id
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self.session_factory() as db:
+            data = db.execute(
+                select(UserSession.data)
+                .where(UserSession.id == session_id, UserSession.expires_at > datetime.now())
+            ).scalar()
+        return json.loads(data) if data is not None else None
+
+    def delete(self, session_id: str):
+        with self.session_factory() as db:
+            db.execute(delete(UserSession).where(UserSession.id == session_id))
+            db.commit()
+
+    def sweep(self) -> int:
+        with self.session_factory() as db:
+            deleted = db.execute(delete(UserSession).where(UserSession.expires_at <= datetime.now())).rowcount
+            db.commit()
+        return deleted
+
+    def count(self) -> int:
+        with self.session_factory() as db:
+            return db.execute(select(func.count()).select_from(UserSession)).scalar()
+
+class RedisSessionStore(SessionStore):
+    """Sessions as Redis keys with a TTL, shared by every worker and node using the server."""
+
+    KEY_PREFIX = "session:"
+
+    def __init__(self, url: str = REDIS_URL, ttl_seconds: int = SESSION_TTL_SECONDS, client=None):
+        if client is None:
+            import redis  # only needed for this store
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+
+    def create(self, data: dict) -> str:
+        session_id = new_session_id()
+        self.client.set(self.KEY_PREFIX + session_id, json.dumps(data), ex=self.ttl_seconds)
+        return session_id
+
+    def get(self, session_id: str) -> Optional[dict]:
+        data = self.client.get(self.KEY_PREFIX + session_id)
+        return json.loads(data) if data is not None else None
+
+    def delete(self, session_id: str):
+        self.client.delete(self.KEY_PREFIX + session_id)
+
+    def sweep(self) -> int:
+        return 0  # Redis deletes expired keys itself
+
+    def count(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.KEY_PREFIX + "*"))
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+class SignedSessionStore(SessionStore):
+    """
+    Stateless sessions: the session id is "<payload>.<signature>", where the
+    payload holds the user id, username, role, expiry and a random token id.
+    """
+
+    def __init__(self, secret_keys: Sequence[str], ttl_seconds: int = SESSION_TTL_SECONDS,
+                 session_factory: sessionmaker = SessionLocal,
+                 sync_seconds: float = SESSION_REVOCATION_SYNC_SECONDS):
+        keys = [secret.encode() for secret in secret_keys if secret]
+        if not keys:
+            raise RuntimeError("SESSION_STORE=signed requires SESSION_SECRET")
+        self._signing_key = keys[0]
+        self._keys = keys
+        self.ttl_seconds = ttl_seconds
+        self.session_factory = session_factory
+        self.sweep_seconds = sync_seconds
+        self._revoked: Dict[str, float] = {}  # token id -> expiry (POSIX time); replaced, never mutated
+
+    def _sign(self, payload: str, key: bytes) -> str:
+        return _b64encode(hmac.new(key, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def _claims(self, session_id: str) -> Optional[dict]:
+        """The verified, unexpired claims of a session id, or None."""
+        payload, _, signature = session_id.partition(".")
+        if not payload or not signature:
+            return None
+        try:
+            if not any(hmac.compare_digest(signature, self._sign(payload, key)) for key in self._keys):
+                return None
+            claims = json.loads(_b64decode(payload))
+        except (ValueError, TypeError):  # not ASCII, not base64 or not JSON
+            return None
+        if not isinstance(claims, dict) or not isinstance(claims.get("exp"), (int, float)):
+            return None
+        if claims["exp"] <= time.time():
+            return None
+        return claims
+
+    def create(self, data: dict) -> str:
+        claims = {
+            "uid": data.get("user_id"),
+            "usr": data.get("username"),
+            "rol": data.get("role"),
+            "exp": int(time.time()) + self.ttl_seconds,
+            "jti": secrets.token_urlsafe(12),
+        }
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{payload}.{self._sign(payload, self._signing_key)}"
+
+    def get(self, session_id: str) -> Optional[dict]:
+        claims = self._claims(session_id)
+        if claims is None or claims.get("jti") in self._revoked:
+            return None
+        return {"user_id": claims["uid"], "username": claims["usr"], "role": claims["rol"]}
+
+    def delete(self, session_id: str):
+        """Revoke the session (logout): it stays on the revocation list until it would have expired."""
+        claims = self._claims(session_id)
+        if claims is None or not claims.get("jti"):
+            return
+        self._revoked = {**self._revoked, claims["jti"]: claims["exp"]}
+        with self.session_factory() as db:
+            db.merge(RevokedSession(token_id=claims["jti"], expires_at=datetime.fromtimestamp(claims["exp"])))
+            db.commit()
+
+    def sweep(self) -> int:
+        """Forget revocations of expired cookies and pick up the other workers' logouts."""
+        now = datetime.now()
+        with self.session_factory() as db:
+            deleted = db.execute(delete(RevokedSession).where(RevokedSession.expires_at <= now)).rowcount
+            db.commit()
+            revoked = db.execute(select(RevokedSession.token_id, RevokedSession.expires_at)).all()
+        # Keep this worker's own revocations that may have committed after the select
+        now_ts = time.time()
+        own = {token_id: exp for token_id, exp in self._revoked.items() if exp > now_ts}
+        self._revoked = {**own, **{token_id: expires_at.timestamp() for token_id, expires_at in revoked}}
+        return deleted
+
+    def count(self) -> int:
+        """Signed sessions aren't stored; this is the size of the revocation list."""
+        return len(self._revoked)
+
+def create_session_store(backend: str = SESSION_STORE) -> SessionStore:
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "database":
+        return DatabaseSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    if backend == "signed":
+        return SignedSessionStore(SESSION_SECRET.split(","))
+    raise RuntimeError(f"Unknown SESSION_STORE: {backend}")
+
+session_store: SessionStore = create_session_store()
+
+class SessionSweeper:
+    """
+    Thread deleting expired sessions periodically; started and stopped with the
+    app. Also runs the sweep() of other expiring stores (see llm_cache.py).
+    """
+
+    def __init__(self, store: SessionStore = session_store, interval_seconds: Optional[float] = None,
+                 what: str = "sessions"):
+        self.store = store
+        self.interval_seconds = interval_seconds if interval_seconds is not None else store.sweep_seconds
+        self.what = what
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.what.replace(' ', '-')}-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        # A first sweep at start-up also loads the revocation list of signed sessions
+        while True:
+            try:
+                swept = self.store.sweep()
+                if swept:
+                    logger.info("Swept %d expired %s", swept, self.what)
+            except Exception:
+                logger.exception("Sweep of expired %s failed", self.what)
+            if self._stopping.wait(self.interval_seconds):
+                break
+
+session_sweeper = SessionSweeper()
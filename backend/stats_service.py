@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+from sqlalchemy import func, case, distinct
+from sqlalchemy.orm import Session
+from models import Patient, StrokeScan
+from dashboard_counters import (
+    TOTAL_PATIENTS, TOTAL_SCANS, ELIGIBLE_SCANS, NOT_ELIGIBLE_SCANS,
+    status_key, scans_day_key, reviewed_day_key, read_counters, counters_initialized
+)
+
+RECENT_ACTIVITY_DAYS = 7
+
+def start_of_today(now: Optional[datetime] = None) -> datetime:
+    now = now or datetime.now()
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+def compute_scan_aggregates(db: Session, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Compute every dashboard figure in a single grouped pass over strokescans
+    (conditional aggregates) plus one patient count.
+    """
+    today = start_of_today(now)
+    recent_since = today - timedelta(days=RECENT_ACTIVITY_DAYS)
+
+    row = db.query(
+        func.count(StrokeScan.id),
+        _count_if(StrokeScan.eligible == True),
+        _count_if(StrokeScan.eligible == False),
+        _count_if(StrokeScan.status == "ready_for_review"),
+        _count_if((StrokeScan.status == "reviewed") & (StrokeScan.timestamp >= today)),
+        _count_if(StrokeScan.timestamp >= recent_since),
+        func.count(distinct(case((StrokeScan.timestamp >= recent_since, StrokeScan.patient_id)))),
+    ).one()
+
+    total_patients = db.query(func.count(Patient.id)).scalar()
+
+    return {
+        "total_patients": total_patients or 0,
+        "total_scans": row[0] or 0,
+        "eligible_scans": int(row[1]),
+        "not_eligible_scans": int(row[2]),
+        "ready_for_review_scans": int(row[3]),
+        "reviewed_today": int(row[4]),
+        "recent_scans": int(row[5]),
+        "recent_patients": row[6] or 0,
+    }
+
+def counter_scan_aggregates(db: Session, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Same figures as compute_scan_aggregates, read from the dashboard_counters
+    table. Only the distinct recent-patient count still touches strokescans,
+    as a range over the last week's timestamps.
+    """
+    today = start_of_today(now)
+    recent_since = today - timedelta(days=RECENT_ACTIVITY_DAYS)
+    recent_day_keys = [scans_day_key((recent_since + timedelta(days=i)).date()) for i in range(RECENT_ACTIVITY_DAYS + 1)]
+    ready_key = status_key("ready_for_review")
+    reviewed_key = reviewed_day_key(today.date())
+
+    counters = read_counters(db, [
+        TOTAL_PATIENTS, TOTAL_SCANS, ELIGIBLE_SCANS, NOT_ELIGIBLE_SCANS, ready_key, reviewed_key
+    ] + recent_day_keys)
+
+    recent_patients = db.query(func.count(distinct(StrokeScan.patient_id))).filter(
+        StrokeScan.timestamp >= recent_since
+    ).scalar()
+
+    return {
+        "total_patients": counters[TOTAL_PATIENTS],
+        "total_scans": counters[TOTAL_SCANS],
+        "eligible_scans": counters[ELIGIBLE_SCANS],
+        "not_eligible_scans": counters[NOT_ELIGIBLE_SCANS],
+        "ready_for_review_scans": counters[ready_key],
+        "reviewed_today": counters[reviewed_key],
+        "recent_scans": sum(counters[key] for key in recent_day_keys),
+        "recent_patients": recent_patients or 0,
+    }
+
+def dashboard_aggregates(db: Session, now: Optional[datetime] = None) -> Dict[str, Any]:
+    # Fall back to the aggregate query until the counters have been built
+    if counters_initialized(db):
+        return counter_scan_aggregates(db, now)
+    return compute_scan_aggregates(db, now)
+
+def technician_dashboard_stats(db: Session, now: Optional[datetime] = None) -> Dict[str, Any]:
+    stats = dashboard_aggregates(db, now)
+    return {
+        "total_patients": stats["total_patients"],
+        "total_scans": stats["total_scans"],
+        "eligible_scans": stats["eligible_scans"],
+        "not_eligible_scans": stats["not_eligible_scans"],
+        "sent_to_doctor_scans": stats["ready_for_review_scans"],
+        "recent_patients": stats["recent_patients"],
+        "recent_scans": stats["recent_scans"]
+    }
+
+def physician_dashboard_stats(db: Session, now: Optional[datetime] = None) -> Dict[str, Any]:
+    stats = dashboard_aggregates(db, now)
+    return {
+        "new_cases": stats["ready_for_review_scans"],
+        "reviewed_today": stats["reviewed_today"],
+        "eligible_for_tpa": stats["eligible_scans"],
+        "not_eligible": stats["not_eligible_scans"]
+    }
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import tempfile
+from typing import NamedTuple
+from fastapi import UploadFile, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "512")) * 1024 * 1024
+
+class SavedUpload(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+
+def _write_chunk(out, digest, chunk: bytes):
+    digest.update(chunk)
+    out.write(chunk)
+
+def _finish(out):
+    out.flush()
+    os.fsync(out.fileno())
+    out.close()
+
+async def stream_to_temp_file(upload: UploadFile, directory: str, max_bytes: int = MAX_UPLOAD_BYTES) -> SavedUpload:
+    """
+    Stream an uploaded file into a new temporary file in `directory` in
+    fixed-size chunks, hashing it on the way. Disk writes run in the thread
+    pool so the event loop keeps serving other requests, and memory use stays
+    at one chunk regardless of file size. The caller renames the returned file
+    into place (an atomic os.replace within the same directory tree) or deletes it.
+    Raises HTTP 413 if the upload exceeds `max_bytes`.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large (limit {max_bytes // (1024 * 1024)} MB)")
+
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+    out = os.fdopen(fd, "wb")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File too large (limit {max_bytes // (1024 * 1024)} MB)")
+            await run_in_threadpool(_write_chunk, out, digest, chunk)
+
+        await run_in_threadpool(_finish, out)
+    except BaseException:
+        out.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return SavedUpload(path=temp_path, size=size, sha256=digest.hexdigest())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Tests for the endpoints that run on an AsyncSession (get_async_db): saving a
+technician's record, sending a case to the physician and generating a
+treatment plan, against a temporary database through aiosqlite.
+"""
+
+import os
+import sys
+import importlib
+from datetime import datetime
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+pytest.importorskip("aiosqlite")
+
+import database
+import upload_router
+from chatgpt_service import ChatGPTTreatmentPlanService
+from current_user import CurrentUser, require_staff
+from database import Base, create_db_engine, create_async_db_engine, get_async_db
+from llm_cache import LLMResponseCache
+from llm_client import LLMClient
+from mock_llm_server import MockLLMServer
+from models import Patient, StrokeScan, TreatmentPlan
+
+NOW = datetime(2026, 3, 4, 15, 30)
+TECHNICIAN = CurrentUser(1, "tech1", "Technician", None, None)
+
+@pytest.fixture
+def db_url(tmp_path):
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    engine = create_db_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        patient = Patient(name="Async patient", code="AS1", age=70)
+        db.add(patient)
+        db.flush()
+        db.add_all([StrokeScan(patient_id=patient.id, status="pending", eligible=True, timestamp=NOW),
+                    StrokeScan(patient_id=patient.id, status="pending", eligible=False, timestamp=NOW.replace(hour=9))])
+        db.add(Patient(name="Without scans", code="AS2"))
+        db.commit()
+    engine.dispose()
+    return url
+
+@pytest.fixture
+def override_async_db(db_url):
+    async_engine = create_async_db_engine(db_url)
+    factory = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_test_async_db():
+        async with factory() as db:
+            yield db
+    return get_test_async_db
+
+def read_db(db_url):
+    engine = create_db_engine(db_url)
+    return sessionmaker(bind=engine)()
+
+@pytest.fixture
+def main_app(db_url, override_async_db, monkeypatch):
+    # main.py creates its tables and counters at import; point it at the temporary database
+    engine = create_db_engine(db_url)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=engine, autoflush=False, autocommit=False))
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))  # static files are served from ../frontend
+    sys.modules.pop("main", None)
+    main = importlib.import_module("main")
+    app = main.app
+    app.dependency_overrides[get_async_db] = override_async_db
+    app.dependency_overrides[require_staff] = lambda: TECHNICIAN
+    yield app
+    sys.modules.pop("main", None)
+
+def test_save_record_and_send_to_doctor(main_app, db_url):
+    client = TestClient(main_app)  # without the lifespan: no worker threads
+    response = client.post("/api/patients/save-record",
+                           json={"patient_code": "AS1", "technician_notes": "Motion artefact"})
+    assert response.status_code == 200
+    saved_id = response.json()["scan_id"]
+
+    response = client.post("/api/patients/send-to-doctor",
+                           json={"patient_code": "AS1", "technician_notes": "Please review"})
+    assert response.status_code == 200
+    assert response.json()["scan_id"] == saved_id
+
+    assert client.post("/api/patients/send-to-doctor", json={"patient_code": "AS2"}).status_code == 404
+    assert client.post("/api/patients/send-to-doctor", json={"patient_code": "missing"}).status_code == 404
+    assert client.post("/api/patients/save-record", json={}).status_code == 400
+
+    with read_db(db_url) as db:
+        latest = db.get(StrokeScan, saved_id)
+        assert latest.timestamp == NOW
+        assert (latest.status, latest.technician_notes) == ("ready_for_review", "Please review")
+        earlier = db.query(StrokeScan).filter(StrokeScan.id != saved_id).one()
+        assert (earlier.status, earlier.technician_notes) == ("pending", None)
+
+def test_generate_treatment_plan(db_url, override_async_db, tmp_path, monkeypatch):
+    server = MockLLMServer().start()
+    cache_engine = create_db_engine(f"sqlite:///{tmp_path / 'llm_cache.db'}")
+    Base.metadata.create_all(bind=cache_engine)
+    service = ChatGPTTreatmentPlanService(LLMClient(base_url=server.base_url, api_key="test"),
+                                          LLMResponseCache(sessionmaker(bind=cache_engine)))
+    monkeypatch.setattr(upload_router, "get_chatgpt_service", lambda: service)
+
+    app = FastAPI()
+    app.include_router(upload_router.router)
+    app.dependency_overrides[get_async_db] = override_async_db
+    app.dependency_overrides[require_staff] = lambda: CurrentUser(2, "doc1", "Physician", None, None)
+    try:
+        with read_db(db_url) as db:
+            scan_id = db.query(StrokeScan).filter(StrokeScan.eligible == True).one().id
+        with TestClient(app) as client:
+            response = client.post("/api/treatment-plan/generate",
+                                   json={"patient_code": "AS1", "scan_id": scan_id, "physician_username": "doc1"})
+            assert response.status_code == 200
+            assert response.json()["plan_type"] == "tpa_eligible"
+            assert response.json()["ai_generated_plan"].startswith("Mock treatment plan")
+
+            assert client.post("/api/treatment-plan/generate",
+                               json={"patient_code": "AS1", "scan_id": 999}).status_code == 404
+            assert client.post("/api/treatment-plan/generate", json={"patient_code": "AS1"}).status_code == 400
+            client.portal.call(service.client.aclose)
+    finally:
+        server.stop()
+
+    with read_db(db_url) as db:
+        plan = db.get(TreatmentPlan, response.json()["treatment_plan_id"])
+        assert (plan.scan_id, plan.created_by, plan.status) == (scan_id, "doc1", "draft")
+        assert plan.ai_generated_plan == response.json()["ai_generated_plan"]
+    assert len(server.requests) == 1
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
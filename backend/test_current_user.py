@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Tests for the current-user dependency: who may call staff-only and per-patient
+routes (including scan images, which are keyed by scan rather than patient),
+the identity being resolved once and then served from the cache, and
+invalidation when a user's patient link changes.
+"""
+
+import pytest
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+import current_user
+import object_storage
+import upload_router
+from current_user import (CurrentUser, IdentityCache, invalidate_user, require_user, require_staff,
+                          require_patient_access)
+from database import Base, create_db_engine, get_read_db
+from models import User, Patient, StrokeScan
+from object_storage import LocalStorage
+from scan_storage import patient_owns_object, storage_key
+from scan_renditions import rendition_key
+from session_store import MemorySessionStore
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'auth.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    with factory() as db:
+        db.add_all([User(id=1, username="tech1", password="x", role="Technician"),
+                    User(id=2, username="pat1", password="x", role="Patient"),
+                    User(id=3, username="pat2", password="x", role="Patient"),
+                    Patient(code="P1", linked_user_id=2),
+                    Patient(code="P2")])
+        db.commit()
+    monkeypatch.setattr(current_user, "SessionLocal", factory)
+    return factory
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr(current_user, "session_store", store)
+    return store
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = IdentityCache()
+    monkeypatch.setattr(current_user, "identity_cache", cache)
+    return cache
+
+@pytest.fixture
+def client(session_factory, store, cache) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/me")
+    def me(user: CurrentUser = Depends(require_user)):
+        return user._asdict()
+
+    @app.get("/staff", dependencies=[Depends(require_staff)])
+    def staff():
+        return {"ok": True}
+
+    @app.get("/patients/{patient_code}", dependencies=[Depends(require_patient_access)])
+    def patient(patient_code: str):
+        return {"code": patient_code}
+
+    return TestClient(app)
+
+def login(client, store, user_id, username, role):
+    client.cookies.set("session_id", store.create({"user_id": user_id, "username": username, "role": role}))
+
+def test_requires_a_session(client):
+    assert client.get("/me").status_code == 401
+    client.cookies.set("session_id", "not-a-session")
+    assert client.get("/staff").status_code == 401
+    assert client.get("/patients/P1").status_code == 401
+
+def test_staff_routes(client, store):
+    login(client, store, 1, "tech1", "Technician")
+    assert client.get("/staff").status_code == 200
+    assert client.get("/patients/P2").status_code == 200
+
+    login(client, store, 2, "pat1", "Patient")
+    assert client.get("/staff").status_code == 403
+
+def test_patients_only_see_their_own_record(client, store):
+    login(client, store, 2, "pat1", "Patient")
+    assert client.get("/me").json()["patient_code"] == "P1"
+    assert client.get("/patients/P1").status_code == 200
+    assert client.get("/patients/P2").status_code == 403
+
+    login(client, store, 3, "pat2", "Patient")  # not linked to any record
+    assert client.get("/patients/P1").status_code == 403
+
+def test_identity_is_resolved_once(client, store, cache):
+    login(client, store, 2, "pat1", "Patient")
+    for _ in range(5):
+        assert client.get("/patients/P1").status_code == 200
+    assert (cache.misses, cache.hits) == (1, 4)
+
+def test_link_changes_invalidate(client, store, cache, session_factory):
+    login(client, store, 3, "pat2", "Patient")
+    assert client.get("/patients/P2").status_code == 403
+
+    with session_factory() as db:
+        db.query(Patient).filter_by(code="P2").update({"linked_user_id": 3})
+        db.commit()
+    assert client.get("/patients/P2").status_code == 403, "cached until invalidated"
+    invalidate_user(3)
+    assert client.get("/patients/P2").status_code == 200
+
+@pytest.fixture
+def scans(session_factory, tmp_path, monkeypatch):
+    """One stored scan image for each of P1 and P2; returns {patient code: (scan id, image_path)}."""
+    storage = LocalStorage(str(tmp_path / "uploads"))
+    monkeypatch.setattr(object_storage, "storage", storage)
+    scans = {}
+    with session_factory() as db:
+        for code in ("P1", "P2"):
+            image_path = f"uploads/blobs/00/00/{code}.png"
+            path = tmp_path / f"{code}.png"
+            path.write_bytes(b"image of " + code.encode())
+            storage.put_file(storage_key(image_path), str(path))
+            scan = StrokeScan(patient_id=db.query(Patient.id).filter_by(code=code).scalar(), image_path=image_path)
+            db.add(scan)
+            db.commit()
+            scans[code] = (scan.id, image_path)
+    return scans
+
+def scan_image_client(session_factory, store, cache) -> TestClient:
+    app = FastAPI()
+    app.include_router(upload_router.router)
+
+    def get_test_db():
+        with session_factory() as db:
+            yield db
+    app.dependency_overrides[get_read_db] = get_test_db
+    return TestClient(app)
+
+def test_patients_only_see_their_own_scan_images(session_factory, store, cache, scans):
+    client = scan_image_client(session_factory, store, cache)
+    own_scan, foreign_scan = scans["P1"][0], scans["P2"][0]
+
+    login(client, store, 2, "pat1", "Patient")
+    response = client.get(f"/scans/{own_scan}/image")
+    assert (response.status_code, response.content) == (200, b"image of P1")
+    assert client.get(f"/scans/{foreign_scan}/image").status_code == 403
+    assert client.get("/scans/999/image").status_code == 404
+
+    login(client, store, 3, "pat2", "Patient")  # not linked to any record
+    assert client.get(f"/scans/{own_scan}/image").status_code == 403
+
+    login(client, store, 1, "tech1", "Technician")
+    assert client.get(f"/scans/{foreign_scan}/image").content == b"image of P2"
+
+def test_patient_owns_object(session_factory, scans):
+    image_path = scans["P1"][1]
+    with session_factory() as db:
+        p1, p2 = (db.query(Patient.id).filter_by(code=code).scalar() for code in ("P1", "P2"))
+        assert patient_owns_object(db, p1, storage_key(image_path))
+        assert patient_owns_object(db, p1, rendition_key(storage_key(image_path), "thumbnail"))
+        assert not patient_owns_object(db, p2, storage_key(image_path))
+        assert not patient_owns_object(db, None, storage_key(image_path))
+
+def test_cached_identities_expire():
+    cache = IdentityCache(ttl_seconds=0)
+    cache.put(CurrentUser(1, "tech1", "Technician", None, None))
+    assert cache.get(1) is None
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for the incrementally maintained dashboard counters: scans and patients
+inserted, updated and deleted through the ORM keep every counter equal to a
+full recount, including counters that don't have a row yet, and a rebuild keeps
+other writers out while it recounts.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import dashboard_counters
+
+from database import Base, create_db_engine
+from models import Patient, StrokeScan, DashboardCounter
+from dashboard_counters import (check_counters, rebuild_counters, read_counters, status_key, scans_day_key,
+                                reviewed_day_key, TOTAL_SCANS, ELIGIBLE_SCANS, NOT_ELIGIBLE_SCANS)
+
+NOW = datetime(2026, 3, 4, 15, 30)
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'counters.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False, autocommit=False)()
+    yield db
+    db.close()
+
+def test_counters_follow_inserts_updates_and_deletes(db):
+    patients = [Patient(name=f"Patient {i}", code=f"DC{i}") for i in range(3)]
+    db.add_all(patients)
+    db.flush()
+    scans = [StrokeScan(patient_id=patients[i % 3].id, eligible=[True, False, None][i % 3],
+                        status=["pending", "ready_for_review"][i % 2], timestamp=NOW - timedelta(days=i % 2))
+             for i in range(6)]
+    db.add_all(scans)
+    db.commit()
+    rebuild_counters(db)
+    assert check_counters(db) == []
+
+    # Updates, including on attributes expired by the commit
+    scans[0].status = "reviewed"
+    scans[1].eligible = True
+    scans[2].timestamp = NOW - timedelta(days=3)
+    db.commit()
+    assert check_counters(db) == []
+
+    db.delete(scans[3])
+    db.delete(patients[2])
+    db.add(StrokeScan(patient_id=patients[0].id, eligible=False, timestamp=NOW))  # status from the column default
+    db.commit()
+    assert check_counters(db) == []
+
+    counters = read_counters(db, [TOTAL_SCANS, ELIGIBLE_SCANS, NOT_ELIGIBLE_SCANS, status_key("reviewed")])
+    assert counters == {TOTAL_SCANS: 6, ELIGIBLE_SCANS: 2, NOT_ELIGIBLE_SCANS: 2, status_key("reviewed"): 1}
+
+def test_counters_without_a_row_are_inserted(db):
+    patient = Patient(name="Patient", code="DC9")
+    db.add(patient)
+    db.commit()
+    rebuild_counters(db)
+    new_keys = [status_key("reviewed"), scans_day_key(NOW.date()), reviewed_day_key(NOW.date())]
+    assert db.query(DashboardCounter).filter(DashboardCounter.name.in_(new_keys)).count() == 0
+
+    db.add(StrokeScan(patient_id=patient.id, status="reviewed", eligible=True, timestamp=NOW))
+    db.commit()
+    assert read_counters(db, new_keys) == {key: 1 for key in new_keys}
+    assert check_counters(db) == []
+
+def test_rolled_back_changes_leave_counters_alone(db):
+    patient = Patient(name="Patient", code="DC8")
+    db.add(patient)
+    db.commit()
+    rebuild_counters(db)
+
+    db.add(StrokeScan(patient_id=patient.id, eligible=True, timestamp=NOW))
+    db.flush()
+    db.rollback()
+    assert check_counters(db) == []
+
+def test_rebuild_locks_out_writers_while_recounting(db, tmp_path, monkeypatch):
+    db.add(Patient(name="Patient", code="DC7"))
+    db.commit()
+    other = sessionmaker(bind=create_db_engine(f"sqlite:///{tmp_path / 'counters.db'}",
+                                               sqlite_pragmas={"busy_timeout": 0}))()
+    blocked = []
+    compute_counters = dashboard_counters.compute_counters
+
+    def compute_while_another_session_writes(session):
+        other.add(Patient(name="Concurrent patient", code="DC6"))
+        with pytest.raises(OperationalError, match="locked"):
+            other.commit()
+        other.rollback()
+        blocked.append(True)
+        return compute_counters(session)
+
+    monkeypatch.setattr(dashboard_counters, "compute_counters", compute_while_another_session_writes)
+    rebuild_counters(db)
+    monkeypatch.undo()
+    other.close()
+    assert blocked == [True]
+    assert check_counters(db) == []
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the dashboard statistics: the single aggregate pass over strokescans
+gives the same figures as the per-figure COUNT queries it replaced.
+"""
+
+import random
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, create_db_engine
+from models import Patient, StrokeScan
+from stats_service import technician_dashboard_stats, physician_dashboard_stats, start_of_today
+
+NOW = datetime(2026, 3, 4, 15, 30)  # early in the month: the old week_ago arithmetic broke there
+
+def make_session(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False, autocommit=False)()
+    rng = random.Random(7)
+    for i in range(40):
+        patient = Patient(name=f"Patient {i}", code=f"ST{i:03d}")
+        db.add(patient)
+        db.flush()
+        for _ in range(rng.randint(0, 4)):
+            db.add(StrokeScan(
+                patient_id=patient.id,
+                status=rng.choice(["pending", "saved", "ready_for_review", "reviewed"]),
+                eligible=rng.choice([True, False, None]),
+                timestamp=NOW - timedelta(hours=rng.randint(0, 24 * 20))
+            ))
+        if i % 10 == 0:
+            db.add(StrokeScan(patient_id=patient.id, status="reviewed", eligible=True, timestamp=NOW - timedelta(hours=1)))
+    db.commit()
+    return engine, db
+
+def legacy_stats(db, now):
+    """The dashboards' figures as the endpoints computed them before, one COUNT each."""
+    today = start_of_today(now)
+    week_ago = today - timedelta(days=7)
+    scans = db.query(StrokeScan)
+    return {
+        "total_patients": db.query(Patient).count(),
+        "total_scans": scans.count(),
+        "eligible_scans": scans.filter(StrokeScan.eligible == True).count(),
+        "not_eligible_scans": scans.filter(StrokeScan.eligible == False).count(),
+        "sent_to_doctor_scans": scans.filter(StrokeScan.status == "ready_for_review").count(),
+        "recent_patients": db.query(Patient).join(StrokeScan).filter(StrokeScan.timestamp >= week_ago).distinct().count(),
+        "recent_scans": scans.filter(StrokeScan.timestamp >= week_ago).count(),
+        "reviewed_today": scans.filter(StrokeScan.status == "reviewed", StrokeScan.timestamp >= today).count(),
+    }
+
+def test_aggregate_pass_matches_per_figure_counts(tmp_path):
+    engine, db = make_session(tmp_path)
+    expected = legacy_stats(db, NOW)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    technician = technician_dashboard_stats(db, NOW)
+    physician = physician_dashboard_stats(db, NOW)
+
+    assert technician == {key: expected[key] for key in technician}
+    assert physician == {
+        "new_cases": expected["sent_to_doctor_scans"],
+        "reviewed_today": expected["reviewed_today"],
+        "eligible_for_tpa": expected["eligible_scans"],
+        "not_eligible": expected["not_eligible_scans"],
+    }
+    assert expected["recent_scans"] and expected["reviewed_today"], "the data exercises every figure"
+    # Per dashboard: the counters check, one pass over strokescans, one patient count
+    assert len([s for s in statements if "strokescans" in s]) == 2
+    db.close()
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the engine factory: every SQLite connection, sync or async, gets the
+configured PRAGMAs (WAL and friends), and callers can override them. Also
+checks that get_read_db goes to the replica when DATABASE_REPLICA_URL is set.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import subprocess
+import pytest
+from sqlalchemy import text
+
+from database import (SQLITE_PRAGMAS, create_db_engine, create_async_db_engine, async_database_url,
+                      _normalize_url)
+
+def pragmas(connection) -> dict:
+    return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "temp_store")}
+
+# PRAGMA reads return numbers for these settings: synchronous NORMAL = 1, temp_store MEMORY = 2
+EXPECTED = {"journal_mode": "wal", "synchronous": 1, "busy_timeout": SQLITE_PRAGMAS["busy_timeout"],
+            "cache_size": SQLITE_PRAGMAS["cache_size"], "temp_store": 2}
+
+def test_sqlite_connections_get_the_pragmas(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+    with engine.connect() as first, engine.connect() as second:
+        assert pragmas(first) == EXPECTED
+        assert pragmas(second) == EXPECTED
+    engine.dispose()
+    assert (tmp_path / "wal.db").exists()
+
+def test_pragmas_can_be_overridden(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'journal.db'}",
+                              sqlite_pragmas={"journal_mode": "DELETE", "synchronous": "FULL"})
+    with engine.connect() as connection:
+        assert pragmas(connection) == dict(EXPECTED, journal_mode="delete", synchronous=2)
+    engine.dispose()
+
+def test_async_engine_gets_the_same_pragmas(tmp_path):
+    pytest.importorskip("aiosqlite")
+
+    async def read():
+        engine = create_async_db_engine(f"sqlite:///{tmp_path / 'async.db'}")
+        async with engine.connect() as connection:
+            values = await connection.run_sync(pragmas)
+        await engine.dispose()
+        return values
+
+    assert asyncio.run(read()) == EXPECTED
+
+def test_in_memory_database_is_shared_between_sessions():
+    engine = create_db_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE t (x INTEGER)"))
+        connection.execute(text("INSERT INTO t VALUES (1)"))
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT x FROM t")).scalar() == 1
+
+# Run in a fresh interpreter: the engines are built from the environment at import time
+ROUTING_SCRIPT = """
+import json
+from sqlalchemy import text
+import database
+from database import get_db, get_read_db
+for dependency in (get_db, get_read_db):
+    db = next(dependency())
+    db.execute(text("CREATE TABLE IF NOT EXISTS t (x INTEGER)"))
+    db.execute(text("INSERT INTO t VALUES (1)"))
+    db.commit()
+    db.close()
+print(json.dumps({"engine": str(database.engine.url), "read_engine": str(database.read_engine.url),
+                  "same": database.read_engine is database.engine}))
+"""
+
+def run_routing_script(**env):
+    base_env = {key: value for key, value in os.environ.items() if key != "DATABASE_REPLICA_URL"}
+    completed = subprocess.run([sys.executable, "-c", ROUTING_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               env=dict(base_env, **env), capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def count_rows(path) -> int:
+    engine = create_db_engine(f"sqlite:///{path}")
+    with engine.connect() as connection:
+        count = connection.exec_driver_sql("SELECT COUNT(*) FROM t").scalar()
+    engine.dispose()
+    return count
+
+def test_reads_go_to_the_replica(tmp_path):
+    primary, replica = tmp_path / "primary.db", tmp_path / "replica.db"
+    urls = run_routing_script(DATABASE_URL=f"sqlite:///{primary}", DATABASE_REPLICA_URL=f"sqlite:///{replica}")
+    assert urls == {"engine": f"sqlite:///{primary}", "read_engine": f"sqlite:///{replica}", "same": False}
+    assert count_rows(primary) == 1
+    assert count_rows(replica) == 1
+
+def test_reads_default_to_the_primary(tmp_path):
+    primary = tmp_path / "primary.db"
+    assert run_routing_script(DATABASE_URL=f"sqlite:///{primary}")["same"]
+    assert count_rows(primary) == 2
+
+def test_database_urls():
+    assert _normalize_url("postgres://u:p@host/stroke") == "postgresql+psycopg2://u:p@host/stroke"
+    assert _normalize_url("postgresql://u:p@host/stroke") == "postgresql+psycopg2://u:p@host/stroke"
+    assert _normalize_url("postgresql+asyncpg://host/stroke") == "postgresql+asyncpg://host/stroke"
+    assert _normalize_url(None) is None
+    assert async_database_url("sqlite:///stroke.db") == "sqlite+aiosqlite:///stroke.db"
+    assert async_database_url("postgresql+psycopg2://u:p@host/stroke") == "postgresql+asyncpg://u:p@host/stroke"
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
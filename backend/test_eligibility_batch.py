@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Property-based check that the vectorized eligibility evaluator agrees with
+check_tpa_eligibility row by row: same flag and same (first) failing reason.
+"""
+
+import math
+import pytest
+
+np = pytest.importorskip("numpy")
+hypothesis = pytest.importorskip("hypothesis")
+from hypothesis import given, settings, strategies as st
+
+from tpa_eligibility import check_tpa_eligibility
+from eligibility_batch import check_tpa_eligibility_batch, batch_reasons, columns_from_records
+from eligibility_rules import get_rule_set
+
+def around(*thresholds, low=-1000.0, high=1000.0):
+    """Values on, just beside, and away from the given thresholds, plus NaN."""
+    edges = []
+    for threshold in thresholds:
+        edges += [threshold, math.nextafter(threshold, -math.inf), math.nextafter(threshold, math.inf)]
+    return st.one_of(
+        st.sampled_from(edges),
+        st.floats(min_value=low, max_value=high, allow_nan=False),
+        st.just(float("nan")),
+    )
+
+YES_NO = st.sampled_from(["yes", "no", "", "Yes"])
+
+records = st.fixed_dictionaries({
+    "hours_since_onset": around(4.5, low=0, high=24),
+    "imaging_confirmed": st.sampled_from(["yes"] * 4 + ["no"]),
+    "consent": st.sampled_from(["yes"] * 4 + ["no"]),
+    "age": st.one_of(st.integers(0, 110), around(18)),
+    "nhiss_score": st.one_of(st.integers(0, 42), around(4)),
+    "inr": around(1.7, low=0, high=5),
+    "heart_rate": st.one_of(st.integers(30, 180), around(60, 100)),
+    "respiratory_rate": st.one_of(st.integers(5, 40), around(12, 20)),
+    "temperature": around(97, 100.4, low=90, high=110),
+    "oxygen_saturation": st.one_of(st.integers(70, 100), around(95, 100)),
+    "recent_trauma": YES_NO,
+    "recent_stroke_or_injury": YES_NO,
+    "intracranial_issue": YES_NO,
+    "recent_mi": YES_NO,
+    "systolic_bp": st.one_of(st.integers(80, 250), around(185)),
+    "diastolic_bp": st.one_of(st.integers(40, 150), around(110)),
+    "glucose": around(50, 400, low=0, high=800),
+    "anticoagulant_risk": YES_NO,
+    "platelet_count": st.one_of(st.integers(0, 500), around(100)),
+    "recent_surgery": YES_NO,
+})
+
+@settings(max_examples=300, deadline=None)
+@given(st.lists(records, min_size=1, max_size=50))
+def test_batch_matches_scalar(rows):
+    eligible, first_failing = check_tpa_eligibility_batch(columns_from_records(rows))
+    reasons = batch_reasons(first_failing)
+
+    for row, flag, index, reason in zip(rows, eligible.tolist(), first_failing.tolist(), reasons):
+        expected_flag, expected_reason = check_tpa_eligibility(row)
+        assert flag == expected_flag
+        assert reason == expected_reason
+        assert (index == -1) == expected_flag
+
+def test_rule_indexes():
+    row = {
+        "hours_since_onset": 2.0, "imaging_confirmed": "yes", "consent": "yes", "age": 60,
+        "nhiss_score": 10, "inr": 1.0, "heart_rate": 80, "respiratory_rate": 16,
+        "temperature": 98.6, "oxygen_saturation": 98, "recent_trauma": "no",
+        "recent_stroke_or_injury": "no", "intracranial_issue": "no", "recent_mi": "no",
+        "systolic_bp": 120, "diastolic_bp": 80, "glucose": 100, "anticoagulant_risk": "no",
+        "platelet_count": 250, "recent_surgery": "no",
+    }
+    high_glucose = dict(row, glucose=450)
+    late_and_high_glucose = dict(high_glucose, hours_since_onset=6)
+
+    eligible, first_failing = check_tpa_eligibility_batch(columns_from_records([row, high_glucose, late_and_high_glucose]))
+    assert eligible.tolist() == [True, False, False]
+    rules = get_rule_set().rules
+    assert [rules[i].name if i >= 0 else None for i in first_failing.tolist()] == [None, "glucose", "onset_window"]
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for the compiled eligibility rule table: the shipped table must reproduce
+the original hand-written criteria exactly, report every failing criterion, keep
+per-rule counters and reject malformed tables.
+"""
+
+import pytest
+
+hypothesis = pytest.importorskip("hypothesis")
+from hypothesis import given, settings
+
+from tpa_eligibility import check_tpa_eligibility, evaluate_tpa_eligibility
+from eligibility_rules import RuleSet, get_rule_set
+from test_eligibility_batch import records
+
+def original_check_tpa_eligibility(data: dict):
+    """The if-chain the rule table replaced (protocol tpa-2019.1), kept as the reference."""
+    if data["hours_since_onset"] > 4.5:
+        return False, "Initial Assessment: Patient presented beyond 4.5-hour treatment window"
+    if data["imaging_confirmed"] != "yes":
+        return False, "Initial Assessment: Ischemic stroke not confirmed by neuroimaging (CT/MRI)"
+    if data["consent"] != "yes":
+        return False, "Initial Assessment: Informed consent not obtained from patient or representative"
+    if data["age"] < 18:
+        return False, "Exclusion: Patient is under 18 years old"
+    if data["nhiss_score"] < 4:
+        return False, "Exclusion: NIHSS score below minimum threshold for thrombolytic therapy"
+    if data["inr"] > 1.7:
+        return False, "Exclusion: INR exceeds safe threshold for thrombolysis (INR > 1.7)"
+    if not (60 <= data["heart_rate"] <= 100):
+        return False, "Exclusion: Abnormal heart rate outside 60–100 bpm"
+    if not (12 <= data["respiratory_rate"] <= 20):
+        return False, "Exclusion: Abnormal respiratory rate outside 12–20 breaths/min"
+    if not (97 <= data["temperature"] <= 100.4):
+        return False, "Exclusion: Abnormal body temperature outside acceptable range (97–100.4 °F)"
+    if not (95 <= data["oxygen_saturation"] <= 100):
+        return False, "Exclusion: Oxygen saturation below 95%"
+    if data["recent_trauma"] == "yes":
+        return False, "Exclusion: Recent head or spinal trauma within 3 months"
+    if data["recent_stroke_or_injury"] == "yes":
+        return False, "Exclusion: History of stroke or serious head injury within 3 months"
+    if data["intracranial_issue"] == "yes":
+        return False, "Exclusion: Presence of intracranial hemorrhage, tumor, or vascular malformation"
+    if data["recent_mi"] == "yes":
+        return False, "Exclusion: Recent myocardial infarction (heart attack)"
+    if data["systolic_bp"] > 185 or data["diastolic_bp"] > 110:
+        return False, "Exclusion: Blood pressure exceeds safe threshold for tPA (SBP > 185 or DBP > 110 mmHg)"
+    if data["glucose"] < 50 or data["glucose"] > 400:
+        return False, "Exclusion: Blood glucose outside acceptable range (<50 or >400 mg/dL)"
+    if data["anticoagulant_risk"] == "yes":
+        return False, "Exclusion: Use of anticoagulants with elevated INR ≥ 3"
+    if data["platelet_count"] < 100:
+        return False, "Exclusion: Platelet count below safe minimum (<100,000/μL)"
+    if data["recent_surgery"] == "yes":
+        return False, "Exclusion: Recent surgery or biopsy of parenchymal organ"
+    return True, "Meets all criteria for intravenous thrombolysis (tPA administration)"
+
+@settings(max_examples=500, deadline=None)
+@given(records)
+def test_rule_table_matches_original_criteria(row):
+    expected = original_check_tpa_eligibility(row)
+    assert check_tpa_eligibility(row) == expected
+
+    result = evaluate_tpa_eligibility(row)
+    assert result.eligible == expected[0]
+    assert result.reasons[0] == expected[1], "the first reported reason is the one the if-chain returned"
+    assert len(result.reasons) == len(result.failed_rules) or result.eligible
+
+def test_all_failing_criteria_are_reported():
+    row = {
+        "hours_since_onset": 6, "imaging_confirmed": "yes", "consent": "yes", "age": 60,
+        "nhiss_score": 10, "inr": 2.0, "heart_rate": 80, "respiratory_rate": 16,
+        "temperature": 98.6, "oxygen_saturation": 98, "recent_trauma": "no",
+        "recent_stroke_or_injury": "no", "intracranial_issue": "no", "recent_mi": "no",
+        "systolic_bp": 120, "diastolic_bp": 120, "glucose": 100, "anticoagulant_risk": "no",
+        "platelet_count": 250, "recent_surgery": "yes",
+    }
+    result = evaluate_tpa_eligibility(row)
+    assert not result.eligible
+    assert result.failed_rules == ["onset_window", "inr", "blood_pressure", "recent_surgery"]
+    assert result.rules_version == get_rule_set().version
+
+def test_counters():
+    rule_set = RuleSet({
+        "version": "test",
+        "rules": [
+            {"name": "a", "fail_when": [{"field": "x", "op": ">", "value": 1}]},
+            {"name": "b", "fail_when": [{"field": "y", "op": "outside", "range": [0, 10]}]},
+        ],
+    })
+    rule_set.first_failure({"x": 5, "y": 5})   # stops at a
+    rule_set.first_failure({"x": 0, "y": 50})  # fails b
+    rule_set.first_failure({"x": 0, "y": 5})   # passes
+    rule_set.evaluate({"x": 5, "y": 50})       # fails both
+
+    assert rule_set.counters() == [
+        {"rule": "a", "evaluated": 4, "failed": 2},
+        {"rule": "b", "evaluated": 3, "failed": 2},
+    ]
+    rule_set.reset_counters()
+    assert all(counter["evaluated"] == 0 for counter in rule_set.counters())
+
+@pytest.mark.parametrize("table", [
+    {"rules": [{"name": "a", "fail_when": [{"field": "x", "op": ">", "value": 1}]}]},
+    {"version": "1", "rules": []},
+    {"version": "1", "rules": [{"name": "a", "fail_when": [{"field": "x", "op": "~", "value": 1}]}]},
+    {"version": "1", "rules": [{"name": "a", "fail_when": [{"field": "x", "op": ">", "value": [1]}]}]},
+    {"version": "1", "rules": [{"name": "a", "fail_when": [{"field": "x", "op": "outside", "range": [5, 1]}]}]},
+    {"version": "1", "rules": [{"name": "a", "fail_when": []}]},
+    {"version": "1", "rules": [
+        {"name": "a", "fail_when": [{"field": "x", "op": ">", "value": 1}]},
+        {"name": "a", "fail_when": [{"field": "y", "op": ">", "value": 1}]},
+    ]},
+])
+def test_malformed_tables_are_rejected(table):
+    with pytest.raises(ValueError):
+        RuleSet(table)
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
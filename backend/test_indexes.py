@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the secondary indexes: the dashboard and per-patient filters are
+served by an index instead of a full table scan, and migrate_schema.py adds
+missing indexes and columns to an existing database.
+"""
+
+import pytest
+from sqlalchemy import inspect, select, func
+
+from database import Base, create_db_engine
+from models import StrokeScan, NIHSSAssessment, TreatmentPlan, Patient
+from explain_queries import is_table_scan
+from migrate_schema import create_missing_indexes, add_missing_columns, migrate_schema
+
+FILTERED_QUERIES = {
+    "scans by status": select(StrokeScan.id).where(StrokeScan.status == "ready_for_review").order_by(StrokeScan.id),
+    "scans by eligibility": select(func.count(StrokeScan.id)).where(StrokeScan.eligible == True),
+    "recent scans": select(func.count(StrokeScan.id)).where(StrokeScan.timestamp >= "2026-01-01"),
+    "patient's latest scan": select(StrokeScan.id).where(StrokeScan.patient_id == 1)
+        .order_by(StrokeScan.timestamp.desc()).limit(1),
+    "patient's assessments": select(NIHSSAssessment.id).where(NIHSSAssessment.patient_id == 1)
+        .order_by(NIHSSAssessment.timestamp.desc()),
+    "patient's treatment plans": select(TreatmentPlan.id).where(TreatmentPlan.patient_id == 1),
+    "user's patient": select(Patient.id).where(Patient.linked_user_id == 1),
+}
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'indexes.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+def test_filters_use_indexes(engine):
+    with engine.connect() as connection:
+        for name, query in FILTERED_QUERIES.items():
+            compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+            plan = [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")]
+            assert not any(is_table_scan(detail) for detail in plan), (name, plan)
+            assert any("INDEX" in detail for detail in plan), (name, plan)
+
+def test_migration_adds_missing_indexes(engine):
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_strokescans_status")
+        connection.exec_driver_sql("DROP INDEX ix_nihssassessments_patient_id_timestamp")
+
+    assert create_missing_indexes(engine) == ["ix_nihssassessments_patient_id_timestamp", "ix_strokescans_status"]
+    inspector = inspect(engine)
+    assert "ix_strokescans_status" in {index["name"] for index in inspector.get_indexes("strokescans")}
+    assert "ix_nihssassessments_patient_id_timestamp" in {
+        index["name"] for index in inspector.get_indexes("nihssassessments")}
+    assert create_missing_indexes(engine) == [], "running it again is a no-op"
+
+def test_migration_adds_missing_columns(engine):
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ALTER TABLE patients DROP COLUMN onset_at")
+
+    result = migrate_schema(engine)
+    assert (result["columns"], result["indexes"]) == (["patients.onset_at"], [])
+    assert "onset_at" in {column["name"] for column in inspect(engine).get_columns("patients")}
+    assert add_missing_columns(engine) == [], "running it again is a no-op"
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
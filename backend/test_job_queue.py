@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Tests for the durable job queue: success, retries with back-off, permanent
+failure, lease expiry and renewal, and the worker pool, against a throwaway
+SQLite database.
+"""
+
+import time
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+import job_queue
+from database import Base, create_db_engine
+from job_queue import enqueue, claim_next_job, run_job, job_handler, WorkerPool, QUEUED, RUNNING, SUCCEEDED, FAILED
+from models import Job
+
+calls = []
+
+@job_handler("test_echo")
+def echo(payload):
+    calls.append(payload)
+    return {"echo": payload["value"]}
+
+@job_handler("test_flaky")
+def flaky(payload):
+    calls.append(payload)
+    if len(calls) < payload["fail_times"] + 1:
+        raise ValueError("temporary failure")
+    return {"ok": True}
+
+@job_handler("test_slow")
+def slow(payload):
+    calls.append(payload)
+    time.sleep(payload["seconds"])
+    return {"ok": True}
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    calls.clear()
+    monkeypatch.setattr(job_queue, "JOB_RETRY_BASE_SECONDS", 0)
+    # A file database: the worker pool test uses several connections at once
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+def add_job(session_factory, kind, payload, max_attempts=3) -> int:
+    with session_factory() as db:
+        job = enqueue(db, kind, payload, max_attempts=max_attempts)
+        db.commit()
+        return job.id
+
+def process_one(session_factory) -> bool:
+    with session_factory() as db:
+        job = claim_next_job(db, "test-worker")
+        if job is None:
+            return False
+        run_job(db, job)
+        return True
+
+def get_job(session_factory, job_id) -> Job:
+    with session_factory() as db:
+        return db.get(Job, job_id)
+
+def test_job_succeeds(session_factory):
+    job_id = add_job(session_factory, "test_echo", {"value": 7})
+    assert process_one(session_factory)
+    assert not process_one(session_factory)
+
+    job = get_job(session_factory, job_id)
+    assert job.status == SUCCEEDED
+    assert job.attempts == 1
+    assert job_queue.job_status(job)["result"] == {"echo": 7}
+
+def test_job_is_retried_then_succeeds(session_factory):
+    job_id = add_job(session_factory, "test_flaky", {"fail_times": 2})
+    for _ in range(3):
+        assert process_one(session_factory)
+
+    job = get_job(session_factory, job_id)
+    assert job.status == SUCCEEDED
+    assert job.attempts == 3
+    assert len(calls) == 3
+
+def test_job_fails_after_max_attempts(session_factory):
+    job_id = add_job(session_factory, "test_flaky", {"fail_times": 10}, max_attempts=2)
+    while process_one(session_factory):
+        pass
+
+    job = get_job(session_factory, job_id)
+    assert job.status == FAILED
+    assert job.attempts == 2
+    assert "temporary failure" in job.last_error
+
+def test_retry_waits_for_back_off(session_factory, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_RETRY_BASE_SECONDS", 60)
+    job_id = add_job(session_factory, "test_flaky", {"fail_times": 1})
+    assert process_one(session_factory)
+    assert get_job(session_factory, job_id).status == QUEUED
+    assert not process_one(session_factory), "retry should not run before run_after"
+
+def test_unknown_kind_fails_without_retry(session_factory):
+    job_id = add_job(session_factory, "test_missing_handler", {})
+    assert process_one(session_factory)
+    assert get_job(session_factory, job_id).status == FAILED
+
+def test_expired_lease_is_reclaimed(session_factory):
+    job_id = add_job(session_factory, "test_echo", {"value": 1})
+    with session_factory() as db:
+        job = db.get(Job, job_id)
+        job.status = RUNNING
+        job.attempts = 1
+        job.locked_at = datetime.now()
+        db.commit()
+    assert not process_one(session_factory), "a job with a live lease must not be taken"
+
+    with session_factory() as db:
+        db.get(Job, job_id).locked_at = datetime.now() - timedelta(seconds=job_queue.JOB_LEASE_SECONDS + 1)
+        db.commit()
+    assert process_one(session_factory)
+    assert get_job(session_factory, job_id).status == SUCCEEDED
+
+def expire_lease(session_factory, job_id, attempts):
+    with session_factory() as db:
+        job = db.get(Job, job_id)
+        job.status = RUNNING
+        job.attempts = attempts
+        job.locked_by = "dead-worker"
+        job.locked_at = datetime.now() - timedelta(seconds=job_queue.JOB_LEASE_SECONDS + 1)
+        db.commit()
+
+def test_expired_lease_without_attempts_left_fails(session_factory):
+    job_id = add_job(session_factory, "test_echo", {"value": 1}, max_attempts=1)
+    expire_lease(session_factory, job_id, attempts=1)
+    assert not process_one(session_factory), "not started a second time"
+
+    job = get_job(session_factory, job_id)
+    assert (job.status, job.attempts, job.locked_by) == (FAILED, 1, None)
+    assert "Lease expired" in job.last_error
+    assert calls == []
+
+def test_worker_renews_the_lease_of_a_long_job(session_factory, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", 1)
+    pool = WorkerPool(session_factory, workers=1, poll_seconds=0.05, lease_renew_seconds=0.2)
+    job_id = add_job(session_factory, "test_slow", {"seconds": 2.5}, max_attempts=1)
+    pool.start()
+    try:
+        pool.notify()
+        time.sleep(1.8)
+        # Outlived the lease; another worker must not take it while it is being renewed
+        assert get_job(session_factory, job_id).status == RUNNING
+        assert not process_one(session_factory)
+        deadline = time.time() + 10
+        while get_job(session_factory, job_id).status == RUNNING and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        pool.stop()
+
+    assert get_job(session_factory, job_id).status == SUCCEEDED
+    assert len(calls) == 1
+
+def test_worker_pool_processes_jobs(session_factory):
+    pool = WorkerPool(session_factory, workers=3, poll_seconds=0.05)
+    pool.start()
+    try:
+        job_ids = [add_job(session_factory, "test_echo", {"value": i}) for i in range(20)]
+        pool.notify()
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if all(get_job(session_factory, job_id).status == SUCCEEDED for job_id in job_ids):
+                break
+            time.sleep(0.05)
+    finally:
+        pool.stop()
+
+    assert all(get_job(session_factory, job_id).status == SUCCEEDED for job_id in job_ids)
+    assert sorted(payload["value"] for payload in calls) == list(range(20)), "each job runs exactly once"
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
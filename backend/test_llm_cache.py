@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for the LLM response cache: the canonical prompt key, hits from memory and
+from the table (after a restart), TTL expiry and the sweeper deleting expired
+rows, LRU eviction in both tiers, the bypass flag and the hit-rate metrics.
+"""
+
+import asyncio
+import threading
+import time
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, create_db_engine
+from llm_cache import LLMResponseCache, cached_chat, prompt_key, llm_cache_sweeper, llm_response_cache
+from models import LLMCacheEntry
+from session_store import SessionSweeper
+
+MESSAGES = [{"role": "system", "content": "You are an expert neurologist."},
+            {"role": "user", "content": "\n        Patient Information:\n        - Age: 70 years\n"}]
+
+class CountingClient:
+    """Stands in for LLMClient; answers with a numbered reply."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def chat(self, messages, model, max_tokens=1500, temperature=0.3):
+        self.calls += 1
+        return f"plan {self.calls}"
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'llm_cache.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+def test_prompt_key_is_canonical():
+    key = prompt_key("gpt-4o-mini", MESSAGES, 0.3, 1500)
+    reformatted = [dict(message, content=" ".join(message["content"].split())) for message in MESSAGES]
+    assert prompt_key("gpt-4o-mini", reformatted, 0.3, 1500) == key
+    assert prompt_key("gpt-4o-mini", MESSAGES, 0.3, 1500) == key
+
+    changed_data = [MESSAGES[0], dict(MESSAGES[1], content=MESSAGES[1]["content"].replace("70", "71"))]
+    changed_system = [dict(MESSAGES[0], content="You are a cardiologist."), MESSAGES[1]]
+    others = {prompt_key("gpt-3.5-turbo", MESSAGES, 0.3, 1500), prompt_key("gpt-4o-mini", MESSAGES, 0.7, 1500),
+              prompt_key("gpt-4o-mini", MESSAGES, 0.3, 500), prompt_key("gpt-4o-mini", changed_data, 0.3, 1500),
+              prompt_key("gpt-4o-mini", changed_system, 0.3, 1500)}
+    assert key not in others and len(others) == 5
+
+def test_memory_and_stored_hits(session_factory):
+    client, cache = CountingClient(), LLMResponseCache(session_factory)
+
+    async def generate(cache, **options):
+        return await cached_chat(MESSAGES, model="gpt-4o-mini", client=client, cache=cache, **options)
+
+    assert asyncio.run(generate(cache)) == ("plan 1", False)
+    assert asyncio.run(generate(cache)) == ("plan 1", True)
+
+    # Another worker, or after a restart: served from the table
+    restarted = LLMResponseCache(session_factory)
+    assert asyncio.run(generate(restarted)) == ("plan 1", True)
+    assert asyncio.run(generate(restarted)) == ("plan 1", True)
+    assert (restarted.hits, restarted.stored_hits, restarted.misses) == (1, 1, 0)
+
+    # Bypass asks the model again and replaces the entry
+    assert asyncio.run(generate(cache, bypass_cache=True)) == ("plan 2", False)
+    assert asyncio.run(generate(LLMResponseCache(session_factory))) == ("plan 2", True)
+    assert client.calls == 2
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bypasses"], stats["stored_entries"]) == (1, 1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+def test_failures_are_not_cached(session_factory):
+    class FailingClient:
+        async def chat(self, *args, **kwargs):
+            raise RuntimeError("API down")
+
+    cache = LLMResponseCache(session_factory)
+    with pytest.raises(RuntimeError):
+        asyncio.run(cached_chat(MESSAGES, model="m", client=FailingClient(), cache=cache))
+    assert cache.stats()["stored_entries"] == 0
+
+def test_entries_expire(session_factory):
+    cache = LLMResponseCache(session_factory, ttl_seconds=1)
+    cache.put("k", "m", "plan")
+    assert cache.get("k") == "plan"
+    time.sleep(1.1)
+    assert cache.get("k") is None
+    assert LLMResponseCache(session_factory).get("k") is None
+    assert cache.sweep() == 1
+
+def test_sweeper_deletes_expired_rows(session_factory):
+    assert llm_cache_sweeper.store is llm_response_cache, "the app's sweeper sweeps the app's cache"
+    cache = LLMResponseCache(session_factory, ttl_seconds=0)
+    cache.put("k", "m", "plan")
+    sweeper = SessionSweeper(cache, interval_seconds=0.05, what="cached completions")
+    sweeper.start()
+    try:
+        deadline = time.monotonic() + 5
+        while cache.stats()["stored_entries"] and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        sweeper.stop()
+    assert cache.stats()["stored_entries"] == 0
+
+def test_bypasses_are_counted_from_many_threads(session_factory):
+    cache = LLMResponseCache(session_factory)
+
+    def bypass():
+        for _ in range(1000):
+            cache.record_bypass()
+
+    threads = [threading.Thread(target=bypass) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()["bypasses"] == 8000
+
+def test_lru_eviction(session_factory):
+    cache = LLMResponseCache(session_factory, max_entries=2, max_stored=2)
+    cache.put("a", "m", "plan a")
+    cache.put("b", "m", "plan b")
+    cache._entries.clear()  # forget the memory tier: "a" is now used through the table
+    assert cache.get("a") == "plan a"
+    cache.put("c", "m", "plan c")
+    with session_factory() as db:
+        assert sorted(entry.key for entry in db.query(LLMCacheEntry)) == ["a", "c"]
+    assert list(cache._entries) == ["a", "c"]
+    assert cache.stats()["evictions"] == 1
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
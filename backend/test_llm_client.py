@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared LLM client against the local mock server: completions,
+connection reuse, the concurrency bound, timeouts and API errors, and both
+treatment plan code paths going through it.
+"""
+
+import asyncio
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+import llm_cache
+import upload_router
+from chatgpt_service import ChatGPTTreatmentPlanService
+from current_user import CurrentUser, require_staff
+from database import Base, create_db_engine
+from llm_cache import LLMResponseCache
+from llm_client import LLMClient, LLMError
+from mock_llm_server import MockLLMServer
+
+MESSAGES = [{"role": "system", "content": "You are a neurologist."}, {"role": "user", "content": "Plan please"}]
+
+@pytest.fixture
+def server():
+    server = MockLLMServer().start()
+    yield server
+    server.stop()
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    # Keep generated plans out of the application database
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'llm_cache.db'}")
+    Base.metadata.create_all(bind=engine)
+    cache = LLMResponseCache(sessionmaker(bind=engine))
+    monkeypatch.setattr(llm_cache, "llm_response_cache", cache)
+    return cache
+
+def client_for(server, **options) -> LLMClient:
+    return LLMClient(base_url=server.base_url, api_key="test", **options)
+
+def test_completion_and_connection_reuse(server):
+    client = client_for(server)
+
+    async def scenario():
+        answers = [await client.chat(MESSAGES, model="gpt-4o-mini") for _ in range(5)]
+        await client.aclose()
+        return answers
+
+    answers = asyncio.run(scenario())
+    assert answers[0] == "Mock treatment plan (gpt-4o-mini): Plan please"
+    assert server.requests[0] == {"model": "gpt-4o-mini", "messages": MESSAGES, "max_tokens": 1500, "temperature": 0.3}
+    assert server.connections == 1, "one kept-alive connection for all requests"
+
+def test_concurrency_is_bounded(server):
+    server.delay_seconds = 0.2
+    client = client_for(server, max_concurrency=2)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while client.in_flight or not ticks:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        started = time.monotonic()
+        await asyncio.gather(ticker(), *[client.chat(MESSAGES, model="m") for _ in range(6)])
+        elapsed = time.monotonic() - started
+        await client.aclose()
+        return ticks, elapsed
+
+    ticks, elapsed = asyncio.run(scenario())
+    assert server.max_in_flight == 2
+    assert elapsed >= 0.6  # three rounds of two
+    assert ticks > 20, "the event loop kept running while requests were in flight"
+
+def test_timeouts_and_errors(server):
+    async def chat(client):
+        try:
+            return await client.chat(MESSAGES, model="m")
+        finally:
+            await client.aclose()
+
+    server.delay_seconds = 0.5
+    with pytest.raises(LLMError) as timeout:
+        asyncio.run(chat(client_for(server, timeout_seconds=0.1)))
+    assert timeout.value.status_code == 504
+
+    server.delay_seconds, server.status = 0, 429
+    with pytest.raises(LLMError) as error:
+        asyncio.run(chat(client_for(server)))
+    assert (error.value.status_code, error.value.detail) == (502, "OpenAI API error: Mock LLM error")
+
+    with pytest.raises(LLMError) as unreachable:
+        asyncio.run(chat(LLMClient(base_url="http://127.0.0.1:1/v1", api_key="test")))
+    assert unreachable.value.status_code == 502
+
+    with pytest.raises(LLMError) as missing_key:
+        asyncio.run(chat(LLMClient(base_url=server.base_url, api_key="")))
+    assert missing_key.value.status_code == 500
+
+def test_treatment_plan_service(server):
+    service = ChatGPTTreatmentPlanService(client_for(server))
+
+    async def scenario():
+        generated = await service.generate_treatment_plan({"name": "Jane"}, {"prediction": "ischemic"}, "Eligible", True)
+        server.status = 500
+        refined = await service.refine_treatment_plan("plan", "notes")
+        await service.client.aclose()
+        return generated, refined
+
+    generated, refined = asyncio.run(scenario())
+    assert generated.startswith("Mock treatment plan (gpt-3.5-turbo)")
+    assert "tPA-eligible" in server.requests[0]["messages"][1]["content"]
+    assert refined == "Error refining treatment plan: OpenAI API error: Mock LLM error"
+
+def test_client_is_closed_before_changing_event_loop(server):
+    client = client_for(server)
+
+    async def chat():
+        return await client.chat(MESSAGES, model="m")
+
+    async def chat_and_close():
+        try:
+            return await chat()
+        finally:
+            await client.aclose()
+
+    asyncio.run(chat_and_close())
+    assert asyncio.run(chat_and_close()).startswith("Mock treatment plan"), "reopened on the new loop"
+
+    asyncio.run(chat())
+    with pytest.raises(RuntimeError):
+        asyncio.run(chat())
+
+def test_generate_treatment_endpoint(server, monkeypatch):
+    llm = client_for(server, timeout_seconds=0.2)
+    monkeypatch.setattr(upload_router, "llm_client", llm)
+    app = FastAPI()
+    app.include_router(upload_router.router)
+    app.dependency_overrides[require_staff] = lambda: CurrentUser(1, "doc1", "Physician", None, None)
+    request = {"name": "John", "age": 65, "nhiss_score": 8, "systolic_bp": 160, "diastolic_bp": 95,
+               "glucose": 120, "oxygen_saturation": 96, "symptoms": "left-sided weakness"}
+
+    with TestClient(app) as client:
+        response = client.post("/api/generate-treatment", json=request)
+        assert response.status_code == 200
+        assert response.json()["treatment_plan"].startswith("Mock treatment plan (gpt-4o-mini)")
+        assert response.json()["cached"] is False
+
+        server.delay_seconds = 0.5
+        assert client.post("/api/generate-treatment", json=request).json()["cached"] is True
+        assert client.post("/api/generate-treatment", json=dict(request, bypass_cache="false")).json()["cached"] is True
+        assert client.post("/api/generate-treatment", json=dict(request, bypass_cache="yes")).status_code == 400
+        assert client.post("/api/generate-treatment", json=dict(request, bypass_cache=1)).status_code == 400
+        response = client.post("/api/generate-treatment", json=dict(request, bypass_cache="true"))
+        assert response.status_code == 504
+        response = client.post("/api/generate-treatment", json=dict(request, bypass_cache=True))
+        assert response.status_code == 504
+        client.portal.call(llm.aclose)
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Tests for the scan object storage backends.
+
+Both backends are run through the same checks: the local filesystem backend in a
+temporary directory, and the S3 backend against a local moto server standing in
+for MinIO/S3 (skipped when boto3 or moto aren't installed).
+"""
+
+import os
+import socket
+import tempfile
+import pytest
+import requests
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import object_storage
+from object_storage import ObjectStorage, LocalStorage, S3Storage
+from scan_storage import serve_scan_object
+from scan_renditions import RENDITION_SIZES, rendition_for, rendition_key, generate_renditions
+
+KEY = "blobs/ab/cd/abcd1234.jpg"
+CONTENT = b"\xff\xd8\xff" + b"scan-bytes" * 50000  # spans several chunks
+
+def write_temp_file(content: bytes = CONTENT) -> str:
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    return path
+
+def check_backend(storage):
+    local_path = write_temp_file()
+    storage.put_file(KEY, local_path)
+    assert not os.path.exists(local_path), "put_file should consume the local file"
+
+    assert storage.exists(KEY)
+    assert storage.size(KEY) == len(CONTENT)
+    assert b"".join(storage.iter_chunks(KEY, chunk_size=64 * 1024)) == CONTENT
+    assert [(item.key, item.size) for item in storage.list_objects("blobs/")] == [(KEY, len(CONTENT))]
+    assert list(storage.list_objects("other/")) == []
+
+    storage.touch(KEY)
+    assert storage.size("blobs/missing.jpg") is None
+    with pytest.raises(ValueError):
+        storage.size("../outside.jpg")
+
+    storage.delete(KEY)
+    assert not storage.exists(KEY)
+    storage.delete(KEY)  # deleting a missing object is not an error
+
+def serving_client(storage, monkeypatch) -> TestClient:
+    monkeypatch.setattr(object_storage, "storage", storage)
+    app = FastAPI()
+    app.get("/uploads/{key:path}")(serve_scan_object)
+    return TestClient(app)
+
+def test_local_storage(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    check_backend(storage)
+    assert os.listdir(tmp_path) == [], "empty shard directories should be removed"
+
+def test_backends_must_implement_the_interface():
+    class Incomplete(ObjectStorage):
+        def size(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_renditions(tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setattr(object_storage, "storage", storage)
+
+    path = write_temp_file(b"")
+    Image.new("RGB", (3000, 2000), (90, 90, 90)).save(path, "JPEG")
+    storage.put_file(KEY, path)
+    # Not generated yet: the original is served, nothing is generated on request
+    assert all(rendition_for(KEY, size) is None for size in RENDITION_SIZES)
+    assert list(storage.list_objects("renditions/")) == []
+
+    assert generate_renditions(KEY) == {size: rendition_key(KEY, size) for size in RENDITION_SIZES}
+    for size, edge in RENDITION_SIZES.items():
+        key = rendition_for(KEY, size)
+        assert key == rendition_key(KEY, size)
+        with Image.open(os.path.join(str(tmp_path), *key.split("/"))) as rendition:
+            assert max(rendition.size) == edge
+            assert rendition.size[0] > rendition.size[1], "aspect ratio should be kept"
+        assert storage.size(key) < storage.size(KEY)
+    assert rendition_for(KEY, "full") is None
+
+    # Not an image: no renditions, the original is served instead
+    storage.put_file("blobs/ef/gh/notes.txt", write_temp_file(b"not an image"))
+    assert generate_renditions("blobs/ef/gh/notes.txt") == {}
+    assert rendition_for("blobs/ef/gh/notes.txt", "thumbnail") is None
+
+def test_local_storage_serves_stream(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path))
+    storage.put_file(KEY, write_temp_file())
+    client = serving_client(storage, monkeypatch)
+
+    response = client.get(f"/uploads/{KEY}")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "immutable" in response.headers["cache-control"]
+    assert client.get("/uploads/blobs/missing.jpg").status_code == 404
+    assert client.get("/uploads/.incoming/partial").status_code == 404
+
+@pytest.fixture
+def s3_endpoint():
+    pytest.importorskip("boto3")
+    moto_server = pytest.importorskip("moto.server")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.stop()
+
+def make_s3_storage(endpoint: str, presigned_reads: bool) -> S3Storage:
+    storage = S3Storage("scans", endpoint_url=endpoint, region="us-east-1", presigned_reads=presigned_reads)
+    storage.client.create_bucket(Bucket="scans")
+    return storage
+
+def test_s3_storage(s3_endpoint):
+    check_backend(make_s3_storage(s3_endpoint, presigned_reads=False))
+
+def test_s3_storage_presigned_reads(s3_endpoint, monkeypatch):
+    storage = make_s3_storage(s3_endpoint, presigned_reads=True)
+    storage.put_file(KEY, write_temp_file())
+    client = serving_client(storage, monkeypatch)
+
+    response = client.get(f"/uploads/{KEY}", follow_redirects=False)
+    assert response.status_code == 307
+    fetched = requests.get(response.headers["location"])
+    assert fetched.status_code == 200
+    assert fetched.content == CONTENT
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
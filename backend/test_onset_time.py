@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for onset time: parsing the free-text time since onset, the elapsed
+time eligibility sees, and the one-time backfill of Patient.onset_at.
+"""
+
+import math
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, create_db_engine
+from models import Patient, StrokeScan, NIHSSAssessment
+from onset_time import parse_time_since_onset, hours_since_onset
+from tpa_eligibility import check_tpa_eligibility, eligibility_inputs
+from migrate_schema import backfill_onset
+
+@pytest.mark.parametrize("text, expected", [
+    ("2 hours", timedelta(hours=2)),
+    ("1.5 hours", timedelta(hours=1, minutes=30)),
+    ("45 minutes", timedelta(minutes=45)),
+    ("1 hour", timedelta(hours=1)),
+    ("an hour", timedelta(hours=1)),
+    ("1h 30m", timedelta(hours=1, minutes=30)),
+    ("1h30m", timedelta(hours=1, minutes=30)),
+    ("2:15", timedelta(hours=2, minutes=15)),
+    ("90 mins", timedelta(minutes=90)),
+    ("3 hrs", timedelta(hours=3)),
+    ("1 day", timedelta(days=1)),
+    ("About 2 hours and 10 minutes ago", timedelta(hours=2, minutes=10)),
+    ("this morning", None),
+    ("2", None),
+    ("2 months", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_time_since_onset(text, expected):
+    assert parse_time_since_onset(text) == expected
+
+def test_hours_since_onset():
+    onset = datetime(2024, 1, 1, 8, 0)
+    assert hours_since_onset(onset, datetime(2024, 1, 1, 11, 30)) == 3.5
+    assert hours_since_onset(onset, datetime(2024, 1, 1, 7, 0)) == 0.0
+    assert hours_since_onset(None, datetime(2024, 1, 1)) == math.inf
+    assert hours_since_onset(onset, None) == math.inf
+
+def test_eligibility_uses_elapsed_time():
+    now = datetime.now()
+    patient = Patient(age=60, inr=1.0, heart_rate=80, temperature=98.6, oxygen_saturation=98,
+                      systolic_bp=140, diastolic_bp=85, glucose=110, platelet_count=250,
+                      onset_at=now - timedelta(hours=2))
+
+    assert check_tpa_eligibility(eligibility_inputs(patient, 10, "yes", at=now))[0]
+    late = eligibility_inputs(patient, 10, "yes", at=now + timedelta(hours=3))
+    assert late["hours_since_onset"] == pytest.approx(5)
+    assert check_tpa_eligibility(late) == (
+        False, "Initial Assessment: Patient presented beyond 4.5-hour treatment window")
+
+    patient.onset_at = None
+    assert not check_tpa_eligibility(eligibility_inputs(patient, 10, "yes", at=now))[0]
+
+def test_backfill_counts_back_from_first_activity(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'onset.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    assessed = datetime(2024, 3, 1, 10, 0)
+    known = datetime(2024, 2, 1, 9, 0)
+
+    with Session() as db:
+        patients = [
+            Patient(code="A", time_since_onset="2 hours"),
+            Patient(code="B", time_since_onset="sometime yesterday"),
+            Patient(code="C", time_since_onset="1 hour"),
+            Patient(code="D", time_since_onset="1 hour", onset_at=known),
+        ]
+        db.add_all(patients)
+        db.flush()
+        db.add(NIHSSAssessment(patient_id=patients[0].id, total_score=8, timestamp=assessed))
+        db.add(StrokeScan(patient_id=patients[0].id, timestamp=assessed + timedelta(minutes=20)))
+        db.add(NIHSSAssessment(patient_id=patients[1].id, total_score=8, timestamp=assessed))
+        db.commit()
+
+        assert backfill_onset(db, dry_run=True)["backfilled"] == 1
+        assert db.query(Patient).filter_by(code="A").one().onset_at is None
+
+        stats = backfill_onset(db)
+        assert stats == {"backfilled": 1, "unparsed": [("B", "sometime yesterday")], "no_reference": ["C"]}
+        db.expire_all()
+        onsets = {patient.code: patient.onset_at for patient in db.query(Patient)}
+        assert onsets == {"A": assessed - timedelta(hours=2), "B": None, "C": None, "D": known}
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for password hashing: round trips, the stored format, rehashing of
+plaintext rows and of rows hashed with another cost, the login endpoint
+upgrading a plaintext row on the user's first successful login, and
+registration storing a hash.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+import auth
+from database import Base, create_db_engine, get_async_db
+from models import User, Patient
+from passwords import hash_password, verify_password, needs_rehash, check_password, is_hashed
+from session_store import MemorySessionStore
+
+ITERATIONS = 1000  # cheap for tests
+
+def test_hash_and_verify():
+    stored = hash_password("s3cret", ITERATIONS)
+    assert stored.startswith(f"pbkdf2_sha256${ITERATIONS}$")
+    assert "s3cret" not in stored
+    assert hash_password("s3cret", ITERATIONS) != stored, "salted"
+    assert verify_password("s3cret", stored)
+    assert not verify_password("s3cret ", stored)
+    assert not verify_password("", stored)
+    assert not verify_password("s3cret", None)
+
+def test_plaintext_rows():
+    assert not is_hashed("password123")
+    assert verify_password("password123", "password123")
+    assert not verify_password("password12", "password123")
+    assert not verify_password("x", "pbkdf2_sha256$1000$not base64$")
+    assert needs_rehash("password123")
+
+def test_rehash_on_cost_change():
+    stored = hash_password("s3cret", ITERATIONS)
+    assert not needs_rehash(stored, ITERATIONS)
+    assert needs_rehash(stored, ITERATIONS * 2)
+
+def test_check_password_returns_a_new_hash_only_when_needed(monkeypatch):
+    monkeypatch.setattr("passwords.PASSWORD_HASH_ITERATIONS", ITERATIONS)
+    assert check_password("wrong", "password123") == (False, None)
+    valid, new_hash = check_password("password123", "password123")
+    assert valid and verify_password("password123", new_hash) and not needs_rehash(new_hash)
+    assert check_password("password123", new_hash) == (True, None)
+
+def auth_client(url) -> TestClient:
+    """The auth routes on the database at `url`, with sessions kept in memory."""
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{url}")
+    AsyncSession = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async def override_db():
+        async with AsyncSession() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(auth.router)
+    app.dependency_overrides[get_async_db] = override_db
+    return TestClient(app)
+
+def test_login_upgrades_plaintext_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr("passwords.PASSWORD_HASH_ITERATIONS", ITERATIONS)
+    monkeypatch.setattr(auth, "session_store", MemorySessionStore())
+    url = tmp_path / "login.db"
+    sync_engine = create_db_engine(f"sqlite:///{url}")
+    Base.metadata.create_all(bind=sync_engine)
+    Session = sessionmaker(bind=sync_engine)
+    with Session() as db:
+        db.add(User(username="tech1", password="password123", role="Technician"))
+        db.commit()
+    client = auth_client(url)
+
+    def login(password):
+        return client.post("/login", data={"username": "tech1", "password": password, "role": "Technician"},
+                           follow_redirects=False)
+
+    assert login("wrong").status_code == 401
+    with Session() as db:
+        assert db.query(User).one().password == "password123", "unchanged after a failed login"
+
+    assert login("password123").status_code == 302
+    with Session() as db:
+        stored = db.query(User).one().password
+    assert is_hashed(stored) and verify_password("password123", stored)
+
+    assert login("password123").status_code == 302
+    assert login("wrong").status_code == 401
+    with Session() as db:
+        assert db.query(User).one().password == stored, "not rehashed again"
+
+def test_register_stores_a_hash_and_links_the_patient(tmp_path, monkeypatch):
+    monkeypatch.setattr("passwords.PASSWORD_HASH_ITERATIONS", ITERATIONS)
+    url = tmp_path / "register.db"
+    sync_engine = create_db_engine(f"sqlite:///{url}")
+    Base.metadata.create_all(bind=sync_engine)
+    Session = sessionmaker(bind=sync_engine)
+    with Session() as db:
+        db.add(Patient(name="Patient", code="RG1"))
+        db.commit()
+    client = auth_client(url)
+
+    def register(username, code):
+        return client.post("/register", data={"username": username, "password": "s3cret", "code": code})
+
+    assert "Registration successful" in register("pat1", "RG1").text
+    assert "Username already exists" in register("pat1", "RG1").text
+    assert "No matching patient code" in register("pat2", "missing").text
+    with Session() as db:
+        users = {user.username: user for user in db.query(User)}
+        assert set(users) == {"pat1", "pat2"}
+        assert verify_password("s3cret", users["pat1"].password) and not needs_rehash(users["pat1"].password)
+        assert db.query(Patient).one().linked_user_id == users["pat1"].id
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
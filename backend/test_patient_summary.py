@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for GET /api/patients/summary: per-patient scan counts and latest scan
+from one SQL statement, selection by code, and keyset pages.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from fastapi import Response
+from sqlalchemy import event
+
+from models import Patient, StrokeScan
+from pagination import PageParams, ScanFilters
+from upload_router import get_patients_summary
+from test_query_counts import make_session
+
+NOW = datetime(2026, 3, 4, 15, 30)
+
+def summary(db, response=None, codes=None, **page_args):
+    return get_patients_summary(response=response or Response(), codes=codes, page=PageParams(**page_args),
+                                filters=ScanFilters(), db=db)
+
+def seed(db):
+    with_scans = Patient(name="With scans", code="SUM1")
+    without_scans = Patient(name="No scans", code="SUM2")
+    db.add_all([with_scans, without_scans])
+    db.flush()
+    db.add_all([
+        StrokeScan(patient_id=with_scans.id, eligible=True, status="reviewed", timestamp=NOW - timedelta(days=2)),
+        StrokeScan(patient_id=with_scans.id, eligible=False, status="ready_for_review", timestamp=NOW),
+        StrokeScan(patient_id=with_scans.id, eligible=None, status="pending", timestamp=NOW - timedelta(days=1)),
+    ])
+    db.commit()
+
+def test_counts_and_latest_scan():
+    engine, db = make_session(0)
+    seed(db)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    rows = {row["code"]: row for row in summary(db)}
+    db.close()
+
+    assert len(statements) == 1
+    first = rows["SUM1"]
+    assert (first["scan_count"], first["eligible_scans"], first["not_eligible_scans"]) == (3, 1, 1)
+    assert first["latest_scan"]["status"] == "ready_for_review"
+    assert first["latest_scan"]["timestamp"] == NOW.strftime("%Y-%m-%d %H:%M")
+    assert (rows["SUM2"]["scan_count"], rows["SUM2"]["latest_scan"]) == (0, None)
+
+def test_codes_and_pages():
+    engine, db = make_session(5)
+    try:
+        assert [row["code"] for row in summary(db, codes=["QC0003", "QC0001", "missing"])] == ["QC0001", "QC0003"]
+
+        seen, after = [], None
+        while True:
+            response = Response()
+            rows = summary(db, response, limit=2, after=after)
+            assert all(row["scan_count"] == 3 for row in rows)
+            seen.extend(row["code"] for row in rows)
+            after = response.headers.get("X-Next-Cursor")
+            if after is None:
+                break
+            after = int(after)
+    finally:
+        db.close()
+    assert seen == [f"QC{i:04d}" for i in range(5)]
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
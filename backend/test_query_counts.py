@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Query-count regression tests for the dashboard detail endpoints.
+Each endpoint must issue the same number of SQL statements no matter how
+many scans it returns (no per-row lazy loads of scan.patient / patient.scans).
+"""
+
+import inspect
+from datetime import datetime
+from fastapi import Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models import Patient, StrokeScan
+import upload_router
+from pagination import PageParams, ScanFilters, MAX_PAGE_SIZE
+
+DETAIL_ENDPOINTS = [
+    upload_router.get_new_cases_detail,
+    upload_router.get_reviewed_today_detail,
+    upload_router.get_eligible_tpa_detail,
+    upload_router.get_not_eligible_detail,
+    upload_router.get_total_patients_detail,
+    upload_router.get_pending_scans_detail,
+    upload_router.get_eligible_scans_detail,
+    upload_router.get_not_eligible_scans_detail,
+    upload_router.get_sent_to_doctor_scans_detail,
+]
+
+def make_session(patient_count: int):
+    """Create an in-memory database with patient_count patients, each with one scan per status."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False, autocommit=False)()
+
+    for i in range(patient_count):
+        patient = Patient(name=f"Patient {i}", age=60, gender="Female", code=f"QC{i:04d}")
+        db.add(patient)
+        db.flush()
+        for status, eligible in [("ready_for_review", True), ("reviewed", False), ("pending", None)]:
+            db.add(StrokeScan(patient_id=patient.id, status=status, eligible=eligible, timestamp=datetime.now()))
+    db.commit()
+    db.expunge_all()
+    return engine, db
+
+def call_endpoint(endpoint, db, response=None, **page_args):
+    """Call a route function directly, supplying the pagination dependencies it declares."""
+    params = inspect.signature(endpoint).parameters
+    kwargs = {"db": db}
+    if "page" in params:
+        kwargs["page"] = PageParams(**page_args) if page_args else PageParams(limit=MAX_PAGE_SIZE)
+    if "filters" in params:
+        kwargs["filters"] = ScanFilters()
+    if "response" in params:
+        kwargs["response"] = response or Response()
+    return endpoint(**kwargs)
+
+def count_queries(patient_count: int, endpoint):
+    engine, db = make_session(patient_count)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        result = call_endpoint(endpoint, db)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        db.close()
+    return len(statements), result
+
+def test_detail_endpoints_issue_constant_queries():
+    for endpoint in DETAIL_ENDPOINTS:
+        few_queries, few_rows = count_queries(2, endpoint)
+        many_queries, many_rows = count_queries(25, endpoint)
+
+        assert len(many_rows) > len(few_rows), endpoint.__name__
+        assert few_queries == many_queries, (
+            f"{endpoint.__name__} issued {few_queries} queries for 2 patients "
+            f"but {many_queries} for 25"
+        )
+
+def test_total_patients_detail_counts_scans():
+    engine, db = make_session(3)
+    try:
+        rows = call_endpoint(upload_router.get_total_patients_detail, db)
+    finally:
+        db.close()
+    assert [row["scan_count"] for row in rows] == [3, 3, 3]
+
+def test_scans_without_a_patient_are_listed():
+    engine, db = make_session(1)
+    db.add(StrokeScan(patient_id=999, status="ready_for_review", eligible=True, timestamp=datetime.now()))
+    db.commit()
+    try:
+        rows = call_endpoint(upload_router.get_new_cases_detail, db)
+        assert [row["patient_code"] for row in rows] == ["QC0000", None]
+        assert rows[1]["chief_complaint"] == "N/A"
+        rows = call_endpoint(upload_router.get_sent_to_doctor_scans_detail, db)
+        assert [row["patient_name"] for row in rows] == ["Patient 0", None]
+    finally:
+        db.close()
+
+def test_keyset_pagination_walks_all_rows():
+    engine, db = make_session(5)
+    seen = []
+    after = None
+    try:
+        while True:
+            response = Response()
+            rows = call_endpoint(upload_router.get_new_cases_detail, db, response, limit=2, after=after)
+            seen.extend(row["scan_id"] for row in rows)
+            after = response.headers.get("X-Next-Cursor")
+            if after is None:
+                break
+            after = int(after)
+    finally:
+        db.close()
+    assert len(seen) == 5
+    assert seen == sorted(seen)
+
+if __name__ == "__main__":
+    test_detail_endpoints_issue_constant_queries()
+    test_total_patients_detail_counts_scans()
+    test_scans_without_a_patient_are_listed()
+    test_keyset_pagination_walks_all_rows()
+    print("Query-count checks passed")
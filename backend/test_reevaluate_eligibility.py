@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for bulk eligibility re-evaluation: results agree with the scalar
+evaluator, each scan is paired with the NIHSS assessment taken before it, dry
+runs write nothing, re-runs are no-ops and the dashboard counters stay correct.
+"""
+
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+pytest.importorskip("numpy")
+
+from database import Base, create_db_engine
+from models import Patient, StrokeScan, NIHSSAssessment
+from dashboard_counters import rebuild_counters, check_counters
+from tpa_eligibility import check_tpa_eligibility, eligibility_inputs
+from reevaluate_eligibility import reevaluate_eligibility, scans_with_assessment
+
+@pytest.fixture
+def session_factory(tmp_path):
+    # A file database: reads and writes go through separate connections
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'reevaluate.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+def seed(session_factory, patients: int = 30):
+    now = datetime.now()
+    with session_factory() as db:
+        for i in range(patients):
+            # Onset 3-5 hours before now: the second scan falls inside or outside the window
+            patient = Patient(name=f"P{i}", age=15 + i * 3, gender="Female", code=f"R{i:03d}",
+                              systolic_bp=150 + i * 2, inr=0.9 + i * 0.05, glucose=100,
+                              onset_at=now - timedelta(hours=3 + i % 3))
+            db.add(patient)
+            db.flush()
+            # NIHSS 2 before the first scan, 12 before the second
+            db.add(NIHSSAssessment(patient_id=patient.id, total_score=2, timestamp=now - timedelta(hours=3)))
+            db.add(NIHSSAssessment(patient_id=patient.id, total_score=12, timestamp=now - timedelta(hours=1)))
+            db.add(StrokeScan(patient_id=patient.id, timestamp=now - timedelta(hours=2), eligible=True,
+                              eligibility_result="stale", status="ready_for_review",
+                              doctor_comment="Scan type: CT, Imaging confirmed: yes"))
+            db.add(StrokeScan(patient_id=patient.id, timestamp=now, eligible=None, status="pending",
+                              prediction="Ischemic Stroke"))
+            # Imaging confirmation unknown: left alone
+            db.add(StrokeScan(patient_id=patient.id, timestamp=now, eligible=True, eligibility_result="manual"))
+        db.commit()
+        rebuild_counters(db)
+
+def run(session_factory, **options):
+    with session_factory() as read_db, session_factory() as write_db:
+        return reevaluate_eligibility(read_db, write_db, batch_size=7, **options)
+
+def test_reevaluation_matches_scalar_evaluator(session_factory):
+    seed(session_factory)
+    stats = run(session_factory)
+
+    assert stats["scans"] == 90
+    assert stats["evaluated"] == 60
+    assert stats["skipped_unknown_imaging"] == 30
+    assert stats["changed"] == stats["evaluated"] - stats["unchanged"]
+    assert stats["new_reasons"]["Initial Assessment: Patient presented beyond 4.5-hour treatment window"] == 10
+
+    with session_factory() as db:
+        for scan in db.query(StrokeScan).filter(StrokeScan.eligibility_result != "manual"):
+            nihss = 2 if scan.status == "ready_for_review" else 12
+            expected = check_tpa_eligibility(eligibility_inputs(scan.patient, nihss, "yes", at=scan.timestamp))
+            assert (scan.eligible, scan.eligibility_result) == expected
+        assert db.query(StrokeScan).filter(StrokeScan.eligibility_result == "manual").count() == 30
+        assert check_counters(db) == []
+
+    assert run(session_factory)["changed"] == 0
+
+def test_dry_run_writes_nothing(session_factory):
+    seed(session_factory)
+    stats = run(session_factory, dry_run=True)
+    assert stats["changed"] > 0
+    with session_factory() as db:
+        assert db.query(StrokeScan).filter(StrokeScan.eligibility_result == "stale").count() == 30
+
+def test_merge_pairs_latest_earlier_assessment():
+    class Row:
+        def __init__(self, **fields):
+            self.__dict__.update(fields)
+
+    t = datetime(2024, 1, 1)
+    scans = [Row(patient_id=1, timestamp=t), Row(patient_id=1, timestamp=t + timedelta(hours=2)),
+             Row(patient_id=2, timestamp=t), Row(patient_id=4, timestamp=t)]
+    assessments = [Row(patient_id=1, timestamp=t - timedelta(hours=1), total_score=5),
+                   Row(patient_id=1, timestamp=t + timedelta(hours=1), total_score=9),
+                   Row(patient_id=3, timestamp=t, total_score=7),
+                   Row(patient_id=4, timestamp=t + timedelta(hours=1), total_score=8)]
+
+    pairs = [(scan.patient_id, assessment.total_score if assessment else None)
+             for scan, assessment in scans_with_assessment(scans, assessments)]
+    assert pairs == [(1, 5), (1, 9), (2, None), (4, None)]
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
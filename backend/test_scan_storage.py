@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Tests for scan uploads: streaming to a temporary file with a size limit,
+storing the result in the (local filesystem) object storage, the per-blob
+reference counts, garbage collection of blobs no scan references, which also
+fills in the size of new blobs, and queueing renditions for older scans.
+"""
+
+import io
+import os
+import json
+import time
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.orm import sessionmaker
+
+import object_storage
+import scan_storage
+from database import Base, create_db_engine
+from models import Patient, StrokeScan, ScanBlob, Job
+from object_storage import LocalStorage
+from scan_storage import (store_scan, storage_key, recount_references, collect_garbage, enqueue_missing_renditions,
+                          RENDITIONS_JOB)
+from scan_renditions import RENDITION_SIZES, rendition_key
+from streaming_upload import stream_to_temp_file, CHUNK_SIZE
+
+DAY = 24 * 60 * 60
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path / "uploads"))
+    monkeypatch.setattr(object_storage, "storage", storage)
+    monkeypatch.setattr(scan_storage, "INCOMING_DIR", str(tmp_path / "uploads" / ".incoming"))
+    return storage
+
+def upload(content: bytes, filename: str = "scan.jpg", size=None) -> UploadFile:
+    # size is what the client declared; None when it wasn't sent
+    return UploadFile(file=io.BytesIO(content), filename=filename, size=size)
+
+def test_stream_to_temp_file(tmp_path):
+    content = os.urandom(CHUNK_SIZE * 2 + 17)
+    saved = asyncio.run(stream_to_temp_file(upload(content), str(tmp_path)))
+    with open(saved.path, "rb") as f:
+        assert f.read() == content
+    assert saved.size == len(content)
+
+def test_oversized_upload_is_rejected_without_a_temp_file(tmp_path):
+    # Larger than the limit, found while streaming
+    with pytest.raises(HTTPException) as streamed:
+        asyncio.run(stream_to_temp_file(upload(b"x" * (CHUNK_SIZE + 1)), str(tmp_path), max_bytes=CHUNK_SIZE))
+    assert streamed.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+    # Declared too large up front: rejected before anything is written
+    with pytest.raises(HTTPException) as declared:
+        asyncio.run(stream_to_temp_file(upload(b"x", size=2 * CHUNK_SIZE), str(tmp_path / "declared"),
+                                        max_bytes=CHUNK_SIZE))
+    assert declared.value.status_code == 413
+    assert not os.path.exists(tmp_path / "declared")
+
+def test_store_scan_enforces_max_bytes(storage):
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(store_scan(upload(b"y" * 1000), max_bytes=999))
+    assert rejected.value.status_code == 413
+    assert os.listdir(scan_storage.INCOMING_DIR) == []
+    assert list(storage.list_objects()) == []
+
+    stored = asyncio.run(store_scan(upload(b"y" * 999), max_bytes=999))
+    assert (stored.size, stored.deduplicated) == (999, False)
+    assert storage.size(scan_storage.storage_key(stored.image_path)) == 999
+    assert os.listdir(scan_storage.INCOMING_DIR) == []
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'blobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False, autocommit=False)()
+    db.add(Patient(id=1, name="Patient", code="GC1"))
+    db.commit()
+    yield db
+    db.close()
+
+def store(content: bytes):
+    return asyncio.run(store_scan(upload(content)))
+
+def add_scan(db, image_path: str) -> StrokeScan:
+    scan = StrokeScan(patient_id=1, image_path=image_path, timestamp=datetime.now())
+    db.add(scan)
+    db.commit()
+    return scan
+
+def ref_count(db, image_path: str):
+    blob = db.get(ScanBlob, image_path)
+    db.refresh(blob)
+    return blob.ref_count
+
+def age(storage, db, image_path: str, seconds: float = 2 * DAY):
+    """Make a blob look as if it was last stored and last referenced `seconds` ago."""
+    then = time.time() - seconds
+    os.utime(storage._path(storage_key(image_path)), (then, then))
+    blob = db.get(ScanBlob, image_path)
+    if blob is not None:
+        blob.updated_at = datetime.now() - timedelta(seconds=seconds)
+        db.commit()
+
+def test_reference_counts_follow_scans(storage, db):
+    first = store(b"same image")
+    second = store(b"same image")
+    assert (first.deduplicated, second.deduplicated) == (False, True)
+    assert first.image_path == second.image_path
+    assert len(list(storage.list_objects("blobs/"))) == 1
+
+    scans = [add_scan(db, first.image_path), add_scan(db, second.image_path)]
+    assert ref_count(db, first.image_path) == 2
+
+    db.delete(scans[0])
+    db.commit()
+    assert ref_count(db, first.image_path) == 1
+
+    other = store(b"other image")
+    scans[1].image_path = other.image_path
+    db.commit()
+    assert (ref_count(db, first.image_path), ref_count(db, other.image_path)) == (0, 1)
+
+def test_recount_fixes_wrong_counts(storage, db):
+    stored = store(b"counted image")
+    add_scan(db, stored.image_path)
+    db.get(ScanBlob, stored.image_path).ref_count = 5
+    db.commit()
+
+    assert recount_references(db) == 1
+    assert ref_count(db, stored.image_path) == 1
+    assert recount_references(db) == 0
+
+def test_collect_garbage(storage, db):
+    kept = store(b"referenced image")
+    add_scan(db, kept.image_path)
+    unreferenced = store(b"unreferenced image")
+    db.delete(add_scan(db, unreferenced.image_path))
+    db.commit()
+    recent = store(b"recently unreferenced image")
+    db.delete(add_scan(db, recent.image_path))
+    db.commit()
+    orphan = store(b"never saved on a scan")
+    for image_path in (kept.image_path, unreferenced.image_path, orphan.image_path):
+        age(storage, db, image_path)
+
+    stale = os.path.join(scan_storage.INCOMING_DIR, ".upload-stale.part")
+    fresh = os.path.join(scan_storage.INCOMING_DIR, ".upload-fresh.part")
+    for path in (stale, fresh):
+        with open(path, "wb") as f:
+            f.write(b"partial")
+    os.utime(stale, (time.time() - 2 * DAY, time.time() - 2 * DAY))
+
+    assert db.get(ScanBlob, kept.image_path).size is None, "not looked up while flushing"
+    result = collect_garbage(db)
+    assert (result["removed_rows"], result["removed_objects"]) == (1, 2)
+    assert db.get(ScanBlob, kept.image_path).size == len(b"referenced image")
+    assert db.get(ScanBlob, recent.image_path).size == len(b"recently unreferenced image")
+    assert storage.exists(storage_key(kept.image_path))
+    assert storage.exists(storage_key(recent.image_path)), "still inside the grace window"
+    assert not storage.exists(storage_key(unreferenced.image_path))
+    assert not storage.exists(storage_key(orphan.image_path))
+    assert db.get(ScanBlob, unreferenced.image_path) is None
+    assert db.get(ScanBlob, recent.image_path) is not None
+    assert os.listdir(scan_storage.INCOMING_DIR) == [".upload-fresh.part"]
+
+def test_reuploaded_blob_is_not_collected(storage, db):
+    stored = store(b"old image")
+    db.delete(add_scan(db, stored.image_path))
+    db.commit()
+    age(storage, db, stored.image_path)
+
+    # Uploaded again before its new scan is committed
+    assert store(b"old image").deduplicated
+    result = collect_garbage(db)
+    assert result["removed_objects"] == 0
+    assert storage.exists(storage_key(stored.image_path))
+
+    add_scan(db, stored.image_path)
+    assert ref_count(db, stored.image_path) == 1
+
+def test_missing_renditions_are_queued(storage, db, tmp_path):
+    with_renditions, without = store(b"image with renditions"), store(b"image without renditions")
+    for size in RENDITION_SIZES:
+        rendition = tmp_path / f"{size}.jpg"
+        rendition.write_bytes(b"rendition")
+        storage.put_file(rendition_key(storage_key(with_renditions.image_path), size), str(rendition))
+    for image_path in (with_renditions.image_path, without.image_path, without.image_path, "uploads/missing.jpg"):
+        add_scan(db, image_path)
+
+    assert enqueue_missing_renditions(db) == 1
+    job = db.query(Job).one()
+    assert (job.kind, json.loads(job.payload)) == (RENDITIONS_JOB, {"image_path": without.image_path})
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
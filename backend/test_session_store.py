@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Contract tests for the session stores (memory, database and, when fakeredis is
+installed, Redis): create/get/delete, expiry and sweeping, the memory store's
+LRU bound, and sessions shared between stores on the same database. Signed
+sessions: tampering, expiry, secret rotation and revocation across workers.
+"""
+
+import time
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, create_db_engine
+from session_store import (SessionStore, MemorySessionStore, DatabaseSessionStore, RedisSessionStore,
+                           SignedSessionStore, SessionSweeper)
+
+USER = {"user_id": 7, "username": "tech1", "role": "Technician"}
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'sessions.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+@pytest.fixture(params=["memory", "database", "redis"])
+def make_store(request, session_factory):
+    if request.param == "memory":
+        return lambda ttl_seconds=60: MemorySessionStore(ttl_seconds=ttl_seconds)
+    if request.param == "database":
+        return lambda ttl_seconds=60: DatabaseSessionStore(session_factory, ttl_seconds=ttl_seconds)
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    return lambda ttl_seconds=60: RedisSessionStore(ttl_seconds=ttl_seconds, client=fakeredis.FakeRedis(server=server))
+
+def test_create_get_delete(make_store):
+    store = make_store()
+    session_id = store.create(USER)
+    other_id = store.create(dict(USER, user_id=8))
+    assert session_id != other_id
+    assert store.get(session_id) == USER
+    assert store.get("not-a-session") is None
+    assert store.count() == 2
+
+    store.delete(session_id)
+    store.delete(session_id)  # deleting twice is fine
+    assert store.get(session_id) is None
+    assert store.get(other_id)["user_id"] == 8
+
+def test_expired_sessions_are_not_returned_and_are_swept(make_store):
+    store = make_store(ttl_seconds=1)
+    ids = [store.create(USER) for _ in range(3)]
+    assert store.get(ids[0]) == USER
+    time.sleep(1.1)
+    assert store.get(ids[0]) is None
+    store.sweep()
+    assert store.count() == 0
+
+def test_sessions_are_shared_through_the_database(session_factory):
+    # Two workers, each with its own store object
+    first, second = DatabaseSessionStore(session_factory), DatabaseSessionStore(session_factory)
+    session_id = first.create(USER)
+    assert second.get(session_id) == USER
+    second.delete(session_id)
+    assert first.get(session_id) is None
+
+def test_memory_store_is_bounded():
+    store = MemorySessionStore(max_entries=3)
+    ids = [store.create(dict(USER, user_id=i)) for i in range(3)]
+    store.get(ids[0])  # most recently used now
+    store.create(USER)
+    assert store.count() == 3
+    assert store.get(ids[1]) is None, "the least recently used session is dropped"
+    assert store.get(ids[0]) is not None
+
+def test_stores_must_implement_the_interface():
+    class Incomplete(SessionStore):
+        def get(self, session_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_sweeper_thread():
+    store = MemorySessionStore(ttl_seconds=0)
+    for _ in range(5):
+        store.create(USER)
+    sweeper = SessionSweeper(store, interval_seconds=0.05)
+    sweeper.start()
+    try:
+        deadline = time.time() + 5
+        while store.count() and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        sweeper.stop()
+    assert store.count() == 0
+
+def test_signed_sessions_need_no_server_state(session_factory):
+    store = SignedSessionStore(["secret"], session_factory=session_factory)
+    session_id = store.create(USER)
+    assert store.get(session_id) == USER
+    # Another worker with the same secret accepts it too
+    assert SignedSessionStore(["secret"], session_factory=session_factory).get(session_id) == USER
+
+    payload, signature = session_id.split(".")
+    forged = SignedSessionStore(["other"], session_factory=session_factory).create(dict(USER, role="Physician"))
+    for bad in [f"{forged.split('.')[0]}.{signature}", f"{payload}.{signature[:-2]}", payload, "", "é.é", "a.b.c"]:
+        assert store.get(bad) is None
+
+def test_signed_sessions_expire(session_factory):
+    store = SignedSessionStore(["secret"], ttl_seconds=-1, session_factory=session_factory)
+    assert store.get(store.create(USER)) is None
+
+def test_signed_session_secret_rotation(session_factory):
+    old = SignedSessionStore(["old"], session_factory=session_factory)
+    session_id = old.create(USER)
+    rotated = SignedSessionStore(["new", "old"], session_factory=session_factory)
+    assert rotated.get(session_id) == USER
+    assert SignedSessionStore(["new"], session_factory=session_factory).get(session_id) is None
+    assert rotated.create(USER).split(".")[1] != old.create(USER).split(".")[1]
+
+def test_signed_session_revocation(session_factory):
+    first = SignedSessionStore(["secret"], session_factory=session_factory)
+    second = SignedSessionStore(["secret"], session_factory=session_factory)
+    session_id, other_id = first.create(USER), first.create(USER)
+
+    first.delete(session_id)  # logout on the first worker
+    assert first.get(session_id) is None
+    assert first.get(other_id) == USER
+    assert second.get(session_id) == USER, "until the next sync"
+    second.sweep()
+    assert second.get(session_id) is None
+    assert second.count() == 1
+
+    # Revocations are forgotten once the cookie has expired anyway
+    expired = SignedSessionStore(["secret"], ttl_seconds=1, session_factory=session_factory)
+    expired.delete(expired.create(USER))
+    time.sleep(1.1)
+    assert expired.sweep() == 1
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
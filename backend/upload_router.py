@@ -1,19 +1,26 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Response, Query
 from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime
+from sqlalchemy.orm import Session, contains_eager, aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, and_
+from datetime import datetime, timedelta
+from typing import List, Optional
 import os
-import requests
 import json
-from database import SessionLocal
+from database import SessionLocal, get_read_db, get_async_db
 from models import Patient, StrokeScan, NIHSSAssessment, TreatmentPlan
 from tpa_eligibility import check_tpa_eligibility
 from chatgpt_service import get_chatgpt_service
+from llm_client import llm_client, LLMError
+from llm_cache import cached_chat, llm_response_cache
+from stats_service import technician_dashboard_stats, physician_dashboard_stats
+from scan_storage import store_scan, serve_scan_image, enqueue_scan_processing
+from job_queue import worker_pool
+from scan_renditions import FULL, RENDITION_SIZES
+from pagination import PageParams, ScanFilters, keyset_page
+from current_user import CurrentUser, require_user, require_staff, require_patient_access, can_access_patient
 
 router = APIRouter()
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 def get_db():
     db = SessionLocal()
@@ -22,7 +29,44 @@ def get_db():
     finally:
         db.close()
 
-@router.post("/upload-scan/")
+def bypass_cache_requested(request: dict) -> bool:
+    """The request's "bypass_cache": a JSON boolean, or the string "true" or "false"."""
+    value = request.get("bypass_cache", False)
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    if not isinstance(value, bool):
+        raise HTTPException(status_code=400, detail="bypass_cache must be true or false")
+    return value
+
+def scans_with_patients(db: Session, *criteria):
+    """
+    Scans matching the given filters with their patient loaded in the same
+    query, so list endpoints don't issue one SELECT per row for scan.patient.
+    An outer join: a scan whose patient row is missing is still listed.
+    """
+    return db.query(StrokeScan).outerjoin(StrokeScan.patient).options(
+        contains_eager(StrokeScan.patient)
+    ).filter(*criteria)
+
+def patient_columns(patient: Optional[Patient], missing_complaint: Optional[str] = None) -> dict:
+    """The patient fields of a scan list row; None for a scan without a patient."""
+    return {
+        "patient_code": patient.code if patient else None,
+        "patient_name": patient.name if patient else None,
+        "patient_age": patient.age if patient else None,
+        "patient_gender": patient.gender if patient else None,
+        "chief_complaint": (patient.chief_complaint if patient else None) or missing_complaint,
+    }
+
+def patients_matching(db: Session, filters: ScanFilters):
+    """Patients, restricted to those with at least one scan matching the filters if any are set."""
+    query = db.query(Patient)
+    criteria = filters.criteria()
+    if criteria:
+        query = query.filter(Patient.scans.any(and_(*criteria)))
+    return query
+
+@router.post("/upload-scan/", dependencies=[Depends(require_staff)])
 async def upload_scan(
     name: str = Form(...),
     age: int = Form(...),
@@ -51,15 +95,11 @@ async def upload_scan(
     scan: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
-    filename = f"{datetime.now().timestamp()}_{scan.filename}"
-    relative_path = os.path.join("uploads", filename).replace("\\", "/")
-    absolute_path = os.path.abspath(relative_path)
-    with open(absolute_path, "wb") as buffer:
-        buffer.write(await scan.read())
-
     if db.query(Patient).filter_by(code=code).first():
         return HTMLResponse(content="Code already exists", status_code=400)
 
+    stored_scan = await store_scan(scan)
+
     data = {
         "age": age,
         "hours_since_onset": hours_since_onset,
@@ -88,6 +128,8 @@ async def upload_scan(
         name=name,
         age=age,
         gender=gender,
+        time_since_onset=f"{hours_since_onset:g} hours",
+        onset_at=datetime.now() - timedelta(hours=hours_since_onset),
         chief_complaint=chief_complaint,
         systolic_bp=systolic_bp,
         diastolic_bp=diastolic_bp,
@@ -101,14 +143,16 @@ async def upload_scan(
 
     scan_record = StrokeScan(
         patient_id=patient.id,
-        image_path=relative_path,
+        image_path=stored_scan.image_path,
         prediction=reason,
         eligibility_result=reason,
         eligible=eligible,
         timestamp=datetime.now()
     )
     db.add(scan_record)
+    enqueue_scan_processing(db, scan_record.image_path)
     db.commit()
+    worker_pool.notify()
 
     return HTMLResponse(content=f"""
         <html>
@@ -169,9 +213,14 @@ async def upload_scan(
         </html>
     """, status_code=200)
 
-@router.get("/patients/")
-def get_all_patients(db: Session = Depends(get_db)):
-    patients = db.query(Patient).all()
+@router.get("/patients/", dependencies=[Depends(require_staff)])
+def get_all_patients(
+    response: Response,
+    page: PageParams = Depends(),
+    filters: ScanFilters = Depends(),
+    db: Session = Depends(get_read_db)
+):
+    patients = keyset_page(patients_matching(db, filters), Patient.id, page, response)
     return [
         {
             "id": p.id,
@@ -189,7 +238,70 @@ def get_all_patients(db: Session = Depends(get_db)):
         for p in patients
     ]
 
-@router.get("/patients/{patient_code}")
+@router.get("/api/patients/summary", dependencies=[Depends(require_staff)])
+def get_patients_summary(
+    response: Response,
+    codes: Optional[List[str]] = Query(None),
+    page: PageParams = Depends(),
+    filters: ScanFilters = Depends(),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Patients with their scan counts and latest scan in a single query, for list
+    views that would otherwise fetch /patients/{code}/scans once per patient.
+    Pass `codes` to fetch specific patients, or page through all of them.
+    """
+    try:
+        def count_scans(*criteria):
+            return select(func.count(StrokeScan.id)).where(
+                StrokeScan.patient_id == Patient.id, *criteria
+            ).correlate(Patient).scalar_subquery()
+
+        latest_scan_id = select(StrokeScan.id).where(
+            StrokeScan.patient_id == Patient.id
+        ).order_by(StrokeScan.timestamp.desc(), StrokeScan.id.desc()).limit(1).correlate(Patient).scalar_subquery()
+        latest_scan = aliased(StrokeScan)
+
+        query = patients_matching(db, filters).add_columns(
+            count_scans(),
+            count_scans(StrokeScan.eligible == True),
+            count_scans(StrokeScan.eligible == False),
+            latest_scan
+        ).outerjoin(latest_scan, latest_scan.id == latest_scan_id)
+        if codes:
+            query = query.filter(Patient.code.in_(codes))
+
+        rows = keyset_page(query, Patient.id, page, response, row_key=lambda row: row[0].id)
+        return [
+            {
+                "id": p.id,
+                "name": p.name,
+                "age": p.age,
+                "gender": p.gender,
+                "chief_complaint": p.chief_complaint,
+                "code": p.code,
+                "linked_user_id": p.linked_user_id,
+                "systolic_bp": p.systolic_bp,
+                "diastolic_bp": p.diastolic_bp,
+                "glucose": p.glucose,
+                "inr": p.inr,
+                "scan_count": scan_count,
+                "eligible_scans": eligible_scans,
+                "not_eligible_scans": not_eligible_scans,
+                "latest_scan": {
+                    "scan_id": scan.id,
+                    "status": scan.status,
+                    "eligible": scan.eligible,
+                    "eligibility_result": scan.eligibility_result,
+                    "timestamp": scan.timestamp.strftime("%Y-%m-%d %H:%M") if scan.timestamp else None
+                } if scan else None
+            }
+            for p, scan_count, eligible_scans, not_eligible_scans, scan in rows
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching patient summary: {str(e)}")
+
+@router.get("/patients/{patient_code}", dependencies=[Depends(require_patient_access)])
 def get_patient_by_code(patient_code: str, db: Session = Depends(get_db)):
     patient = db.query(Patient).filter(Patient.code == patient_code).first()
     if not patient:
@@ -219,7 +331,7 @@ def get_patient_by_code(patient_code: str, db: Session = Depends(get_db)):
         ]
     }
 
-@router.get("/patients/{patient_code}/scans")
+@router.get("/patients/{patient_code}/scans", dependencies=[Depends(require_patient_access)])
 def get_patient_scans(patient_code: str, db: Session = Depends(get_db)):
     patient = db.query(Patient).filter_by(code=patient_code).first()
     if not patient:
@@ -246,7 +358,24 @@ def get_patient_scans(patient_code: str, db: Session = Depends(get_db)):
         ]
     }
 
-@router.post("/scans/{scan_id}/comment")
+@router.get("/scans/{scan_id}/image")
+def get_scan_image(
+    scan_id: int,
+    size: str = Query(FULL, description="thumbnail, preview or full"),
+    user: CurrentUser = Depends(require_user),
+    db: Session = Depends(get_read_db)
+):
+    """Scan image at the requested size; list views should use thumbnail or preview."""
+    if size != FULL and size not in RENDITION_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of: {', '.join(list(RENDITION_SIZES) + [FULL])}")
+    scan = db.query(StrokeScan.image_path, StrokeScan.patient_id).filter(StrokeScan.id == scan_id).first()
+    if scan is not None and not can_access_patient(user, scan.patient_id):
+        raise HTTPException(status_code=403, detail="Not allowed to access this scan")
+    if scan is None or not scan.image_path:
+        raise HTTPException(status_code=404, detail="Scan image not found")
+    return serve_scan_image(scan.image_path, size)
+
+@router.post("/scans/{scan_id}/comment", dependencies=[Depends(require_staff)])
 def add_doctor_comment(scan_id: int, comment: str = Form(...), db: Session = Depends(get_db)):
     scan = db.query(StrokeScan).filter_by(id=scan_id).first()
     if not scan:
@@ -256,90 +385,38 @@ def add_doctor_comment(scan_id: int, comment: str = Form(...), db: Session = Dep
     return {"message": "Comment added", "scan_id": scan_id}
 
 # Dashboard Statistics Endpoint
-@router.get("/dashboard-stats")
-def get_dashboard_stats(db: Session = Depends(get_db)):
+@router.get("/dashboard-stats", dependencies=[Depends(require_staff)])
+def get_dashboard_stats(db: Session = Depends(get_read_db)):
     try:
-        # Total patients
-        total_patients = db.query(Patient).count()
-        
-        # Total scans
-        total_scans = db.query(StrokeScan).count()
-        
-        # Eligible scans (where eligible = True)
-        eligible_scans = db.query(StrokeScan).filter(StrokeScan.eligible == True).count()
-        
-        # Not eligible scans (where eligible = False)
-        not_eligible_scans = db.query(StrokeScan).filter(StrokeScan.eligible == False).count()
-        
-        # Sent to doctor scans (scans with ready_for_review status)
-        sent_to_doctor_scans = db.query(StrokeScan).filter(StrokeScan.status == "ready_for_review").count()
-        
-        # Recent activity (last 7 days) - using timestamp for scans
-        week_ago = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        week_ago = week_ago.replace(day=week_ago.day - 7)
-        
-        # Since Patient doesn't have created_at, we'll use scans timestamp as proxy
-        recent_scans = db.query(StrokeScan).filter(StrokeScan.timestamp >= week_ago).count()
-        
-        # For recent patients, we'll count patients who have recent scans
-        recent_patients = db.query(Patient).join(StrokeScan).filter(StrokeScan.timestamp >= week_ago).distinct().count()
-        
-        return {
-            "total_patients": total_patients,
-            "total_scans": total_scans,
-            "eligible_scans": eligible_scans,
-            "not_eligible_scans": not_eligible_scans,
-            "sent_to_doctor_scans": sent_to_doctor_scans,
-            "recent_patients": recent_patients,
-            "recent_scans": recent_scans
-        }
+        return technician_dashboard_stats(db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching dashboard stats: {str(e)}")
 
 # Physician Dashboard Statistics Endpoint
-@router.get("/physician-dashboard-stats")
-def get_physician_dashboard_stats(db: Session = Depends(get_db)):
+@router.get("/physician-dashboard-stats", dependencies=[Depends(require_staff)])
+def get_physician_dashboard_stats(db: Session = Depends(get_read_db)):
     try:
-        from datetime import datetime, timedelta
-        
-        # New Cases: Number of patients sent by technicians (ready_for_review status)
-        new_cases = db.query(StrokeScan).filter(StrokeScan.status == "ready_for_review").count()
-        
-        # Reviewed Cases: How many have been checked today (status = "reviewed" and today's date)
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        reviewed_today = db.query(StrokeScan).filter(
-            StrokeScan.status == "reviewed",
-            StrokeScan.timestamp >= today
-        ).count()
-        
-        # Eligible for tPA: Count of confirmed eligible cases (eligible = True)
-        eligible_for_tpa = db.query(StrokeScan).filter(StrokeScan.eligible == True).count()
-        
-        # Not Eligible: Count of rejected cases (eligible = False)
-        not_eligible = db.query(StrokeScan).filter(StrokeScan.eligible == False).count()
-        
-        return {
-            "new_cases": new_cases,
-            "reviewed_today": reviewed_today,
-            "eligible_for_tpa": eligible_for_tpa,
-            "not_eligible": not_eligible
-        }
+        return physician_dashboard_stats(db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching physician dashboard stats: {str(e)}")
 
 # Physician Dashboard Detail Endpoints
-@router.get("/physician-dashboard-details/new-cases")
-def get_new_cases_detail(db: Session = Depends(get_db)):
+@router.get("/physician-dashboard-details/new-cases", dependencies=[Depends(require_staff)])
+def get_new_cases_detail(
+    response: Response,
+    page: PageParams = Depends(),
+    filters: ScanFilters = Depends(),
+    db: Session = Depends(get_read_db)
+):
     try:
-        scans = db.query(StrokeScan).filter(StrokeScan.status == "ready_for_review").all()
+        scans = keyset_page(
+            scans_with_patients(db, StrokeScan.status == "ready_for_review", *filters.criteria()),
+            StrokeScan.id, page, response
+        )
         return [
             {
                 "scan_id": scan.id,
-                "patient_code": scan.patient.code,
-                "patient_name": scan.patient.name,
-                "patient_age": scan.patient.age,
-                "patient_gender": scan.patient.gender,
-                "chief_complaint": scan.patient.chief_complaint or "N/A",
+                **patient_columns(scan.patient, "N/A"),
                 "upload_date": scan.timestamp.strftime("%Y-%m-%d %H:%M") if scan.timestamp else "N/A",
                 "status": scan.status,
                 "diagnosis": scan.prediction or "N/A",
@@ -350,23 +427,29 @@ def get_new_cases_detail(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching new cases: {str(e)}")
 
-@router.get("/physician-dashboard-details/reviewed-today")
-def get_reviewed_today_detail(db: Session = Depends(get_db)):
+@router.get("/physician-dashboard-details/reviewed-today", dependencies=[Depends(require_staff)])
+def get_reviewed_today_detail(
+    response: Response,
+    page: PageParams = Depends(),
+    filters: ScanFilters = Depends(),
+    db: Session = Depends(get_read_db)
+):
     try:
         from datetime import datetime
         today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        scans = db.query(StrokeScan).filter(
-            StrokeScan.status == "reviewed",
-            StrokeScan.timestamp >= today
-        ).all()
+        scans = keyset_page(
+            scans_with_patients(
+                db,
+                StrokeScan.status == "reviewed",
+                StrokeScan.timestamp >= today,
+                *filters.criteria()
+            ),
+            StrokeScan.id, page, response
+        )
         return [
             {
                 "scan_id": scan.id,
-                "patient_code": scan.patient.code,
-                "patient_name": scan.patient.name,
-                "patient_age": scan.patient.age,
-                "patient_gender": scan.patient.gender,
-                "chief_complaint": scan.patient.chief_complaint or "N/A",
+                **patient_columns(scan.patient, "N/A"),
                 "review_date": scan.timestamp.strftime("%Y-%m-%d %H:%M") if scan.timestamp else "N/A",
                 "status": scan.status,
                 "diagnosis": scan.prediction or "N/A",
@@ -378,18 +461,22 @@ def get_reviewed_today_detail(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching reviewed cases: {str(e)}")
 
-@router.get("/physician-dashboard-details/eligible-tpa")
-def get_eligible_tpa_detail(db: Session = Depends(get_db)):
+@router.get("/physician-dashboard-details/eligible-tpa", dependencies=[Depends(require_staff)])
+def get_eligible_tpa_detail(
+    response: Response,
+    page: PageParams = Depends(),
+    filters: ScanFilters = Depends(),
+    db: Session = Depends(get_read_db)
+):
     try:
-        scans = db.query(StrokeScan).filter(StrokeScan.eligible == True).all()
+        scans = keyset_page(
+            scans_with_patients(db, StrokeScan.eligible == True, *filters.criteria()),
+            StrokeScan.id, page, response
+        )
         return [
             {
                 "scan_id": scan.id,
-                "patient_code": scan.patient.code,
-                "patient_name": scan.patient.name,
-                "patient_age": scan.patient.age,
-                "patient_gender": scan.patient.gender,
-                "chief_complaint": scan.patient.chief_complaint or "N/A",
+                **patient_columns(scan.patient, "N/A"),
                 "upload_date": scan.timestamp.strftime("%Y-%m-%d %H:%M") if scan.timestamp else "N/A",
                 "status": scan.status,
                 "diagnosis": scan.prediction or "N/A",
@@ -401,18 +488,22 @@ def get_eligible_tpa_detail(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching eligible cases: {str(e)}")
 
-@router.get("/physician-dashboard-details/not-eligible")
-def get_not_eligible_detail(db: Session = Depends(get_db)):
+@router.get("/physician-dashboard-details/not-eligible", dependencies=[Depends(require_staff)])
+def get_not_eligible_detail(
+    response: Response,
+    page: PageParams = Depends(),
+    filters: ScanFilters = Depends(),
+    db: Session = Depends(get_read_db)
+):
     try:
-        scans = db.query(StrokeScan).filter(StrokeScan.eligible == False).all()
+        scans = keyset_page(
+            scans_with_patients(db, StrokeScan.eligible == False, *filters.criteria()),
+            StrokeScan.id, page, response
+        )
         return [
             {
                 "scan_id": scan.id,
-                "patient_code": scan.patient.code,
-                "patient_name": scan.patient.name,
-                "patient_age": scan.patient.age,
-                "patient_gender": scan.patient.gender,
-                "chief_complaint": scan.patient.chief_complaint or "N/A",
+                **patient_columns(scan.patient, "N/A"),
                 "upload_date": scan.timestamp.strftime("%Y-%m-%d %H:%M") if scan.timestamp else "N/A",
                 "status": scan.status,
                 "diagnosis": scan.prediction or "N/A",
@@ -425,7 +516,7 @@ def get_not_eligible_detail(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error fetching not eligible cases: {str(e)}")
 
 # Scan Decision API for Physician
-@router.post("/scans/{scan_id}/decision")
+@router.post("/scans/{scan_id}/decision", dependencies=[Depends(require_staff)])
 def make_scan_decision(
     scan_id: int,
     request: dict,
@@ -468,7 +559,7 @@ def make_scan_decision(
         raise HTTPException(status_code=500, detail=f"Failed to record decision: {str(e)}")
 
 # Get detailed case information for physician view
-@router.get("/api/cases/{patient_code}")
+@router.get("/api/cases/{patient_code}", dependencies=[Depends(require_patient_access)])
 def get_case_details(patient_code: str, db: Session = Depends(get_db)):
     try:
         patient = db.query(Patient).filter(Patient.code == patient_code).first()
@@ -488,6 +579,7 @@ def get_case_details(patient_code: str, db: Session = Depends(get_db)):
                 "age": patient.age,
                 "gender": patient.gender,
                 "time_since_onset": patient.time_since_onset,
+                "onset_at": patient.onset_at.isoformat() if patient.onset_at else None,
                 "chief_complaint": patient.chief_complaint,
                 "systolic_bp": patient.systolic_bp,
                 "diastolic_bp": patient.diastolic_bp,
@@ -543,7 +635,7 @@ def get_case_details(patient_code: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to get case details: {str(e)}")
 
 # Save doctor comment
-@router.post("/scans/{scan_id}/comment")
+@router.post("/scans/{scan_id}/comment", dependencies=[Depends(require_staff)])
 def save_doctor_comment(
     scan_id: int,
     comment: str = Form(...),
@@ -567,10 +659,23 @@ def save_doctor_comment(
         raise HTTPException(status_code=500, detail=f"Failed to save comment: {str(e)}")
 
 # Detailed data endpoints for each card
-@router.get("/dashboard-details/total-patients")
-def get_total_patients_detail(db: Session = Depends(get_db)):
+@router.get("/dashboard-details/total-patients", dependencies=[Depends(require_staff)])
+def get_total_patients_detail(
+    response: Response,
+    page: PageParams = Depends(),
+    filters: ScanFilters = Depends(),
+    db: Session = Depends(get_read_db)
+):
     try:
-        patients = db.query(Patient).all()
+        # Counted per returned row, so the cost follows the page size rather than the table
+        scan_count = select(func.count(StrokeScan.id)).where(
+            StrokeScan.patient_id == Patient.id
+        ).correlate(Patient).scalar_subquery()
+        rows = keyset_page(
+            patients_matching(db, filters).add_columns(scan_count),
+            Patient.id, page, response,
+            row_key=lambda row: row[0].id
+        )
         return [
             {
                 "id": patient.id,
@@ -579,29 +684,25 @@ def get_total_patients_detail(db: Session = Depends(get_db)):
                 "age": patient.age,
                 "gender": patient.gender,
                 "chief_complaint": patient.chief_complaint or "N/A",
-                "scan_count": len(patient.scans),
+                "scan_count": scan_count,
                 "systolic_bp": patient.systolic_bp,
                 "diastolic_bp": patient.diastolic_bp,
                 "glucose": patient.glucose,
                 "inr": patient.inr
             }
-            for patient in patients
+            for patient, scan_count in rows
         ]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching patients: {str(e)}")
 
-@router.get("/dashboard-details/pending-scans")
-def get_pending_scans_detail(db: Session = Depends(get_db)):
+@router.get("/dashboard-details/pending-scans", dependencies=[Depends(require_staff)])
+def get_pending_scans_detail(db: Session = Depends(get_read_db)):
     try:
-        pending_scans = db.query(StrokeScan).filter(StrokeScan.eligible.is_(None)).all()
+        pending_scans = scans_with_patients(db, StrokeScan.eligible.is_(None)).all()
         return [
             {
                 "scan_id": scan.id,
-                "patient_code": scan.patient.code,
-                "patient_name": scan.patient.name,
-                "patient_age": scan.patient.age,
-                "patient_gender": scan.patient.gender,
-                "chief_complaint": scan.patient.chief_complaint,
+                **patient_columns(scan.patient),
                 "upload_date": scan.timestamp.strftime("%Y-%m-%d %H:%M") if scan.timestamp else "N/A",
                 "status": "Pending Analysis",
                 "image_path": scan.image_path
@@ -611,18 +712,14 @@ def get_pending_scans_detail(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching pending scans: {str(e)}")
 
-@router.get("/dashboard-details/eligible")
-def get_eligible_scans_detail(db: Session = Depends(get_db)):
+@router.get("/dashboard-details/eligible", dependencies=[Depends(require_staff)])
+def get_eligible_scans_detail(db: Session = Depends(get_read_db)):
     try:
-        eligible_scans = db.query(StrokeScan).filter(StrokeScan.eligible == True).all()
+        eligible_scans = scans_with_patients(db, StrokeScan.eligible == True).all()
         return [
             {
                 "scan_id": scan.id,
-                "patient_code": scan.patient.code,
-                "patient_name": scan.patient.name,
-                "patient_age": scan.patient.age,
-                "patient_gender": scan.patient.gender,
-                "chief_complaint": scan.patient.chief_complaint,
+                **patient_columns(scan.patient),
                 "diagnosis": scan.prediction or "N/A",
                 "eligibility_result": scan.eligibility_result or "Eligible for tPA",
                 "upload_date": scan.timestamp.strftime("%Y-%m-%d %H:%M") if scan.timestamp else "N/A",
@@ -633,18 +730,14 @@ def get_eligible_scans_detail(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching eligible scans: {str(e)}")
 
-@router.get("/dashboard-details/not-eligible")
-def get_not_eligible_scans_detail(db: Session = Depends(get_db)):
+@router.get("/dashboard-details/not-eligible", dependencies=[Depends(require_staff)])
+def get_not_eligible_scans_detail(db: Session = Depends(get_read_db)):
     try:
-        not_eligible_scans = db.query(StrokeScan).filter(StrokeScan.eligible == False).all()
+        not_eligible_scans = scans_with_patients(db, StrokeScan.eligible == False).all()
         return [
             {
                 "scan_id": scan.id,
-                "patient_code": scan.patient.code,
-                "patient_name": scan.patient.name,
-                "patient_age": scan.patient.age,
-                "patient_gender": scan.patient.gender,
-                "chief_complaint": scan.patient.chief_complaint,
+                **patient_columns(scan.patient),
                 "diagnosis": scan.prediction or "N/A",
                 "eligibility_result": scan.eligibility_result or "Not Eligible",
                 "upload_date": scan.timestamp.strftime("%Y-%m-%d %H:%M") if scan.timestamp else "N/A",
@@ -655,18 +748,14 @@ def get_not_eligible_scans_detail(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching not eligible scans: {str(e)}")
 
-@router.get("/dashboard-details/sent-to-doctor")
-def get_sent_to_doctor_scans_detail(db: Session = Depends(get_db)):
+@router.get("/dashboard-details/sent-to-doctor", dependencies=[Depends(require_staff)])
+def get_sent_to_doctor_scans_detail(db: Session = Depends(get_read_db)):
     try:
-        sent_to_doctor_scans = db.query(StrokeScan).filter(StrokeScan.status == "ready_for_review").all()
+        sent_to_doctor_scans = scans_with_patients(db, StrokeScan.status == "ready_for_review").all()
         return [
             {
                 "scan_id": scan.id,
-                "patient_code": scan.patient.code,
-                "patient_name": scan.patient.name,
-                "patient_age": scan.patient.age,
-                "patient_gender": scan.patient.gender,
-                "chief_complaint": scan.patient.chief_complaint,
+                **patient_columns(scan.patient),
                 "diagnosis": scan.prediction or "N/A",
                 "eligibility_result": scan.eligibility_result or "Sent for Review",
                 "upload_date": scan.timestamp.strftime("%Y-%m-%d %H:%M") if scan.timestamp else "N/A",
@@ -680,10 +769,10 @@ def get_sent_to_doctor_scans_detail(db: Session = Depends(get_db)):
 
 # Treatment Plan API Endpoints
 
-@router.post("/api/treatment-plan/generate")
+@router.post("/api/treatment-plan/generate", dependencies=[Depends(require_staff)])
 async def generate_treatment_plan(
     request: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Generate a treatment plan using ChatGPT for a specific patient and scan.
@@ -692,17 +781,18 @@ async def generate_treatment_plan(
         patient_code = request.get("patient_code")
         scan_id = request.get("scan_id")
         physician_username = request.get("physician_username", "Unknown")
+        bypass_cache = bypass_cache_requested(request)
         
         if not patient_code or not scan_id:
             raise HTTPException(status_code=400, detail="Patient code and scan ID are required")
         
         # Get patient data
-        patient = db.query(Patient).filter(Patient.code == patient_code).first()
+        patient = (await db.execute(select(Patient).where(Patient.code == patient_code))).scalars().first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
         # Get scan data
-        scan = db.query(StrokeScan).filter(StrokeScan.id == scan_id).first()
+        scan = (await db.execute(select(StrokeScan).where(StrokeScan.id == scan_id))).scalars().first()
         if not scan:
             raise HTTPException(status_code=404, detail="Scan not found")
         
@@ -731,8 +821,10 @@ async def generate_treatment_plan(
         }
         
         # Generate treatment plan using ChatGPT
-        ai_generated_plan = get_chatgpt_service().generate_treatment_plan(
-            patient_data, scan_data, scan.eligibility_result, scan.eligible
+        # (the same inputs reuse the cached plan; "bypass_cache": true asks the model again)
+        ai_generated_plan = await get_chatgpt_service().generate_treatment_plan(
+            patient_data, scan_data, scan.eligibility_result, scan.eligible,
+            bypass_cache=bypass_cache
         )
         
         # Determine plan type
@@ -751,8 +843,8 @@ async def generate_treatment_plan(
         )
         
         db.add(treatment_plan)
-        db.commit()
-        db.refresh(treatment_plan)
+        await db.commit()
+        await db.refresh(treatment_plan)
         
         return {
             "message": "Treatment plan generated successfully",
@@ -765,10 +857,16 @@ async def generate_treatment_plan(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to generate treatment plan: {str(e)}")
 
-@router.get("/api/treatment-plan/{treatment_plan_id}")
+# Hit/miss metrics of the generated-plan cache (see llm_cache.py);
+# declared before /api/treatment-plan/{treatment_plan_id}, which would otherwise match it
+@router.get("/api/treatment-plan/cache", dependencies=[Depends(require_staff)])
+def get_treatment_plan_cache_stats():
+    return llm_response_cache.stats()
+
+@router.get("/api/treatment-plan/{treatment_plan_id}", dependencies=[Depends(require_staff)])
 def get_treatment_plan(treatment_plan_id: int, db: Session = Depends(get_db)):
     """
     Get a specific treatment plan by ID.
@@ -797,7 +895,7 @@ def get_treatment_plan(treatment_plan_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get treatment plan: {str(e)}")
 
-@router.put("/api/treatment-plan/{treatment_plan_id}")
+@router.put("/api/treatment-plan/{treatment_plan_id}", dependencies=[Depends(require_staff)])
 def update_treatment_plan(
     treatment_plan_id: int,
     request: dict,
@@ -834,7 +932,7 @@ def update_treatment_plan(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to update treatment plan: {str(e)}")
 
-@router.post("/api/treatment-plan/{treatment_plan_id}/refine")
+@router.post("/api/treatment-plan/{treatment_plan_id}/refine", dependencies=[Depends(require_staff)])
 async def refine_treatment_plan(
     treatment_plan_id: int,
     request: dict,
@@ -853,7 +951,7 @@ async def refine_treatment_plan(
             raise HTTPException(status_code=400, detail="Physician notes are required for refinement")
         
         # Refine the treatment plan using ChatGPT
-        refined_plan = get_chatgpt_service().refine_treatment_plan(
+        refined_plan = await get_chatgpt_service().refine_treatment_plan(
             treatment_plan.ai_generated_plan, physician_notes
         )
         
@@ -876,7 +974,7 @@ async def refine_treatment_plan(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to refine treatment plan: {str(e)}")
 
-@router.get("/api/patients/{patient_code}/treatment-plans")
+@router.get("/api/patients/{patient_code}/treatment-plans", dependencies=[Depends(require_patient_access)])
 def get_patient_treatment_plans(patient_code: str, db: Session = Depends(get_db)):
     """
     Get all treatment plans for a specific patient.
@@ -908,7 +1006,7 @@ def get_patient_treatment_plans(patient_code: str, db: Session = Depends(get_db)
 
 # New OpenAI Chat Completions API Endpoint
 
-@router.post("/api/generate-treatment")
+@router.post("/api/generate-treatment", dependencies=[Depends(require_staff)])
 async def generate_treatment_recommendation(request: dict):
     """
     Generate stroke treatment recommendations using OpenAI Chat Completions API.
@@ -925,10 +1023,9 @@ async def generate_treatment_recommendation(request: dict):
                 status_code=400, 
                 detail=f"Missing required fields: {', '.join(missing_fields)}"
             )
+        bypass_cache = bypass_cache_requested(request)
         
-        # Get OpenAI API key from environment
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        if not openai_api_key or openai_api_key == "your_openai_api_key_here":
+        if not llm_client.is_configured:
             raise HTTPException(
                 status_code=500, 
                 detail="OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
@@ -957,16 +1054,11 @@ Please provide a comprehensive treatment recommendation including:
 Format your response as a structured treatment plan with clear sections.
 """
         
-        # Prepare the request to OpenAI API
-        openai_url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {openai_api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "gpt-4o-mini",
-            "messages": [
+        # Request it through the shared, pooled client (see llm_client.py), or reuse the
+        # answer to the same prompt (see llm_cache.py) unless "bypass_cache" is set
+        treatment_plan, cached = await cached_chat(
+            model="gpt-4o-mini",
+            messages=[
                 {
                     "role": "system",
                     "content": "You are a medical assistant suggesting evidence-based stroke care plans following current stroke management guidelines. Provide a structured treatment recommendation and include tPA or alternative care guidance."
@@ -976,57 +1068,25 @@ Format your response as a structured treatment plan with clear sections.
                     "content": prompt
                 }
             ],
-            "max_tokens": 1500,
-            "temperature": 0.3
-        }
-        
-        # Make request to OpenAI API
-        response = requests.post(openai_url, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code != 200:
-            error_detail = "OpenAI API request failed"
-            try:
-                error_data = response.json()
-                error_detail = error_data.get("error", {}).get("message", error_detail)
-            except:
-                pass
-            
-            raise HTTPException(
-                status_code=502,
-                detail=f"OpenAI API error: {error_detail}"
-            )
-        
-        # Parse OpenAI response
-        openai_response = response.json()
-        
-        if "choices" not in openai_response or not openai_response["choices"]:
-            raise HTTPException(
-                status_code=502,
-                detail="Invalid response from OpenAI API"
-            )
-        
-        treatment_plan = openai_response["choices"][0]["message"]["content"]
+            max_tokens=1500,
+            temperature=0.3,
+            bypass_cache=bypass_cache,
+            client=llm_client
+        )
         
         # Return the treatment plan
         return {
             "treatment_plan": treatment_plan,
             "model_used": "gpt-4o-mini",
             "patient_name": request["name"],
-            "generated_at": datetime.now().isoformat()
+            "generated_at": datetime.now().isoformat(),
+            "cached": cached
         }
         
     except HTTPException:
         raise
-    except requests.exceptions.Timeout:
-        raise HTTPException(
-            status_code=504,
-            detail="Request to OpenAI API timed out"
-        )
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Network error communicating with OpenAI API: {str(e)}"
-        )
+    except LLMError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -0,0 +1,56 @@
+// Cursor pagination for the list endpoints (see backend/pagination.py): a list returns up to
+// `limit` rows and, when there are more, the cursor for the next page in the X-Next-Cursor header.
+const PAGE_SIZE = 100;
+
+// Fetch one page of `url`, starting after `cursor` (the first page when it is null)
+async function fetchPage(url, cursor = null, limit = PAGE_SIZE) {
+  const separator = url.includes("?") ? "&" : "?";
+  const after = cursor ? `&after=${encodeURIComponent(cursor)}` : "";
+  const response = await fetch(`${url}${separator}limit=${limit}${after}`);
+  if (!response.ok) {
+    return { response, rows: [], cursor: null };
+  }
+  return { response, rows: await response.json(), cursor: response.headers.get("X-Next-Cursor") };
+}
+
+// The "Load more" button placed right after `anchor`, created the first time it is needed
+function loadMoreButton(anchor) {
+  let button = anchor.nextElementSibling;
+  if (!button || !button.classList.contains("load-more-btn")) {
+    button = document.createElement("button");
+    button.type = "button";
+    button.className = "load-more-btn";
+    button.textContent = "Load more";
+    button.style.cssText = "display: block; margin: 15px auto; background-color: #FDB927; color: #000; " +
+      "padding: 8px 16px; border: none; border-radius: 4px; cursor: pointer; font-weight: bold;";
+    anchor.after(button);
+  }
+  return button;
+}
+
+// Load the first page of `url` and call render(rows) with it. While more pages are available a
+// "Load more" button after `anchor` fetches the next one and calls render again with every row
+// loaded so far. Returns the response and rows of the first page.
+async function loadPaged(url, anchor, render) {
+  const button = loadMoreButton(anchor);
+  button.hidden = true;
+  let rows = [];
+
+  async function loadNext(cursor) {
+    button.disabled = true;
+    const page = await fetchPage(url, cursor);
+    button.disabled = false;
+    if (!page.response.ok) {
+      console.error("Failed to load the next page:", page.response.status);
+      return page;
+    }
+    rows = rows.concat(page.rows);
+    render(rows);
+    button.hidden = !page.cursor;
+    button.onclick = () => loadNext(page.cursor).catch(error => console.error("Error loading the next page:", error));
+    return page;
+  }
+
+  const first = await loadNext(null);
+  return { response: first.response, rows: first.rows };
+}